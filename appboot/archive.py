@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import typing
+from typing import Optional
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    Table,
+    delete,
+    exists,
+    func,
+    insert,
+    select,
+)
+
+from appboot import timezone
+from appboot.db import get_write_engine
+from appboot.exceptions import NotSupportedError
+
+if typing.TYPE_CHECKING:
+    from appboot.models import Model  # noqa
+
+# archive tables are kept out of Base.metadata, create_tables does not create them
+archive_metadata = MetaData()
+
+
+def get_archive_table(model: type[Model]) -> Table:
+    """
+    The <table>_archive table of a soft delete model: the same columns without
+    defaults, foreign keys or indexes, plus archived_at.
+    """
+    table: Table = model.__table__  # type: ignore[assignment]
+    name = f'{table.name}_archive'
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key)
+        for column in table.columns
+    ]
+    columns.append(
+        Column('archived_at', DateTime(timezone=True), server_default=func.now())
+    )
+    return Table(name, archive_metadata, *columns)
+
+
+def _not_referenced(table: Table) -> list[typing.Any]:
+    """A NOT EXISTS clause per foreign key referencing table."""
+    clauses = []
+    for other in table.metadata.tables.values():
+        for constraint in other.foreign_key_constraints:
+            if constraint.referred_table is not table:
+                continue
+            referencing = other.alias() if other is table else other
+            clauses.append(
+                ~exists().where(
+                    *[
+                        referencing.c[element.parent.name] == element.column
+                        for element in constraint.elements
+                    ]
+                )
+            )
+    return clauses
+
+
+async def archive_deleted(
+    model: type[Model],
+    days: int = 30,
+    batch_size: int = 1000,
+    max_batches: Optional[int] = None,
+    pause: float = 0,
+) -> typing.AsyncIterator[int]:
+    """
+    Move rows soft deleted more than days ago into the archive table, yield the
+    number of rows moved by each batch.
+
+    Every batch is one short transaction on the database the model writes to:
+    lock up to batch_size expired ids, copy those rows to the archive and delete
+    them. A batch is either fully moved or not at all, so an interrupted run is
+    resumed by running again.
+    Rows still referenced by a foreign key are kept until the referencing rows are
+    gone, archive the referencing models first.
+    """
+    table: Table = model.__table__  # type: ignore[assignment]
+    if 'deleted_at' not in table.c:
+        raise NotSupportedError(f'Model {model.__name__} is not soft deleted')
+    archive = get_archive_table(model)
+    engine = get_write_engine(model)
+    async with engine.begin() as conn:
+        await conn.run_sync(archive.create, checkfirst=True)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    pk = table.primary_key.columns.values()[0]
+    names = [column.name for column in table.columns]
+    expired_ids = (
+        select(pk)
+        .where(table.c.deleted_at.is_not(None), table.c.deleted_at < cutoff)
+        .where(*_not_referenced(table))
+        .order_by(pk)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        async with engine.begin() as conn:
+            ids = (await conn.execute(expired_ids)).scalars().all()
+            if not ids:
+                return
+            await conn.execute(
+                insert(archive).from_select(
+                    names, select(*table.columns).where(pk.in_(ids))
+                )
+            )
+            await conn.execute(delete(table).where(pk.in_(ids)))
+        batches += 1
+        yield len(ids)
+        if pause:
+            # give way to the application between batches
+            await asyncio.sleep(pause)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import datetime
+import decimal
+import io
+import json
+import typing
+import uuid
+from typing import Any, Callable, Optional
+
+from sqlalchemy import JSON, DateTime, Numeric, Select
+from sqlalchemy.sql.type_api import TypeEngine
+
+from appboot.db import transaction
+from appboot.exceptions import NotSupportedError
+from appboot.models import EnumType, IntEnumType, PydanticType
+from appboot.streaming import ClosingStreamingResponse
+
+if typing.TYPE_CHECKING:
+    from appboot.repository import AsyncQuerySet
+
+if typing.TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+else:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # pragma: no cover
+        pa = None
+        pq = None
+
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+Converter = Optional[Callable[[Any], Any]]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            'pyarrow is required for arrow export, install it with '
+            '`pip install appboot[arrow]`'
+        )
+
+
+def _enum_value(value):
+    return None if value is None else value.value
+
+
+def _dump_json(value):
+    if value is None:
+        return None
+    if hasattr(value, 'model_dump_json'):
+        return value.model_dump_json()
+    if hasattr(value, 'json'):
+        return value.json()
+    return json.dumps(value, default=str)
+
+
+def _arrow_type(sql_type: TypeEngine) -> tuple[Any, Converter]:
+    """Map a sqlalchemy column type to an arrow type and a value converter."""
+    if isinstance(sql_type, IntEnumType):
+        return pa.int64(), _enum_value
+    if isinstance(sql_type, EnumType):
+        return pa.dictionary(pa.int32(), pa.string()), _enum_value
+    if isinstance(sql_type, (PydanticType, JSON)):
+        return pa.string(), _dump_json
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp('us', tz='UTC' if sql_type.timezone else None), None
+    if isinstance(sql_type, Numeric) and sql_type.asdecimal:
+        if sql_type.precision is not None:
+            return pa.decimal128(sql_type.precision, sql_type.scale or 0), None
+        return pa.string(), lambda v: None if v is None else str(v)
+    try:
+        python_type = sql_type.python_type
+    except NotImplementedError:
+        return pa.string(), lambda v: None if v is None else str(v)
+    if python_type is bool:
+        return pa.bool_(), None
+    if python_type is int:
+        return pa.int64(), None
+    if python_type is float:
+        return pa.float64(), None
+    if python_type is bytes:
+        return pa.binary(), None
+    if python_type is datetime.date:
+        return pa.date32(), None
+    if python_type is datetime.time:
+        return pa.time64('us'), None
+    if python_type is datetime.timedelta:
+        return pa.duration('us'), None
+    if python_type is decimal.Decimal:
+        return pa.string(), lambda v: None if v is None else str(v)
+    if python_type is uuid.UUID:
+        return pa.string(), lambda v: None if v is None else str(v)
+    return pa.string(), None
+
+
+class RecordBatchBuilder:
+    """Build arrow record batches column wise from the rows of a select."""
+
+    def __init__(self, columns: typing.Sequence[Any]):
+        _require_pyarrow()
+        fields = []
+        self.converters: list[Converter] = []
+        for column in columns:
+            arrow_type, converter = _arrow_type(column.type)
+            nullable = getattr(column, 'nullable', True)
+            fields.append(pa.field(column.key, arrow_type, nullable=nullable))
+            self.converters.append(converter)
+        self.schema = pa.schema(fields)
+
+    def build(self, rows: typing.Sequence[Any]):
+        columns = list(zip(*rows)) if rows else [()] * len(self.converters)
+        arrays = []
+        for values, converter, field in zip(columns, self.converters, self.schema):
+            if converter is not None:
+                values = [converter(v) for v in values]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def _selected_columns(queryset: AsyncQuerySet) -> list[Any]:
+    statement = queryset._query.statement
+    if not isinstance(statement, Select):
+        raise NotSupportedError('Only select queries can be exported to arrow')
+    return list(statement.selected_columns)
+
+
+def _rows_queryset(queryset: AsyncQuerySet) -> AsyncQuerySet:
+    row_mode = queryset._query._row_mode
+    if row_mode is None:
+        queryset._query = queryset._query.with_row_mode('rows')
+    elif row_mode != 'rows':
+        columns = _selected_columns(queryset)
+        queryset._query = queryset._query.with_row_mode('rows', *columns)
+    return queryset
+
+
+async def record_batches(
+    queryset: AsyncQuerySet, chunk_size: int = 10000, session=None
+) -> typing.AsyncGenerator[Any, None]:
+    queryset = _rows_queryset(queryset)
+    builder = RecordBatchBuilder(_selected_columns(queryset))
+    chunks = queryset.stream(chunk_size, session=session)
+    try:
+        async for chunk in chunks:
+            yield builder.build(chunk)
+    finally:
+        await chunks.aclose()
+
+
+def arrow_schema(queryset: AsyncQuerySet):
+    queryset = _rows_queryset(queryset)
+    return RecordBatchBuilder(_selected_columns(queryset)).schema
+
+
+async def write_parquet(
+    queryset: AsyncQuerySet, path: str, chunk_size: int = 10000, **kwargs
+) -> int:
+    """Write the queryset into a parquet file batch by batch, return the row count."""
+    _require_pyarrow()
+    count = 0
+    with pq.ParquetWriter(path, arrow_schema(queryset), **kwargs) as writer:
+        async for batch in record_batches(queryset, chunk_size):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+class ArrowStreamResponse(ClosingStreamingResponse):
+    """Stream a queryset in the arrow ipc streaming format."""
+
+    def __init__(
+        self,
+        queryset: AsyncQuerySet,
+        chunk_size: int = 10000,
+        status_code: int = 200,
+        headers: Optional[typing.Mapping[str, str]] = None,
+    ):
+        _require_pyarrow()
+        self.queryset = _rows_queryset(queryset)
+        self.chunk_size = chunk_size
+        super().__init__(
+            self.iter_ipc_stream(),
+            status_code=status_code,
+            headers=headers,
+            media_type=ARROW_STREAM_MEDIA_TYPE,
+        )
+
+    async def iter_ipc_stream(self) -> typing.AsyncGenerator[bytes, None]:
+        sink = io.BytesIO()
+
+        def drain() -> bytes:
+            data = sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+            return data
+
+        writer = pa.ipc.new_stream(sink, arrow_schema(self.queryset))
+        yield drain()
+        # runs after the endpoint returned, so it needs a session of its own
+        async with transaction() as session:
+            batches = record_batches(self.queryset, self.chunk_size, session)
+            try:
+                async for batch in batches:
+                    writer.write_batch(batch)
+                    yield drain()
+            finally:
+                await batches.aclose()
+        writer.close()
+        yield drain()
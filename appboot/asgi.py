@@ -4,10 +4,17 @@ from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from appboot.batch import fastapi_register_batch
+from appboot.channels import fastapi_register_channels
 from appboot.conf import settings
+from appboot.counters import fastapi_register_counters
 from appboot.db import transaction
 from appboot.exceptions import Error
+from appboot.limiter import ConcurrencyLimitMiddleware, limit_route
+from appboot.metrics import fastapi_register_metrics
+from appboot.profiling import ProfilingMiddleware
 from appboot.response import APIResponse
+from appboot.singleflight import fastapi_register_coalescing
 
 
 class ExceptionHandler:
@@ -46,7 +53,11 @@ async def get_session():
 def get_fastapi_application():
     kw = dict(title=settings.PROJECT_NAME)
     kw.update(settings.FASTAPI)
-    kw.update(dependencies=[Depends(get_session)])
+    dependencies = [Depends(get_session)]
+    if settings.CONCURRENCY_LIMIT:
+        # shed requests before they open a session
+        dependencies.insert(0, Depends(limit_route))
+    kw.update(dependencies=dependencies)
     app = FastAPI(**kw)
     app.add_middleware(
         CORSMiddleware,  # type: ignore[unused-ignore]
@@ -54,7 +65,31 @@ def get_fastapi_application():
         allow_methods=settings.ALLOW_METHODS,
         allow_headers=settings.ALLOW_HEADERS,
     )
+    if settings.PROFILING or settings.PROFILING_SECRET:
+        app.add_middleware(
+            ProfilingMiddleware,
+            enabled=settings.PROFILING,
+            secret=settings.PROFILING_SECRET,
+            output_dir=settings.PROFILING_DIR,
+        )
+    if settings.CONCURRENCY_LIMIT:
+        app.add_middleware(
+            ConcurrencyLimitMiddleware,
+            limit=settings.CONCURRENCY_LIMIT,
+            route_limit=settings.CONCURRENCY_ROUTE_LIMIT,
+            max_queue=settings.CONCURRENCY_MAX_QUEUE,
+            queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT,
+            priority_paths=settings.CONCURRENCY_PRIORITY_PATHS,
+        )
+    if settings.COALESCE_PATHS:
+        fastapi_register_coalescing(app, settings.COALESCE_PATHS)
     fastapi_register_routers(app)
+    fastapi_register_counters(app)
+    fastapi_register_channels(app)
+    if settings.BATCH_URL:
+        fastapi_register_batch(app)
+    if settings.METRICS_URL:
+        fastapi_register_metrics(app, settings.METRICS_URL)
     return app
 
 
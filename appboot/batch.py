@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import typing
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, Request
+from pydantic import Field
+
+from appboot.base import Schema
+from appboot.conf import settings
+from appboot.exceptions import BadRequest
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class SubRequest(Schema):
+    method: str = 'GET'
+    path: str
+    query: dict[str, Any] = Field(default_factory=dict)
+    headers: dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+    @property
+    def read_only(self) -> bool:
+        return self.method.upper() in SAFE_METHODS
+
+
+class SubResponse(Schema):
+    status: int
+    headers: dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+
+class BatchRequest(Schema):
+    requests: list[SubRequest]
+
+
+class BatchResponse(Schema):
+    responses: list[SubResponse]
+
+
+class BatchDispatcher:
+    """
+    Dispatch sub requests in-process against the asgi application.
+
+    By default (max_concurrency 1) read only sub requests run sequentially in the
+    batch request task and join its transaction, so all of them share a single
+    connection checkout. With a higher max_concurrency consecutive reads run
+    concurrently instead, each one in its own task, session and connection: lower
+    latency for slow reads at the cost of a connection per read.
+    Write sub requests are barriers: they run one at a time, in order, each in a
+    task and therefore a transaction of its own, so a failed write never leaves
+    partial changes in the shared one.
+    """
+
+    def __init__(self, request: Request, max_concurrency: int):
+        self.request = request
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    def build_scope(self, sub: SubRequest, body: bytes) -> dict[str, Any]:
+        headers = {
+            k.lower(): v
+            for k, v in self.request.headers.items()
+            if k.lower() not in ('content-length', 'content-type')
+        }
+        headers.update({k.lower(): v for k, v in sub.headers.items()})
+        if body:
+            headers['content-type'] = 'application/json'
+            headers['content-length'] = str(len(body))
+        path, _, query_string = sub.path.partition('?')
+        if sub.query:
+            query = urlencode(sub.query, doseq=True)
+            query_string = f'{query_string}&{query}' if query_string else query
+        scope = dict(self.request.scope)
+        scope.update(
+            method=sub.method.upper(),
+            path=path,
+            raw_path=path.encode(),
+            query_string=query_string.encode(),
+            headers=[
+                (k.encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()
+            ],
+        )
+        for key in list(scope):
+            if key in ('route', 'endpoint', 'path_params') or key.startswith('fastapi'):
+                scope.pop(key)
+        return scope
+
+    async def dispatch(self, sub: SubRequest) -> SubResponse:
+        body = b'' if sub.body is None else json.dumps(sub.body).encode()
+        scope = self.build_scope(sub, body)
+        response: dict[str, Any] = {'status': 500, 'headers': {}, 'body': []}
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {
+                    k.decode('latin-1'): v.decode('latin-1')
+                    for k, v in message.get('headers', [])
+                }
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        try:
+            await self.request.app(scope, receive, send)
+        except Exception as e:
+            return SubResponse(status=500, body={'detail': str(e)})
+        return SubResponse(
+            status=response['status'],
+            headers=response['headers'],
+            body=self.decode_body(response['headers'], b''.join(response['body'])),
+        )
+
+    @staticmethod
+    def decode_body(headers: dict[str, str], content: bytes) -> Any:
+        if not content:
+            return None
+        if headers.get('content-type', '').startswith('application/json'):
+            return json.loads(content)
+        return content.decode(errors='replace')
+
+    async def dispatch_concurrently(self, sub: SubRequest) -> SubResponse:
+        async with self.semaphore:
+            return await self.dispatch(sub)
+
+    async def run(self, requests: typing.Sequence[SubRequest]) -> list[SubResponse]:
+        results: list[SubResponse] = []
+        reads: list[SubRequest] = []
+        for sub in requests:
+            if sub.read_only:
+                reads.append(sub)
+                continue
+            results.extend(await self.run_reads(reads))
+            reads = []
+            results.append(await asyncio.create_task(self.dispatch(sub)))
+        results.extend(await self.run_reads(reads))
+        return results
+
+    async def run_reads(self, reads: list[SubRequest]) -> list[SubResponse]:
+        if self.max_concurrency <= 1:
+            return [await self.dispatch(sub) for sub in reads]
+        return list(
+            await asyncio.gather(*[self.dispatch_concurrently(sub) for sub in reads])
+        )
+
+
+async def batch(request: Request, data: BatchRequest) -> BatchResponse:
+    if len(data.requests) > settings.BATCH_MAX_REQUESTS:
+        raise BadRequest(
+            f'Batch accepts at most {settings.BATCH_MAX_REQUESTS} requests'
+        )
+    for sub in data.requests:
+        if sub.path.partition('?')[0] == request.url.path:
+            raise BadRequest('Nested batch requests are not allowed')
+    dispatcher = BatchDispatcher(request, settings.BATCH_MAX_CONCURRENCY)
+    return BatchResponse(responses=await dispatcher.run(data.requests))
+
+
+def fastapi_register_batch(app: FastAPI, path: Optional[str] = None):
+    app.add_api_route(
+        path or settings.BATCH_URL,
+        batch,
+        methods=['POST'],
+        response_model=BatchResponse,
+        tags=['batch'],
+    )
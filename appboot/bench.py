@@ -0,0 +1,453 @@
+"""
+Benchmark suite of appboot itself.
+
+A small polls like application is served in-process against SQLite and driven
+through a plain ASGI client, see `manage.py bench`. The tables are prefixed with
+appboot_bench_ and kept in their own metadata, so they never collide with the
+models of the project nor get created by create_tables.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+import typing
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from fastapi import APIRouter, Depends, FastAPI
+from sqlalchemy import ForeignKey, MetaData, event
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.pool import StaticPool
+
+from appboot import db, filters, models
+from appboot.limiter import ConcurrencyLimiter, ConcurrencyLimitMiddleware, limit_route
+from appboot.pagination import PaginationResult
+from appboot.params import PaginationQuerySchema, QueryDepends
+from appboot.response import PaginationResponse
+from appboot.schema import ModelSchema
+
+
+class BenchModel(models.Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class BenchQuestion(models.DeletedAtMixin, models.TimestampMixin, BenchModel):
+    __tablename__ = 'appboot_bench_question'
+    question_text: Mapped[str]
+    pub_date: Mapped[datetime]
+    choices: Mapped[list['BenchChoice']] = relationship(back_populates='question')
+
+
+class BenchChoice(BenchModel):
+    __tablename__ = 'appboot_bench_choice'
+    question_id: Mapped[int] = mapped_column(ForeignKey('appboot_bench_question.id'))
+    choice_text: Mapped[str]
+    votes: Mapped[int] = mapped_column(default=0)
+    question: Mapped[BenchQuestion] = relationship(back_populates='choices')
+
+
+class BenchChoiceSchema(ModelSchema):
+    class Meta:
+        model = BenchChoice
+        read_only_fields = ('question_id',)
+
+
+class BenchQuestionSchema(ModelSchema):
+    choices: Optional[list[BenchChoiceSchema]] = None
+
+    class Meta:
+        model = BenchQuestion
+        fields = ('id', 'question_text', 'pub_date')
+
+
+class BenchQuestionBriefSchema(ModelSchema):
+    class Meta:
+        model = BenchQuestion
+        fields = ('id', 'question_text', 'pub_date')
+
+
+class BenchChoiceDetailSchema(ModelSchema):
+    question: Optional[BenchQuestionBriefSchema] = None
+
+    class Meta:
+        model = BenchChoice
+
+
+class BenchQuerySchema(PaginationQuerySchema):
+    question_text: Optional[str] = filters.SearchField(None)
+    ordering: str = filters.OrderingField('id')
+
+
+router = APIRouter()
+
+
+@router.post('/questions/', response_model=BenchQuestionSchema)
+async def create_question(question: BenchQuestionSchema):
+    return await question.create(_load=['choices'])
+
+
+@router.post('/questions/bulk')
+async def bulk_create_questions(questions: list[dict[str, Any]]):
+    return len(await BenchQuestionSchema.bulk_create(questions))
+
+
+@router.get('/questions/', response_model=PaginationResult[BenchQuestionSchema])
+async def query_questions(query: BenchQuerySchema = QueryDepends()):
+    page = await BenchQuestion.objects.paginate(query, schema=BenchQuestionSchema)
+    return PaginationResponse(page, schema=BenchQuestionSchema)
+
+
+@router.get('/questions/{pk}', response_model=BenchQuestionSchema)
+async def get_question(pk: int):
+    return await BenchQuestion.objects.for_schema(BenchQuestionSchema).get(id=pk)
+
+
+@router.put('/questions/{pk}', response_model=BenchQuestionSchema)
+async def update_question(pk: int, question: BenchQuestionSchema):
+    instance = await BenchQuestion.objects.for_schema(BenchQuestionSchema).get(id=pk)
+    return await question.update(instance)
+
+
+@router.delete('/questions/{pk}')
+async def delete_question(pk: int):
+    return await BenchQuestion.objects.filter_by(id=pk).delete()
+
+
+@router.get('/choices/', response_model=PaginationResult[BenchChoiceDetailSchema])
+async def query_choices(query: BenchQuerySchema = QueryDepends()):
+    page = await BenchChoice.objects.paginate(
+        query, must_count=False, schema=BenchChoiceDetailSchema
+    )
+    return PaginationResponse(page, schema=BenchChoiceDetailSchema)
+
+
+@router.get('/hold')
+async def hold_connection(ms: int = 10):
+    """Keep a pooled connection busy for ms, like a slow query would."""
+    await db.ScopedSession().connection()
+    await asyncio.sleep(ms / 1000)
+
+
+def get_bench_application(limiter: Optional[ConcurrencyLimiter] = None) -> FastAPI:
+    from appboot.asgi import get_session
+
+    dependencies = [Depends(get_session)]
+    if limiter is not None:
+        dependencies.insert(0, Depends(limit_route))
+    app = FastAPI(dependencies=dependencies)
+    app.include_router(router)
+    if limiter is not None:
+        app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter)  # type: ignore[arg-type]
+    return app
+
+
+class ASGIClient:
+    """Call an asgi application directly, without any network or http client."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(
+        self, method: str, path: str, body: Any = None
+    ) -> tuple[int, bytes]:
+        content = b'' if body is None else json.dumps(body).encode()
+        path, _, query_string = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'bench'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(content)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('bench', 80),
+        }
+        status = 500
+        chunks: list[bytes] = []
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': content, 'more_body': False}
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return status, b''.join(chunks)
+
+
+RequestFactory = Callable[[int], tuple[str, str, Any]]
+
+
+class Scenario(typing.NamedTuple):
+    name: str
+    make_request: RequestFactory
+
+
+def _question(i: int, choices: int = 3) -> dict[str, Any]:
+    return {
+        'question_text': f'question {i}',
+        'pub_date': '2024-01-01T00:00:00',
+        'choices': [{'choice_text': f'choice {j}'} for j in range(choices)],
+    }
+
+
+def default_scenarios(rows: int) -> list[Scenario]:
+    """rows is the number of seeded questions, ids 1 to rows."""
+    created = rows + 1
+
+    def create(i):
+        return 'POST', '/questions/', _question(i)
+
+    def delete(i):
+        # soft delete the questions inserted by the create scenario
+        return 'DELETE', f'/questions/{created + i}', None
+
+    return [
+        Scenario('create', create),
+        Scenario('retrieve', lambda i: ('GET', f'/questions/{i % rows + 1}', None)),
+        Scenario(
+            'update',
+            lambda i: ('PUT', f'/questions/{i % rows + 1}', _question(i, choices=0)),
+        ),
+        Scenario(
+            'paginate',
+            lambda i: ('GET', f'/questions/?page={i % 5 + 1}&page_size=20', None),
+        ),
+        Scenario(
+            'search',
+            lambda i: ('GET', f'/questions/?question_text={i % 10}&page_size=20', None),
+        ),
+        Scenario('nested', lambda i: ('GET', '/choices/?page_size=50', None)),
+        Scenario(
+            'bulk_create',
+            lambda i: ('POST', '/questions/bulk', [_question(i) for _ in range(100)]),
+        ),
+        Scenario('delete', delete),
+    ]
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextlib.asynccontextmanager
+async def use_database(url: str, **options: Any):
+    """Route every session to a throwaway database for the duration of the run."""
+    saved = db.engine_manager
+    config: dict[str, Any] = {'url': url, **options}
+    if ':memory:' in url:
+        # an in-memory database only lives as long as its single connection
+        config.update(poolclass=StaticPool, connect_args={'check_same_thread': False})
+    db.engine_manager = db.EngineManager({'default': config})
+    try:
+        async with db.engine_manager.default_engine.begin() as conn:
+            await conn.run_sync(BenchModel.metadata.create_all)
+        yield db.engine_manager
+    finally:
+        await db.engine_manager.dispose()
+        db.engine_manager = saved
+
+
+class BenchRunner:
+    def __init__(
+        self,
+        requests: int = 200,
+        warmup: int = 20,
+        rows: int = 200,
+        alloc_requests: int = 20,
+    ):
+        self.requests = requests
+        self.warmup = warmup
+        self.rows = rows
+        self.alloc_requests = alloc_requests
+        self.client = ASGIClient(get_bench_application())
+        self.queries = 0
+
+    def count_query(self, *args):
+        self.queries += 1
+
+    async def seed(self):
+        async with db.transaction():
+            await BenchQuestionSchema.bulk_create(
+                [_question(i) for i in range(self.rows)]
+            )
+
+    async def run_scenario(self, scenario: Scenario) -> dict[str, Any]:
+        index = 0
+        errors = 0
+
+        async def call() -> None:
+            nonlocal index, errors
+            method, path, body = scenario.make_request(index)
+            index += 1
+            status, _ = await self.client.request(method, path, body)
+            if status >= 400:
+                errors += 1
+
+        for _ in range(self.warmup):
+            await call()
+        latencies = []
+        self.queries = 0
+        start = time.perf_counter()
+        for _ in range(self.requests):
+            t = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        queries = self.queries
+        # allocations in a separate pass, tracing slows everything down
+        allocations = []
+        tracemalloc.start()
+        try:
+            for _ in range(self.alloc_requests):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                await call()
+                allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return {
+            'requests': self.requests,
+            'errors': errors,
+            'rps': self.requests / elapsed,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p95_ms': _percentile(latencies, 95) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'queries': queries / self.requests,
+            'alloc_kib': statistics.mean(allocations) / 1024 if allocations else 0,
+        }
+
+    async def run(
+        self, database: str, scenarios: Optional[list[Scenario]] = None
+    ) -> dict[str, dict[str, Any]]:
+        with tempfile.TemporaryDirectory() as tmp:
+            if database == 'memory':
+                url = 'sqlite+aiosqlite:///:memory:'
+            else:
+                url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+            async with use_database(url) as manager:
+                engine = manager.default_engine.sync_engine
+                event.listen(engine, 'before_cursor_execute', self.count_query)
+                await self.seed()
+                results = {}
+                for scenario in scenarios or default_scenarios(self.rows):
+                    key = f'{database}:{scenario.name}'
+                    results[key] = await self.run_scenario(scenario)
+                return results
+
+
+def environment() -> dict[str, str]:
+    from importlib.metadata import PackageNotFoundError, version
+
+    info = {'python': platform.python_version(), 'platform': platform.platform()}
+    for package in ('appboot', 'sqlalchemy', 'pydantic', 'fastapi'):
+        try:
+            info[package] = version(package)
+        except PackageNotFoundError:
+            info[package] = 'unknown'
+    return info
+
+
+def compare(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    threshold: float = 0.1,
+) -> list[str]:
+    """Describe every regression of results against baseline beyond threshold."""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(
+                f"{key}: throughput {result['rps']:.0f} < {base['rps']:.0f} req/s"
+            )
+        if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f"{key}: p95 {result['p95_ms']:.2f} > {base['p95_ms']:.2f} ms"
+            )
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f"{key}: queries {result['queries']:.1f} > {base['queries']:.1f}"
+            )
+    return regressions
+
+
+async def run_overload(
+    limiter: Optional[ConcurrencyLimiter] = None,
+    rate: int = 800,
+    duration: float = 3,
+    hold_ms: int = 10,
+    pool_size: int = 4,
+) -> dict[str, Any]:
+    """
+    Offer rate requests per second for duration seconds, each holding one of
+    pool_size connections for hold_ms, that is about twice what the pool serves.
+    Arrivals do not wait for responses, so without load shedding the backlog on
+    the pool and with it the latency grows for as long as the overload lasts.
+    """
+    client = ASGIClient(get_bench_application(limiter))
+    latencies: list[float] = []
+    statuses: collections.Counter[int] = collections.Counter()
+
+    async def call():
+        t = time.perf_counter()
+        status, _ = await client.request('GET', f'/hold?ms={hold_ms}')
+        statuses[status] += 1
+        if status < 400:
+            latencies.append(time.perf_counter() - t)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'overload.sqlite3')}"
+        async with use_database(url, pool_size=pool_size, max_overflow=0):
+            tasks = []
+            start = time.perf_counter()
+            total = int(rate * duration)
+            for i in range(total):
+                # open loop arrivals on a fixed schedule
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(call()))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    served = len(latencies)
+    return {
+        'offered_rps': rate,
+        'served_rps': served / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000 if served else 0,
+        'p99_ms': _percentile(latencies, 99) * 1000 if served else 0,
+        'max_ms': max(latencies) * 1000 if served else 0,
+        'shed': statuses[503],
+        'errors': sum(n for code, n in statuses.items() if code >= 400) - statuses[503],
+    }
@@ -0,0 +1,408 @@
+"""
+Publish/subscribe channel layer, fanning messages out to WebSocket and server-sent
+events subscribers instead of having clients poll list endpoints.
+
+The in-memory backend delivers within the process. With CHANNEL_URL set to a
+redis:// url messages go through redis pub/sub and reach the subscribers of every
+process. Each subscriber owns a bounded queue, when a slow consumer lets it fill
+up the overflow policy drops the oldest or the newest message or disconnects it.
+
+    broadcast(Message, 'messages', schema=MessageSchema)
+
+    @router.websocket('/ws/messages')
+    async def messages(websocket: WebSocket):
+        await websocket_subscribe(websocket, 'messages')
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import json
+import typing
+from collections import defaultdict
+from typing import Any, Optional
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from starlette.responses import StreamingResponse
+
+from appboot.conf import settings
+from appboot.db import RoutingSession, created_hooks
+from appboot.exceptions import NotSupportedError
+
+if typing.TYPE_CHECKING:
+    from redis import asyncio as aioredis
+
+    from appboot.models import Model  # noqa
+    from appboot.schema import ModelSchema
+else:
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:  # pragma: no cover
+        aioredis = None
+
+Overflow = typing.Literal['drop_oldest', 'drop_newest', 'disconnect']
+_CLOSED = object()
+
+
+class Subscription:
+    """Messages of a channel for one subscriber, iterate it to receive them."""
+
+    def __init__(self, channel: str, maxsize: int, overflow: Overflow):
+        self.channel = channel
+        self.overflow = overflow
+        self.queue: asyncio.Queue[Any] = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, message: Any) -> None:
+        if self.closed:
+            return
+        if self.queue.full():
+            if self.overflow == 'disconnect':
+                self.close()
+                return
+            self.dropped += 1
+            if self.overflow == 'drop_newest':
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # pending messages are discarded, the reader wakes up on the marker
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        message = await self.queue.get()
+        if message is _CLOSED:
+            raise StopAsyncIteration
+        return message
+
+
+class MemoryBackend:
+    """Deliver messages to the subscribers of this process."""
+
+    def __init__(self):
+        self.subscriptions: defaultdict[str, set[Subscription]] = defaultdict(set)
+
+    async def publish(self, channel: str, message: Any) -> None:
+        self.deliver(channel, message)
+
+    def deliver(self, channel: str, message: Any) -> None:
+        for subscription in list(self.subscriptions.get(channel, ())):
+            subscription.put(message)
+
+    async def subscribe(self, subscription: Subscription) -> None:
+        self.subscriptions[subscription.channel].add(subscription)
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self.subscriptions.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[subscription.channel]
+
+    async def close(self) -> None:
+        for subscribers in list(self.subscriptions.values()):
+            for subscription in list(subscribers):
+                subscription.close()
+        self.subscriptions.clear()
+
+
+class RedisBackend(MemoryBackend):
+    """
+    Relay messages through redis pub/sub, JSON encoded. A process subscribes to a
+    channel in redis once, for its first local subscriber, and fans the messages
+    it reads out locally like the memory backend.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        if aioredis is None:
+            raise NotSupportedError('redis is required by the redis channel backend')
+        self.redis = aioredis.from_url(url)
+        self.pubsub = self.redis.pubsub()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def publish(self, channel: str, message: Any) -> None:
+        await self.redis.publish(channel, json.dumps(message))
+
+    async def subscribe(self, subscription: Subscription) -> None:
+        if subscription.channel not in self.subscriptions:
+            await self.pubsub.subscribe(subscription.channel)
+        await super().subscribe(subscription)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        await super().unsubscribe(subscription)
+        if subscription.channel not in self.subscriptions:
+            await self.pubsub.unsubscribe(subscription.channel)
+
+    async def _read(self) -> None:
+        async for item in self.pubsub.listen():
+            if item['type'] != 'message':
+                continue
+            channel = item['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            self.deliver(channel, json.loads(item['data']))
+
+    async def close(self) -> None:
+        await super().close()
+        if self._reader is not None:
+            self._reader.cancel()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+
+def get_backend(url: str) -> MemoryBackend:
+    if not url or url.startswith('memory:'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise NotSupportedError(f'Unknown channel backend {url}')
+
+
+class ChannelLayer:
+    def __init__(self, backend: Optional[MemoryBackend] = None):
+        self._backend = backend
+
+    @property
+    def backend(self) -> MemoryBackend:
+        if self._backend is None:
+            self._backend = get_backend(settings.CHANNEL_URL)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: MemoryBackend) -> None:
+        # e.g. a memory backend standing in for redis in tests
+        self._backend = backend
+
+    async def publish(self, channel: str, message: Any) -> None:
+        await self.backend.publish(channel, message)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(
+        self,
+        channel: str,
+        maxsize: Optional[int] = None,
+        overflow: Optional[Overflow] = None,
+    ) -> typing.AsyncIterator[Subscription]:
+        subscription = Subscription(
+            channel,
+            maxsize or settings.CHANNEL_QUEUE_SIZE,
+            overflow or settings.CHANNEL_OVERFLOW,
+        )
+        await self.backend.subscribe(subscription)
+        try:
+            yield subscription
+        finally:
+            subscription.close()
+            await self.backend.unsubscribe(subscription)
+
+    async def close(self) -> None:
+        if self._backend is not None:
+            await self._backend.close()
+
+
+channel_layer = ChannelLayer()
+
+
+class Broadcast(typing.NamedTuple):
+    channel: str
+    schema: Optional[type[ModelSchema]]
+
+
+_broadcasts: dict[type[Any], Broadcast] = {}
+
+
+def broadcast(
+    model: type[Model],
+    channel: Optional[str] = None,
+    schema: Optional[type[ModelSchema]] = None,
+) -> None:
+    """
+    Publish the rows of model inserted by a transaction once it commits, dumped by
+    schema, to channel, by default the table name.
+    """
+    _broadcasts[model] = Broadcast(channel or model.__tablename__, schema)
+    install_session_hooks()
+
+
+@functools.lru_cache()
+def install_session_hooks() -> None:
+    """
+    Collect the rows created by sessions and publish them after commit, installed
+    by the first broadcast so applications without broadcasts pay nothing.
+    """
+    created_hooks.append(_collect_created)
+    event.listen(RoutingSession, 'before_commit', _dump_broadcast)
+    event.listen(RoutingSession, 'after_commit', _publish_broadcast)
+    event.listen(RoutingSession, 'after_soft_rollback', _discard_broadcast)
+
+
+def _collect_created(session, instances: typing.Sequence[Any]) -> None:
+    # kept with the savepoint they were created in, dropped when it rolls back
+    transaction = session.get_nested_transaction()
+    for instance in instances:
+        if type(instance) in _broadcasts:
+            session.info.setdefault('broadcast', []).append((transaction, instance))
+
+
+def _dump(instance: Any, schema: Optional[type[ModelSchema]]) -> dict[str, Any]:
+    if schema is not None:
+        return schema.model_validate(instance).model_dump(mode='json')
+    return jsonable_encoder(
+        {
+            key: getattr(instance, key)
+            for key in instance.__mapper__.columns.keys()
+            if key in instance.__dict__
+        }
+    )
+
+
+def _dump_broadcast(session) -> None:
+    if session.get_nested_transaction() is not None:
+        # the release of a savepoint, rows are published by the outer commit
+        return
+    # dumped before the commit while relationships can still be loaded
+    pending = session.info.pop('broadcast', None)
+    if pending:
+        messages = session.info.setdefault('broadcast_messages', [])
+        for _, instance in pending:
+            channel, schema = _broadcasts[type(instance)]
+            messages.append((channel, _dump(instance, schema)))
+
+
+_publishing: set[asyncio.Task] = set()
+
+
+def _publish_broadcast(session) -> None:
+    messages = session.info.pop('broadcast_messages', None)
+    if not messages:
+        return
+    task = asyncio.get_running_loop().create_task(_publish(messages))
+    # keep a reference until the task is done
+    _publishing.add(task)
+    task.add_done_callback(_publishing.discard)
+
+
+async def _publish(messages: list[tuple[str, Any]]) -> None:
+    for channel, message in messages:
+        await channel_layer.publish(channel, message)
+
+
+def _discard_broadcast(session, previous_transaction) -> None:
+    if not session.in_transaction():
+        session.info.pop('broadcast', None)
+        session.info.pop('broadcast_messages', None)
+        return
+    pending = session.info.get('broadcast')
+    if pending:
+        # a savepoint rolled back, with the rows created in it or in its savepoints
+        pending[:] = [
+            (transaction, instance)
+            for transaction, instance in pending
+            if not _within(transaction, previous_transaction)
+        ]
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+async def websocket_subscribe(
+    websocket: WebSocket,
+    channel: str,
+    maxsize: Optional[int] = None,
+    overflow: Optional[Overflow] = None,
+) -> None:
+    """
+    Accept the websocket and send it the messages of channel as JSON until the
+    client goes away, or is disconnected for falling behind.
+    """
+    await websocket.accept()
+
+    async def wait_disconnect():
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+
+    async with channel_layer.subscribe(channel, maxsize, overflow) as subscription:
+        disconnect = asyncio.ensure_future(wait_disconnect())
+        try:
+            while True:
+                receive = asyncio.ensure_future(subscription.__anext__())
+                await asyncio.wait(
+                    (receive, disconnect), return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnect.done():
+                    receive.cancel()
+                    return
+                try:
+                    message = receive.result()
+                except StopAsyncIteration:
+                    # 1013, try again later
+                    await websocket.close(code=1013)
+                    return
+                await websocket.send_json(message)
+        except WebSocketDisconnect:
+            return
+        finally:
+            disconnect.cancel()
+
+
+def event_stream_response(
+    channel: str,
+    maxsize: Optional[int] = None,
+    overflow: Optional[Overflow] = None,
+    ping: float = 15,
+) -> StreamingResponse:
+    """Stream the messages of channel as server-sent events."""
+
+    async def stream():
+        async with channel_layer.subscribe(channel, maxsize, overflow) as subscription:
+            receive = None
+            try:
+                while True:
+                    if receive is None:
+                        receive = asyncio.ensure_future(subscription.__anext__())
+                    done, _ = await asyncio.wait((receive,), timeout=ping)
+                    if not done:
+                        # keeps proxies from closing an idle connection
+                        yield ': ping\n\n'
+                        continue
+                    try:
+                        message = receive.result()
+                    except StopAsyncIteration:
+                        return
+                    receive = None
+                    yield f'data: {json.dumps(message)}\n\n'
+            finally:
+                if receive is not None:
+                    receive.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def fastapi_register_channels(app: FastAPI) -> None:
+    app.router.on_shutdown.append(channel_layer.close)
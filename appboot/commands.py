@@ -1,5 +1,9 @@
+import asyncio
+import importlib
+import json
 import os
 import shutil
+import subprocess
 import sys
 import traceback
 
@@ -9,6 +13,7 @@ from jinja2 import Environment, FileSystemLoader
 
 import appboot
 from appboot.conf import settings
+from appboot.db import Base, engine_manager, transaction
 from appboot.utils import get_random_secret_key, snake_to_pascal
 
 app = typer.Typer()
@@ -129,6 +134,23 @@ def render_templates(
                 os.rename(os.path.join(root, dir_name), os.path.join(root, new_name))
 
 
+def get_models() -> list[type]:
+    # importing the url conf imports the views and therefore every model
+    importlib.import_module(settings.ROOT_URLCONF)
+    return [mapper.class_ for mapper in Base.registry.mappers]
+
+
+def get_model(name: str):
+    """
+    :param name: Question or polls.Question
+    """
+    for model in get_models():
+        app_label = model.__module__.split('.')[0]
+        if name in (model.__name__, f'{app_label}.{model.__name__}'):
+            return model
+    raise typer.BadParameter(f"Model '{name}' doesn't exist.")
+
+
 @app.command()
 def startproject(
     name: str = typer.Argument(..., help='Name of the project.'),
@@ -157,6 +179,106 @@ def runserver(host: str = '127.0.0.1', port: int = 8000, reload: bool = True):
     uvicorn.run(asgi, host=host, port=port, reload=reload)
 
 
+@app.command()
+def serve(
+    host: str = '127.0.0.1',
+    port: int = 8000,
+    workers: int = typer.Option(0, help='Worker processes, 0 for the CPU count'),
+    loop: str = typer.Option('', help='Event loop, uvloop when installed'),
+    http: str = typer.Option('', help='HTTP protocol, httptools when installed'),
+    max_requests: int = typer.Option(0, help='Recycle workers after n requests'),
+    max_requests_jitter: int = 0,
+    graceful_timeout: int = typer.Option(30, help='Seconds to drain on SIGTERM'),
+    backlog: int = 2048,
+    log_level: str = 'info',
+):
+    """
+    Run the application with preloaded, forked uvicorn workers for production.
+    """
+    from appboot.server import PreforkServer, select_http, select_loop
+
+    loop = loop or select_loop()
+    http = http or select_http()
+    typer.echo(f'Using {loop} event loop and {http} protocol')
+    PreforkServer(
+        f'{settings.PROJECT_NAME}.asgi:application',
+        host=host,
+        port=port,
+        workers=workers or None,
+        max_requests=max_requests,
+        max_requests_jitter=max_requests_jitter,
+        graceful_timeout=graceful_timeout,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        log_level=log_level,
+    ).run()
+
+
+IMPORT_TIME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import appboot.schema
+import {module}
+total = time.perf_counter() - start
+print(json.dumps({{'total': total, 'schemas': appboot.schema.schema_build_times}}))
+"""
+
+
+def parse_import_time(stderr: str) -> list[tuple[str, int, int]]:
+    """Parse `python -X importtime` output into (module, self us, cumulative us)."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:') :].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+@app.command()
+def startuptime(
+    module: str = typer.Argument('', help='Module to import, defaults to the asgi'),
+    top: int = 20,
+):
+    """
+    Report where the import time of the application goes.
+    """
+    module = module or f'{settings.PROJECT_NAME}.asgi'
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            IMPORT_TIME_SCRIPT.format(module=module),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        typer.echo(result.stderr)
+        raise typer.Exit(result.returncode)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = parse_import_time(result.stderr)
+    packages: dict[str, int] = {}
+    for name, self_us, _ in modules:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    typer.echo(f"Importing {module} took {report['total'] * 1000:.1f} ms")
+    typer.echo(f'\nTop {top} packages by self import time:')
+    for package, self_us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        typer.echo(f'{self_us / 1000:>10.1f} ms  {package}')
+    typer.echo(f'\nTop {top} modules by cumulative import time:')
+    for name, _, cumulative_us in sorted(modules, key=lambda x: -x[2])[:top]:
+        typer.echo(f'{cumulative_us / 1000:>10.1f} ms  {name}')
+    schemas = sorted(report['schemas'].items(), key=lambda x: -x[1])
+    total = sum(seconds for _, seconds in schemas)
+    typer.echo(f'\n{len(schemas)} model schemas built in {total * 1000:.1f} ms:')
+    for name, seconds in schemas[:top]:
+        typer.echo(f'{seconds * 1000:>10.1f} ms  {name}')
+
+
 @app.command()
 def shell():
     for python_shell in [start_ipython, start_python]:
@@ -164,3 +286,207 @@ def shell():
             return python_shell()
         except ImportError:
             pass
+
+
+@app.command()
+def dumpparquet(
+    model: str = typer.Argument(..., help='Model name, e.g. polls.Question'),
+    output: str = typer.Argument(..., help='Destination parquet file'),
+    chunk_size: int = 10000,
+    compression: str = 'snappy',
+):
+    """
+    Dump a model table into a parquet file.
+    """
+    from appboot.arrow import write_parquet
+
+    model_cls = get_model(model)
+
+    async def dump():
+        try:
+            async with transaction():
+                return await write_parquet(
+                    model_cls.objects, output, chunk_size, compression=compression
+                )
+        finally:
+            await engine_manager.dispose()
+
+    count = asyncio.run(dump())
+    typer.echo(f'Dumped {count} rows of {model} to {output}.')
+
+
+@app.command()
+def dumpdata(
+    models: list[str] = typer.Argument(
+        None, help='Model names, e.g. polls.Question, defaults to every model'
+    ),
+    output: str = typer.Option('-', '--output', '-o', help='File, .gz to compress'),
+    chunk_size: int = typer.Option(1000, help='Rows fetched per server side chunk'),
+):
+    """
+    Dump model tables as NDJSON, one line per row, in dependency order.
+    """
+    from appboot.fixtures import Progress, dump_data, open_fixture
+
+    model_classes = [get_model(name) for name in models] if models else get_models()
+    progress = Progress('Dumped', lambda message: typer.echo(message, err=True))
+
+    async def dump():
+        stream = open_fixture(output, 'w')
+        try:
+            await dump_data(model_classes, stream, chunk_size, progress)
+        finally:
+            if output != '-':
+                stream.close()
+            await engine_manager.dispose()
+
+    asyncio.run(dump())
+    progress.summary()
+
+
+@app.command()
+def loaddata(
+    fixture: str = typer.Argument(..., help='NDJSON fixture file, .gz or - for stdin'),
+    chunk_size: int = typer.Option(1000, help='Rows per multi-row INSERT'),
+    jobs: int = typer.Option(4, help='Tables loaded concurrently per database'),
+):
+    """
+    Load an NDJSON fixture written by dumpdata.
+    """
+    from appboot.fixtures import Progress, load_data, open_fixture
+
+    model_classes = get_models()
+    progress = Progress('Loaded', lambda message: typer.echo(message, err=True))
+
+    async def load():
+        stream = open_fixture(fixture)
+        try:
+            await load_data(stream, model_classes, chunk_size, jobs, progress)
+        finally:
+            if fixture != '-':
+                stream.close()
+            await engine_manager.dispose()
+
+    try:
+        asyncio.run(load())
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+    progress.summary()
+
+
+@app.command('archive_deleted')
+def archive_deleted(
+    models: list[str] = typer.Argument(
+        None, help='Model names, defaults to every soft delete model'
+    ),
+    days: int = typer.Option(30, help='Archive rows deleted more than days ago'),
+    batch_size: int = 1000,
+    max_batches: int = typer.Option(0, help='Stop after n batches, 0 for no limit'),
+    pause: float = typer.Option(0.0, help='Seconds to sleep between batches'),
+):
+    """
+    Move soft deleted rows into <table>_archive tables in small batches.
+    """
+    from appboot.archive import archive_deleted as archive
+    from appboot.models import DeletedAtMixin
+
+    if models:
+        model_classes = [get_model(name) for name in models]
+    else:
+        model_classes = [m for m in get_models() if issubclass(m, DeletedAtMixin)]
+
+    async def run():
+        try:
+            for model in model_classes:
+                total = 0
+                async for count in archive(
+                    model, days, batch_size, max_batches or None, pause
+                ):
+                    total += count
+                    typer.echo(f'{model.__name__}: archived {total} rows')
+                typer.echo(f'{model.__name__}: done, {total} rows archived.')
+        finally:
+            await engine_manager.dispose()
+
+    asyncio.run(run())
+
+
+@app.command()
+def bench(
+    database: list[str] = typer.Option(
+        ['memory', 'file'], help='SQLite database to run against, memory or file'
+    ),
+    requests: int = typer.Option(200, help='Measured requests per scenario'),
+    warmup: int = 20,
+    rows: int = typer.Option(200, help='Questions seeded before the run'),
+    save: str = typer.Option('', help='Write the results to this json baseline'),
+    compare: str = typer.Option('', help='Compare with this json baseline'),
+    threshold: float = typer.Option(0.1, help='Tolerated relative regression'),
+    overload: bool = typer.Option(
+        False, help='Simulate an overload with and without the concurrency limiter'
+    ),
+):
+    """
+    Benchmark appboot request handling in-process against SQLite.
+    """
+    from appboot import bench as suite
+
+    if overload:
+        return bench_overload()
+
+    async def run():
+        results = {}
+        for name in database:
+            runner = suite.BenchRunner(requests, warmup, rows)
+            results.update(await runner.run(name))
+        return results
+
+    results = asyncio.run(run())
+    typer.echo(
+        f"{'scenario':<22}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'queries':>9}{'KiB':>9}{'errors':>8}"
+    )
+    for key, r in results.items():
+        typer.echo(
+            f"{key:<22}{r['rps']:>9.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+            f"{r['p99_ms']:>9.2f}{r['queries']:>9.1f}{r['alloc_kib']:>9.0f}"
+            f"{r['errors']:>8}"
+        )
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'environment': suite.environment(), 'results': results}, f)
+        typer.echo(f'Baseline saved to {save}.')
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)['results']
+        regressions = suite.compare(results, baseline, threshold)
+        for regression in regressions:
+            typer.echo(f'REGRESSION {regression}')
+        if regressions:
+            raise typer.Exit(1)
+        typer.echo(f'No regression beyond {threshold:.0%} against {compare}.')
+
+
+def bench_overload():
+    from appboot import bench as suite
+    from appboot.limiter import ConcurrencyLimiter
+
+    async def run():
+        return {
+            'unlimited': await suite.run_overload(),
+            'adaptive': await suite.run_overload(
+                ConcurrencyLimiter(limit=8, max_queue=50, queue_timeout=0.5)
+            ),
+        }
+
+    results = asyncio.run(run())
+    typer.echo(
+        f"{'limiter':<12}{'offered':>9}{'served':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'max ms':>9}{'shed':>7}{'errors':>8}"
+    )
+    for name, r in results.items():
+        typer.echo(
+            f"{name:<12}{r['offered_rps']:>9.0f}{r['served_rps']:>9.0f}"
+            f"{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}"
+            f"{r['shed']:>7}{r['errors']:>8}"
+        )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import datetime
+import hashlib
+import typing
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import func, inspect
+
+from appboot.exceptions import NotSupportedError
+from appboot.repository import AsyncQuerySet
+
+
+class NotModified(HTTPException):
+    def __init__(self, headers: Optional[dict[str, str]] = None):
+        super().__init__(status_code=304, headers=headers)
+
+
+def _as_utc(dt: datetime.datetime) -> datetime.datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+
+class Fingerprint(typing.NamedTuple):
+    last_modified: Optional[datetime.datetime]
+    row_count: int
+    etag: str
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {'ETag': self.etag}
+        if self.last_modified is not None:
+            headers['Last-Modified'] = format_datetime(
+                _as_utc(self.last_modified).replace(microsecond=0), usegmt=True
+            )
+        return headers
+
+    def match(self, request: Request) -> bool:
+        """Evaluate If-None-Match, or If-Modified-Since when it is absent."""
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            etags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in etags or self.etag in etags
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            last_modified = _as_utc(self.last_modified).replace(microsecond=0)
+            return last_modified <= _as_utc(since)
+        return False
+
+
+async def _get_version(
+    queryset: AsyncQuerySet,
+) -> tuple[Optional[datetime.datetime], int]:
+    model = queryset.model
+    if not hasattr(model, 'updated_at'):
+        raise NotSupportedError(f'Model {model.__name__} has no updated_at column')
+    last_modified, row_count = await queryset.aggregate(
+        func.max(model.updated_at), func.count()
+    )
+    return last_modified, row_count
+
+
+def _related_queryset(queryset: AsyncQuerySet, key: str) -> AsyncQuerySet:
+    """Rows of the relationship key of the rows matched by queryset."""
+    model = queryset.model
+    rel = inspect(model).relationships.get(key)
+    if rel is None or rel.secondary is not None or len(rel.local_remote_pairs) != 1:
+        raise NotSupportedError(
+            f'Relationship {model.__name__}.{key} can not be fingerprinted'
+        )
+    [(local, remote)] = rel.local_remote_pairs
+    related = rel.mapper.class_
+    related_queryset = getattr(related, 'query_set_class', AsyncQuerySet)(
+        related, queryset.session
+    )
+    if queryset._database is not None:
+        related_queryset.using(queryset._database)
+    keys = queryset._query.aggregate_query(local).statement
+    return related_queryset.filter(remote.in_(keys))
+
+
+def _format_version(last_modified: typing.Any) -> str:
+    if isinstance(last_modified, datetime.datetime):
+        return _as_utc(last_modified).isoformat()
+    return str(last_modified)
+
+
+async def get_fingerprint(
+    queryset: AsyncQuerySet, key: str = '', related: typing.Sequence[str] = ()
+) -> Fingerprint:
+    """
+    Fingerprint the filtered rows with one aggregate query, max(updated_at) and
+    count, without loading them. key tells apart representations of the same rows,
+    e.g. the url with its pagination query. related names the relationships
+    serialized with the rows, their rows are fingerprinted with a query each.
+    """
+    last_modified, row_count = await _get_version(queryset)
+    parts = [key, _format_version(last_modified), str(row_count)]
+    for name in related:
+        related_modified, related_count = await _get_version(
+            _related_queryset(queryset, name)
+        )
+        parts += [name, _format_version(related_modified), str(related_count)]
+        if related_modified is not None and (
+            last_modified is None or _as_utc(related_modified) > _as_utc(last_modified)
+        ):
+            last_modified = related_modified
+    digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return Fingerprint(last_modified, row_count, f'W/"{digest}"')
+
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    queryset: AsyncQuerySet,
+    related: typing.Sequence[str] = (),
+) -> Fingerprint:
+    """
+    Raise NotModified (304) when the request validators match the queryset
+    fingerprint, otherwise set ETag and Last-Modified on the response. Pass the
+    nested relationships of the response as related, their models need an
+    updated_at column too, e.g.
+
+    @router.get('/questions/{pk}', response_model=QuestionSchema)
+    async def get_question(pk: int, request: Request, response: Response):
+        questions = Question.objects.filter_by(id=pk)
+        await conditional_get(request, response, questions, related=['choices'])
+        return await Question.objects.for_schema(QuestionSchema).get(id=pk)
+    """
+    fingerprint = await get_fingerprint(queryset, key=str(request.url), related=related)
+    if fingerprint.match(request):
+        raise NotModified(headers=fingerprint.headers)
+    response.headers.update(fingerprint.headers)
+    return fingerprint
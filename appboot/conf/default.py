@@ -16,9 +16,28 @@ class DefaultSettings(BaseSettings):
     USE_TZ: bool = True
     TIME_ZONE: str = 'Asia/Shanghai'
     DATABASES: DataBases = DataBases(default=dict(url='sqlite+aiosqlite:///:memory:'))
+    DATABASE_ROUTERS: list[str] = []
     FASTAPI: DictConfig = Field(default_factory=dict, title='fastapi app init param')
     ALLOWED_HOSTS: list[str] = ['*']
     ALLOW_METHODS: list[str] = ['*']
     ALLOW_HEADERS: list[str] = ['*']
     ROOT_URLCONF: str = ''
     MODEL_TABLENAME_PREFIX: str = ''
+    BATCH_URL: str = ''
+    BATCH_MAX_REQUESTS: int = 20
+    BATCH_MAX_CONCURRENCY: int = 1
+    METRICS_URL: str = ''
+    COUNTER_FLUSH_INTERVAL: float = 1.0
+    COUNTER_MAX_PENDING: int = 1000
+    CONCURRENCY_LIMIT: int = 0
+    CONCURRENCY_ROUTE_LIMIT: int = 0
+    CONCURRENCY_MAX_QUEUE: int = 100
+    CONCURRENCY_QUEUE_TIMEOUT: float = 1.0
+    CONCURRENCY_PRIORITY_PATHS: list[str] = ['/health', '/admin']
+    COALESCE_PATHS: list[str] = []
+    CHANNEL_URL: str = ''
+    CHANNEL_QUEUE_SIZE: int = 100
+    CHANNEL_OVERFLOW: str = 'drop_oldest'
+    PROFILING: bool = False
+    PROFILING_SECRET: str = ''
+    PROFILING_DIR: str = 'profiles'
@@ -0,0 +1,215 @@
+"""
+Write-behind counters for hot rows.
+
+Increments of Model.objects.buffered_increment are summed in process memory per
+(model, pk, field) and written by a background task with one UPDATE per model,
+`SET votes = votes + CASE id WHEN .. THEN .. ELSE 0 END`, every flush interval or
+as soon as max_pending rows are waiting. Buffered increments are lost when the
+process dies before a flush, the application flushes them on shutdown.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import typing
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import Integer, Numeric, case, update
+from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
+
+from appboot.conf import settings
+from appboot.db import get_write_engine
+from appboot.repository import get_construction_plan
+
+if typing.TYPE_CHECKING:
+    from appboot.models import Model  # noqa
+
+logger = logging.getLogger('appboot')
+
+Deltas = dict[Any, dict[str, int]]
+# errors a retry of the same statement would raise again
+PERMANENT_ERRORS = (DataError, IntegrityError, ProgrammingError)
+
+
+@lru_cache()
+def get_counter_fields(model: type[Model]) -> frozenset[str]:
+    """Integer and numeric columns of a model which are neither keys nor version."""
+    plan = get_construction_plan(model)
+    return frozenset(
+        column.key
+        for column in model.__mapper__.column_attrs
+        if column.key not in plan.primary_keys
+        and column.key != plan.version_key
+        and not column.columns[0].foreign_keys
+        and isinstance(column.columns[0].type, (Integer, Numeric))
+    )
+
+
+class CounterBuffer:
+    def __init__(
+        self,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        chunk_size: int = 500,
+    ):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self.chunk_size = chunk_size
+        self.pending: defaultdict[type[Model], Deltas] = defaultdict(dict)
+        # deltas taken by a running flush, still merged by reads until committed
+        self.flushing: defaultdict[type[Model], Deltas] = defaultdict(dict)
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is None:
+            return settings.COUNTER_FLUSH_INTERVAL
+        return self._flush_interval
+
+    @property
+    def max_pending(self) -> int:
+        if self._max_pending is None:
+            return settings.COUNTER_MAX_PENDING
+        return self._max_pending
+
+    def __len__(self) -> int:
+        return sum(len(deltas) for deltas in self.pending.values())
+
+    def add(self, model: type[Model], pk: Any, amounts: dict[str, int]) -> None:
+        fields = get_counter_fields(model)
+        for name in amounts:
+            if name not in fields:
+                raise ValueError(f'Model {model.__name__} has no counter {name}')
+        deltas = self.pending[model].setdefault(pk, {})
+        for name, amount in amounts.items():
+            deltas[name] = deltas.get(name, 0) + amount
+        self._schedule()
+
+    def get(self, model: type[Model], pk: Any) -> dict[str, int]:
+        """Deltas of a row not yet committed to the database."""
+        result: dict[str, int] = {}
+        for buffer in (self.flushing, self.pending):
+            for name, amount in buffer.get(model, {}).get(pk, {}).items():
+                result[name] = result.get(name, 0) + amount
+        return result
+
+    def _schedule(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # outside of an event loop increments wait for an explicit flush
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() != loop:
+            self._task = loop.create_task(self._run())
+        if len(self) >= self.max_pending and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = loop.create_task(self._flush_logged())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_logged()
+            if not self.pending:
+                # restarted by the next increment
+                return
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Failed to flush buffered counters')
+
+    async def flush(self) -> int:
+        """Write the buffered deltas, return the number of rows updated."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            if not self.pending:
+                return 0
+            self.flushing, self.pending = self.pending, defaultdict(dict)
+            rowcount = 0
+            failed: Optional[type[Model]] = None
+            try:
+                by_engine: defaultdict[Any, list[type[Model]]] = defaultdict(list)
+                for model in self.flushing:
+                    by_engine[get_write_engine(model)].append(model)
+                for engine, models in by_engine.items():
+                    async with engine.begin() as conn:
+                        for model in models:
+                            failed = model
+                            deltas = self.flushing[model]
+                            for statement in self.get_statements(model, deltas):
+                                rowcount += (await conn.execute(statement)).rowcount
+                        failed = None
+                    for model in models:
+                        # committed, not merged back should a later database fail
+                        del self.flushing[model]
+            except BaseException as e:
+                if failed is not None and isinstance(e, PERMANENT_ERRORS):
+                    # merged back it would fail every following flush
+                    deltas = self.flushing.pop(failed)
+                    logger.error(
+                        'Dropped buffered counters of %d %s rows: %s',
+                        len(deltas),
+                        failed.__name__,
+                        e,
+                    )
+                # keep the other deltas for the next flush
+                for model, deltas in self.flushing.items():
+                    for pk, amounts in deltas.items():
+                        merged = self.pending[model].setdefault(pk, {})
+                        for name, amount in amounts.items():
+                            merged[name] = merged.get(name, 0) + amount
+                raise
+            finally:
+                self.flushing = defaultdict(dict)
+            return rowcount
+
+    def get_statements(self, model: type[Model], deltas: Deltas):
+        mapper = model.__mapper__
+        pk = mapper.primary_key[0]
+        version_key = get_construction_plan(model).version_key
+        pks = list(deltas)
+        for start in range(0, len(pks), self.chunk_size):
+            chunk = pks[start : start + self.chunk_size]
+            names = {name for pk_value in chunk for name in deltas[pk_value]}
+            values = {}
+            for name in sorted(names):
+                column = mapper.columns[name]
+                whens = {
+                    pk_value: deltas[pk_value][name]
+                    for pk_value in chunk
+                    if deltas[pk_value].get(name)
+                }
+                if whens:
+                    values[column] = column + case(whens, value=pk, else_=0)
+            if not values:
+                continue
+            if version_key is not None:
+                # like Model.increment, a counter change is a new version of the row
+                version = mapper.columns[version_key]
+                values[version] = version + 1
+            yield update(pk.table).where(pk.in_(chunk)).values(values)
+
+    async def close(self) -> None:
+        for task in (self._task, self._flush_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._task = self._flush_task = None
+        await self.flush()
+
+
+counter_buffer = CounterBuffer()
+
+
+def fastapi_register_counters(app: FastAPI) -> None:
+    app.router.on_shutdown.append(counter_buffer.close)
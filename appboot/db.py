@@ -2,9 +2,14 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import contextvars
+import importlib
+import os
 import typing
+from collections import defaultdict
 from functools import cached_property
 
+from sqlalchemy import QueuePool, Table
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -13,10 +18,12 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.sql.dml import UpdateBase
 
 from appboot.conf import settings as appboot_settings
 from appboot.conf.default import DataBases
-from appboot.exceptions import DatabaseError
+from appboot.exceptions import Conflict, DatabaseError
 
 
 class EngineManager:
@@ -27,7 +34,7 @@ class EngineManager:
 
     def round_robin(self):
         while 1:
-            yield from self.all()
+            yield from self.replicas()
 
     @cached_property
     def settings(self) -> DataBases:
@@ -46,6 +53,7 @@ class EngineManager:
         if 'url' not in config:
             raise DatabaseError("database config missing 'url' key.")
         url = config.pop('url')
+        config.pop('replica', None)
         config.update(future=True)
         return create_async_engine(url=url, **config)
 
@@ -69,6 +77,57 @@ class EngineManager:
     def all(self):
         return [self[alias] for alias in self]
 
+    def replicas(self):
+        """
+        Engines serving the round-robin reads, every database but those configured
+        with replica False, e.g. a reporting replica or a database of its own tables.
+        """
+        return [
+            self[alias]
+            for alias, config in self.settings.items()
+            if config.get('replica', True)
+        ]
+
+    def connected(self) -> dict[str, AsyncEngine]:
+        """Engines created so far, by alias."""
+        return dict(self._connections)
+
+    def get_alias(self, sync_engine) -> typing.Optional[str]:
+        for alias, engine in self._connections.items():
+            if engine.sync_engine is sync_engine:
+                return alias
+        return None
+
+    def pool_waiters(self) -> int:
+        """
+        Tasks waiting for a pooled connection over all engines, read from the
+        asyncio queue of AsyncAdaptedQueuePool. Where that queue is not available
+        an exhausted QueuePool counts as one waiter, other pools count as zero.
+        """
+        waiters = 0
+        for engine in self._connections.values():
+            pool = engine.sync_engine.pool
+            queue = getattr(getattr(pool, '_pool', None), '_queue', None)
+            getters = getattr(queue, '_getters', None)
+            if getters is not None:
+                waiters += sum(not getter.done() for getter in getters)
+            elif isinstance(pool, QueuePool):
+                max_overflow = getattr(pool, '_max_overflow', 0)
+                exhausted = pool.checkedin() == 0 and pool.overflow() >= max_overflow
+                if max_overflow >= 0 and exhausted:
+                    waiters += 1
+        return waiters
+
+    async def dispose(self):
+        for engine in self._connections.values():
+            await engine.dispose()
+        self._connections.clear()
+
+    def reset_after_fork(self):
+        """Forget pooled connections inherited from the parent process."""
+        for engine in self._connections.values():
+            engine.sync_engine.dispose(close=False)
+
     @property
     def master(self):
         return self.default_engine
@@ -79,14 +138,114 @@ class EngineManager:
 
 
 engine_manager = EngineManager()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=engine_manager.reset_after_fork)
+
+
+CreatedHook = typing.Callable[[Session, typing.Sequence[typing.Any]], None]
+# called with the instances inserted by a flush or a bulk insert with returning
+created_hooks: list[CreatedHook] = []
+
+
+def notify_created(session: Session, instances: typing.Sequence[typing.Any]) -> None:
+    for hook in created_hooks:
+        hook(session, instances)
+
+
+# database alias chosen by AsyncQuerySet.using for the statements it runs
+using_database: contextvars.ContextVar[typing.Optional[str]] = contextvars.ContextVar(
+    'appboot_using_database', default=None
+)
+
+
+class ConnectionRouter:
+    """
+    Database of a model for reads and writes: the first alias returned by the
+    db_for_read or db_for_write methods of the DATABASE_ROUTERS classes, else the
+    database of the model Meta, else None for the default routing.
+
+    class Meta:
+        database = 'hot'
+    """
+
+    def __init__(self, routers: typing.Optional[list[typing.Any]] = None):
+        self._routers = routers
+
+    @cached_property
+    def routers(self) -> list[typing.Any]:
+        if self._routers is not None:
+            return self._routers
+        routers = []
+        for path in appboot_settings.DATABASE_ROUTERS:
+            module_name, _, name = path.rpartition('.')
+            routers.append(getattr(importlib.import_module(module_name), name)())
+        return routers
+
+    def _route(self, method: str, model, hints) -> typing.Optional[str]:
+        if model is None:
+            return None
+        for router in self.routers:
+            route = getattr(router, method, None)
+            alias = route(model, **hints) if route is not None else None
+            if alias is not None:
+                return alias
+        return getattr(getattr(model, 'Meta', None), 'database', None)
+
+    def db_for_read(self, model, **hints) -> typing.Optional[str]:
+        return self._route('db_for_read', model, hints)
+
+    def db_for_write(self, model, **hints) -> typing.Optional[str]:
+        return self._route('db_for_write', model, hints)
+
+
+router = ConnectionRouter()
+
+
+def get_write_engine(model) -> AsyncEngine:
+    """Engine of the database model writes to, for work outside of a session."""
+    alias = router.db_for_write(model)
+    return engine_manager[alias] if alias is not None else engine_manager.master
 
 
 class RoutingSession(Session):
-    def get_bind(self, *args, **kwargs):
-        if self._flushing:
+    def flush(self, objects=None):
+        new = list(self.new) if created_hooks else []
+        try:
+            super().flush(objects)
+        except StaleDataError as e:
+            # a versioned row was changed by someone else since it was loaded
+            raise Conflict(str(e)) from e
+        # a flush of some objects leaves the others pending
+        persisted = [instance for instance in new if instance not in self.new]
+        if persisted:
+            notify_created(self, persisted)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """
+        Bind of a statement: the database of using(), else the one of the model
+        given by the router, else the master for writes and for reads following
+        a write, so the transaction sees its own changes, else a replica. Writes
+        are the flushes and the insert, update and delete statements executed
+        directly, e.g. by AsyncQuerySet.update. The session keeps one connection
+        per database, they commit one after another.
+        """
+        if bind is not None:
+            return bind
+        model = mapper.class_ if mapper is not None else None
+        alias = using_database.get()
+        if self._flushing or isinstance(clause, UpdateBase):
+            # reads after a write must see it, they are never coalesced
+            self.info['writes'] = True
+            alias = alias or router.db_for_write(model, clause=clause)
+            if alias is not None:
+                return engine_manager[alias].sync_engine
+            return engine_manager.master.sync_engine
+        alias = alias or router.db_for_read(model, clause=clause)
+        if alias is not None:
+            return engine_manager[alias].sync_engine
+        if self.info.get('writes'):
             return engine_manager.master.sync_engine
-        else:
-            return engine_manager.slave.sync_engine
+        return engine_manager.slave.sync_engine
 
 
 class RoutingAsyncSession(AsyncSession):
@@ -105,7 +264,21 @@ class Base(DeclarativeBase):
 
 @contextlib.asynccontextmanager
 async def transaction() -> typing.AsyncIterator[AsyncSession]:
+    """
+    Run the block in the session of the current task and commit it, or roll it
+    back on error, then remove the session.
+
+    Reentrant: a transaction() opened inside another one of the same task joins
+    it, the outermost block commits or rolls back everything. Sub requests of a
+    batch, dispatched in the task of the batch request, share its transaction
+    this way instead of committing on their own.
+    """
     session = ScopedSession()
+    if session.info.get('transaction'):
+        # nested in an enclosing transaction of the same scope, let it commit
+        yield session
+        return
+    session.info['transaction'] = True
     try:
         yield session
         await session.commit()
@@ -116,6 +289,54 @@ async def transaction() -> typing.AsyncIterator[AsyncSession]:
         await ScopedSession.remove()
 
 
+T = typing.TypeVar('T')
+
+
+async def retry_on_conflict(
+    operation: typing.Callable[[], typing.Awaitable[T]], attempts: int = 3
+) -> T:
+    """
+    Run operation in a savepoint of the current session and run it again when it
+    raises Conflict. The operation must read the rows it changes: rolling back the
+    savepoint expires them, so every attempt re-applies the change to fresh data.
+
+    async def vote():
+        question = await Question.objects.get(id=pk)
+        question.votes += 1
+        await question.save()
+        return question
+
+    question = await retry_on_conflict(vote)
+    """
+    session = ScopedSession()
+    for attempt in range(1, attempts + 1):
+        try:
+            async with session.begin_nested():
+                result = await operation()
+                # flush inside the savepoint so a stale version shows up here
+                await session.flush()
+            return result
+        except Conflict:
+            if attempt >= attempts:
+                raise
+    raise ValueError('attempts must be positive')
+
+
+def get_tables_by_database() -> dict[str, list[Table]]:
+    """Tables of Base.metadata by the database their model writes to."""
+    databases = {}
+    for mapper in Base.registry.mappers:
+        alias = router.db_for_write(mapper.class_)
+        if alias is not None:
+            for table in mapper.tables:
+                databases[table] = alias
+    tables = defaultdict(list)
+    for table in Base.metadata.sorted_tables:
+        tables[databases.get(table, 'default')].append(table)
+    return tables
+
+
 async def create_tables():
-    async with engine_manager.default_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for alias, tables in get_tables_by_database().items():
+        async with engine_manager[alias].begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import operator
+import typing
+from typing import Any, Callable
+
+from appboot.exceptions import FilterError
+
+__all__ = ('F', 'resolve_expression', 'resolve_values')
+
+
+class Combinable:
+    def _combine(self, other: Any, op: Callable, reverse: bool = False):
+        if reverse:
+            return CombinedExpression(other, op, self)
+        return CombinedExpression(self, op, other)
+
+    def __add__(self, other):
+        return self._combine(other, operator.add)
+
+    def __radd__(self, other):
+        return self._combine(other, operator.add, reverse=True)
+
+    def __sub__(self, other):
+        return self._combine(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._combine(other, operator.sub, reverse=True)
+
+    def __mul__(self, other):
+        return self._combine(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._combine(other, operator.mul, reverse=True)
+
+    def __truediv__(self, other):
+        return self._combine(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._combine(other, operator.truediv, reverse=True)
+
+    def __mod__(self, other):
+        return self._combine(other, operator.mod)
+
+    def resolve(self, model) -> Any:
+        raise NotImplementedError
+
+
+class F(Combinable):
+    """
+    Reference to a model column evaluated by the database, e.g.
+    Choice.objects.filter_by(id=pk).update({'votes': F('votes') + 1})
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def resolve(self, model) -> Any:
+        if not hasattr(model, self.name):
+            raise FilterError(f'Model {model.__name__} has no column {self.name}')
+        return getattr(model, self.name)
+
+    def __repr__(self):
+        return f'F({self.name!r})'
+
+
+class CombinedExpression(Combinable):
+    def __init__(self, lhs: Any, op: Callable, rhs: Any):
+        self.lhs = lhs
+        self.op = op
+        self.rhs = rhs
+
+    def resolve(self, model) -> Any:
+        return self.op(
+            resolve_expression(self.lhs, model), resolve_expression(self.rhs, model)
+        )
+
+
+def resolve_expression(value: Any, model) -> Any:
+    if isinstance(value, Combinable):
+        return value.resolve(model)
+    return value
+
+
+def resolve_values(values: typing.Mapping[Any, Any], model) -> dict[Any, Any]:
+    return {key: resolve_expression(value, model) for key, value in values.items()}
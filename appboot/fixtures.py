@@ -0,0 +1,386 @@
+"""
+Streaming dumpdata and loaddata.
+
+A fixture is NDJSON, one `{"model": "polls.Question", "fields": {...}}` line per
+row, gzip compressed when the file name ends with .gz. Tables are dumped one after
+another in the dependency order of Base.metadata.sorted_tables, each read from
+the database the model writes to through a server side cursor in chunks. Rows are
+read from the tables as they are, soft deleted rows included.
+
+Loading inserts chunks of rows with an executemany of one cached INSERT, sent as
+multi-row statements by the dialects supporting it, in one transaction per run of
+lines of a table, with foreign key checks deferred to the commit where the dialect
+allows. Every run waits for the earlier runs of the tables it depends on, runs of
+independent tables load concurrently over up to jobs connections per database.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import datetime
+import decimal
+import enum
+import gzip
+import json
+import sys
+import time
+import typing
+import uuid
+from typing import IO, Any, Callable, Optional
+
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Interval,
+    LargeBinary,
+    Table,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.sql.type_api import TypeEngine
+
+from appboot.db import Base, get_write_engine
+from appboot.models import EnumType, PydanticType
+
+if typing.TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+    from appboot.models import Model  # noqa
+
+Converter = Optional[Callable[[Any], Any]]
+
+
+def get_label(model: type[Model]) -> str:
+    return f'{model.__module__.split(".")[0]}.{model.__name__}'
+
+
+def sort_models(models: typing.Iterable[type[Model]]) -> list[type[Model]]:
+    """Models in the dependency order of their tables."""
+    order = {table: i for i, table in enumerate(Base.metadata.sorted_tables)}
+    return sorted(
+        models,
+        key=lambda model: order.get(typing.cast(Table, model.__table__), len(order)),
+    )
+
+
+def open_fixture(path: str, mode: str = 'r') -> IO[str]:
+    """Open a fixture file, '-' for stdin or stdout, gzip when it ends with .gz."""
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if path.endswith('.gz'):
+        return typing.cast(IO[str], gzip.open(path, f'{mode}t', encoding='utf-8'))
+    return open(path, mode, encoding='utf-8')
+
+
+def _dump_converter(sql_type: TypeEngine) -> Converter:
+    """Converter of a column value to a JSON value."""
+    if isinstance(sql_type, EnumType):
+        return lambda v: v.value if isinstance(v, enum.Enum) else v
+    if isinstance(sql_type, PydanticType):
+        return lambda v: v if v is None or isinstance(v, dict) else json.loads(v.json())
+    if isinstance(sql_type, LargeBinary):
+        return lambda v: None if v is None else base64.b64encode(v).decode()
+    if isinstance(sql_type, Interval):
+        return lambda v: None if v is None else v.total_seconds()
+    try:
+        python_type = sql_type.python_type
+    except NotImplementedError:
+        return None
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return lambda v: None if v is None else v.isoformat()
+    if python_type in (decimal.Decimal, uuid.UUID):
+        return lambda v: None if v is None else str(v)
+    return None
+
+
+def _load_converter(sql_type: TypeEngine) -> Converter:
+    """Converter of a JSON value back to the value the column type binds."""
+    if isinstance(sql_type, (EnumType, PydanticType)):
+        # both bind their raw value as it is
+        return None
+    if isinstance(sql_type, LargeBinary):
+        return lambda v: None if v is None else base64.b64decode(v)
+    if isinstance(sql_type, Interval):
+        return lambda v: None if v is None else datetime.timedelta(seconds=v)
+    if isinstance(sql_type, DateTime):
+        return lambda v: None if v is None else datetime.datetime.fromisoformat(v)
+    if isinstance(sql_type, Date):
+        return lambda v: None if v is None else datetime.date.fromisoformat(v)
+    try:
+        python_type = sql_type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is datetime.time:
+        return lambda v: None if v is None else datetime.time.fromisoformat(v)
+    if python_type in (decimal.Decimal, uuid.UUID):
+        return lambda v: None if v is None else python_type(v)
+    return None
+
+
+class Fields:
+    """The columns of the table of a model, by attribute name."""
+
+    def __init__(self, model: type[Model]):
+        mapper = model.__mapper__
+        self.table: Table = model.__table__  # type: ignore[assignment]
+        self.names: list[str] = []
+        self.keys: dict[str, str] = {}
+        self.dump_converters: list[Converter] = []
+        self.load_converters: dict[str, Converter] = {}
+        for column in self.table.columns:
+            name = mapper.get_property_by_column(column).key
+            self.names.append(name)
+            self.keys[name] = column.key
+            self.dump_converters.append(_dump_converter(column.type))
+            self.load_converters[name] = _load_converter(column.type)
+
+    def dump(self, row: typing.Sequence[Any]) -> dict[str, Any]:
+        return {
+            name: value if converter is None else converter(value)
+            for name, value, converter in zip(self.names, row, self.dump_converters)
+        }
+
+    def load(self, fields: dict[str, Any]) -> dict[str, Any]:
+        values = {}
+        for name, value in fields.items():
+            try:
+                converter = self.load_converters[name]
+            except KeyError:
+                raise ValueError(f'{self.table.name} has no field {name}') from None
+            values[self.keys[name]] = value if converter is None else converter(value)
+        return values
+
+
+class Progress:
+    """Rows done by model, reported every interval seconds and at the end."""
+
+    def __init__(
+        self, verb: str, echo: Callable[[str], Any] = print, interval: float = 2.0
+    ):
+        self.verb = verb
+        self.echo = echo
+        self.interval = interval
+        self.rows: dict[str, int] = {}
+        self.started = self.reported = time.perf_counter()
+
+    @property
+    def total(self) -> int:
+        return sum(self.rows.values())
+
+    def rate(self, rows: int) -> float:
+        return rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def add(self, label: str, rows: int) -> None:
+        self.rows[label] = self.rows.get(label, 0) + rows
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.echo(
+                f'{self.verb} {self.total} rows, {self.rate(self.total):.0f} rows/s'
+            )
+
+    def summary(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        for label, rows in self.rows.items():
+            self.echo(f'{label}: {rows} rows')
+        self.echo(
+            f'{self.verb} {self.total} rows in {elapsed:.2f}s, '
+            f'{self.rate(self.total):.0f} rows/s'
+        )
+
+
+async def dump_data(
+    models: typing.Iterable[type[Model]],
+    output: IO[str],
+    chunk_size: int = 1000,
+    progress: Optional[Progress] = None,
+) -> int:
+    """Write the rows of models to output as NDJSON, return the number of rows."""
+    total = 0
+    for model in sort_models(models):
+        label = get_label(model)
+        fields = Fields(model)
+        prefix = f'{{"model": {json.dumps(label)}, "fields": '
+        table = fields.table
+        # the table itself, soft deleted rows included
+        statement = select(*table.columns).order_by(*table.primary_key.columns)
+        async with get_write_engine(model).connect() as conn:
+            result = await conn.stream(
+                statement.execution_options(yield_per=chunk_size)
+            )
+            async for chunk in result.partitions():
+                output.write(
+                    ''.join(
+                        f'{prefix}{json.dumps(fields.dump(row), default=str)}}}\n'
+                        for row in chunk
+                    )
+                )
+                total += len(chunk)
+                if progress is not None:
+                    progress.add(label, len(chunk))
+    return total
+
+
+async def _defer_constraints(conn: AsyncConnection) -> Optional[str]:
+    """Defer foreign key checks to the commit, return the statement undoing it."""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        await conn.execute(text('PRAGMA defer_foreign_keys = ON'))
+    elif dialect == 'postgresql':
+        # only constraints declared DEFERRABLE are deferred
+        await conn.execute(text('SET CONSTRAINTS ALL DEFERRED'))
+    elif dialect in ('mysql', 'mariadb'):
+        # mysql can not defer, checks are off for the connection instead
+        await conn.execute(text('SET FOREIGN_KEY_CHECKS = 0'))
+        return 'SET FOREIGN_KEY_CHECKS = 1'
+    return None
+
+
+async def _reset_sequences(conn: AsyncConnection, table: Table) -> None:
+    """Move postgresql serial sequences past the explicit primary keys loaded."""
+    if conn.dialect.name != 'postgresql':
+        return
+    column = table.autoincrement_column
+    if column is None:
+        return
+    preparer = conn.dialect.identifier_preparer
+    await conn.execute(
+        text(
+            f'SELECT setval(pg_get_serial_sequence(:table, :column), '
+            f'coalesce(max({preparer.quote(column.name)}), 0) + 1, false) '
+            f'FROM {preparer.format_table(table)}'
+        ),
+        {'table': table.fullname, 'column': column.name},
+    )
+
+
+_END = object()
+
+
+class Slots:
+    """Concurrent transactions by engine, sqlite has a single writer."""
+
+    def __init__(self, jobs: int):
+        self.jobs = max(jobs, 1)
+        self.semaphores: dict[AsyncEngine, asyncio.Semaphore] = {}
+
+    def get(self, engine: AsyncEngine) -> asyncio.Semaphore:
+        if engine not in self.semaphores:
+            jobs = 1 if engine.dialect.name == 'sqlite' else self.jobs
+            self.semaphores[engine] = asyncio.Semaphore(jobs)
+        return self.semaphores[engine]
+
+
+class Segment:
+    """A run of consecutive fixture lines of one model, loaded in one transaction."""
+
+    def __init__(self, model: type[Model], fields: Fields, waits: list[Segment]):
+        self.model = model
+        self.label = get_label(model)
+        self.fields = fields
+        self.waits = waits
+        self.queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=4)
+        self.task: Optional[asyncio.Task] = None
+
+    async def load(self, slots: Slots, progress: Optional[Progress]):
+        for segment in self.waits:
+            await asyncio.shield(typing.cast(asyncio.Task, segment.task))
+        engine = get_write_engine(self.model)
+        async with slots.get(engine), engine.begin() as conn:
+            undo = await _defer_constraints(conn)
+            statement = insert(self.fields.table)
+            try:
+                while (rows := await self.queue.get()) is not _END:
+                    await conn.execute(statement, rows)
+                    if progress is not None:
+                        progress.add(self.label, len(rows))
+                await _reset_sequences(conn, self.fields.table)
+            finally:
+                if undo is not None:
+                    await conn.execute(text(undo))
+
+
+def _tasks(segments: list[Segment]) -> list[asyncio.Task]:
+    return [segment.task for segment in segments if segment.task is not None]
+
+
+async def load_data(
+    lines: typing.Iterable[str],
+    models: typing.Iterable[type[Model]],
+    chunk_size: int = 1000,
+    jobs: int = 4,
+    progress: Optional[Progress] = None,
+) -> int:
+    """Insert the rows of NDJSON fixture lines, return the number of rows."""
+    by_label = {get_label(model): model for model in models}
+    fields_by_model: dict[type[Model], Fields] = {}
+    segments: list[Segment] = []
+    slots = Slots(jobs)
+    current: Optional[Segment] = None
+    rows: list[dict[str, Any]] = []
+    total = 0
+
+    async def put_rows():
+        nonlocal rows
+        if rows:
+            await put(typing.cast(Segment, current), rows)
+            rows = []
+
+    async def put(segment: Segment, item: Any):
+        # a failed loader no longer drains its queue
+        put = asyncio.ensure_future(segment.queue.put(item))
+        task = typing.cast(asyncio.Task, segment.task)
+        await asyncio.wait((put, task), return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            task.result()
+
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                label, values = record['model'], record['fields']
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f'Invalid fixture line {number}: {e}') from None
+            if current is None or current.label != label:
+                await put_rows()
+                if current is not None:
+                    await put(current, _END)
+                if label not in by_label:
+                    raise ValueError(f"Model '{label}' doesn't exist.")
+                model = by_label[label]
+                fields = fields_by_model.get(model)
+                if fields is None:
+                    fields = fields_by_model[model] = Fields(model)
+                table = fields.table
+                waits = [
+                    segment
+                    for segment in segments
+                    if segment.fields.table is table
+                    or any(
+                        fk.column.table is segment.fields.table
+                        for fk in table.foreign_keys
+                    )
+                ]
+                current = Segment(model, fields, waits)
+                current.task = asyncio.create_task(current.load(slots, progress))
+                segments.append(current)
+            rows.append(current.fields.load(values))
+            total += 1
+            if len(rows) >= chunk_size:
+                await put_rows()
+        await put_rows()
+        if current is not None:
+            await put(current, _END)
+        await asyncio.gather(*_tasks(segments))
+    except BaseException:
+        tasks = _tasks(segments)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return total
@@ -0,0 +1,218 @@
+"""
+Adaptive concurrency limits and load shedding.
+
+Each limit admits up to `limit` requests at once and queues a bounded number more.
+The limit follows an AIMD rule: it grows by about one per limit completions while
+requests use it all, and shrinks by backoff when the smoothed latency exceeds
+tolerance times the baseline latency, or when requests wait for a pooled database
+connection. Requests that find the queue full, or wait longer than queue_timeout,
+are rejected with 503 and Retry-After instead of piling up on the pool.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import math
+import time
+import typing
+from typing import Any, Optional
+
+from fastapi import HTTPException, Request
+from starlette.responses import JSONResponse
+
+from appboot import db
+from appboot.metrics import route_template
+
+LIMITER_SCOPE_KEY = 'appboot.limiter'
+
+
+class Overloaded(HTTPException):
+    def __init__(self, retry_after: int = 1):
+        super().__init__(
+            status_code=503,
+            detail='Service overloaded',
+            headers={'Retry-After': str(retry_after)},
+        )
+
+
+class AdaptiveLimit:
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 1000,
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+        smoothing: float = 0.2,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.rejected = 0
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot, return False when the request should be shed."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # granted just as the wait timed out, hand the slot on
+                self.in_flight -= 1
+                self._wake()
+            self.rejected += 1
+            return False
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        return True
+
+    def release(self, latency: float, congested: bool = False) -> None:
+        self.in_flight -= 1
+        self.update(latency, congested)
+        self._wake()
+
+    def update(self, latency: float, congested: bool = False) -> None:
+        if self.latency is None or self.baseline is None:
+            self.latency = self.baseline = latency
+        else:
+            self.latency += (latency - self.latency) * self.smoothing
+            if latency < self.baseline:
+                self.baseline = latency
+            else:
+                # drift up slowly so the baseline follows a lasting change
+                self.baseline += (latency - self.baseline) * 0.001
+        now = time.monotonic()
+        if congested or self.latency > self.baseline * self.tolerance:
+            # at most once per round trip, a single slow period is one signal
+            if now - self._last_decrease > self.latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def retry_after(self) -> int:
+        latency = self.latency or 0.0
+        return max(1, math.ceil(latency * (self.queued + 1) / max(self.limit, 1)))
+
+
+class ConcurrencyLimiter:
+    """A global limit and, with route_limit set, one limit per route template."""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        route_limit: int = 0,
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+        priority_paths: typing.Sequence[str] = (),
+        **options: Any,
+    ):
+        self.options = dict(max_queue=max_queue, queue_timeout=queue_timeout, **options)
+        self.route_limit = route_limit
+        self.priority_paths = tuple(priority_paths)
+        self.limit = AdaptiveLimit(limit, **self.options)
+        self.routes: dict[str, AdaptiveLimit] = {}
+
+    def is_priority(self, path: str) -> bool:
+        """Health and admin routes bypass the limits and are never shed."""
+        return path.startswith(self.priority_paths) if self.priority_paths else False
+
+    def get_route_limit(self, template: str) -> Optional[AdaptiveLimit]:
+        if not self.route_limit:
+            return None
+        limit = self.routes.get(template)
+        if limit is None:
+            limit = self.routes[template] = AdaptiveLimit(
+                self.route_limit, **self.options
+            )
+        return limit
+
+    @staticmethod
+    def congested() -> bool:
+        return db.engine_manager.pool_waiters() > 0
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app, limiter: Optional[ConcurrencyLimiter] = None, **options):
+        self.app = app
+        self.limiter = limiter or ConcurrencyLimiter(**options)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.limiter.is_priority(scope['path']):
+            return await self.app(scope, receive, send)
+        limit = self.limiter.limit
+        if not await limit.acquire():
+            response = JSONResponse(
+                {'detail': 'Service overloaded'},
+                status_code=503,
+                headers={'Retry-After': str(limit.retry_after())},
+            )
+            return await response(scope, receive, send)
+        scope[LIMITER_SCOPE_KEY] = self.limiter
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release(time.perf_counter() - start, self.limiter.congested())
+
+
+async def limit_route(request: Request) -> typing.AsyncIterator[None]:
+    """
+    Dependency holding the limit of the matched route while the endpoint runs,
+    installed before get_session so shed requests never touch the pool.
+    """
+    limiter: Optional[ConcurrencyLimiter] = request.scope.get(LIMITER_SCOPE_KEY)
+    limit = None
+    if limiter is not None:
+        limit = limiter.get_route_limit(route_template(request.scope))
+    if limiter is None or limit is None:
+        yield
+        return
+    if not await limit.acquire():
+        raise Overloaded(limit.retry_after())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        limit.release(time.perf_counter() - start, limiter.congested())
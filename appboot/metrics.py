@@ -0,0 +1,347 @@
+"""
+Prometheus compatible metrics of requests, database and caches.
+
+Updates are plain arithmetic on per label objects, relying on the GIL and the
+single threaded event loop, a lock is only taken to create the object of a new
+label set. The text exposition format is produced by Registry.expose.
+"""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import math
+import threading
+import time
+import typing
+from typing import Any, Callable, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import QueuePool
+from starlette.responses import Response
+
+from appboot import db
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+Sample = tuple[str, dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for suffix, labels, value in metric.collect():
+                name = metric.name + suffix
+                if labels:
+                    label_text = ','.join(
+                        f'{k}="{_escape(str(v))}"' for k, v in labels.items()
+                    )
+                    name = f'{name}{{{label_text}}}'
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: typing.Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(values, self.new_child())
+        return child
+
+    def collect(self) -> typing.Iterator[Sample]:
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            yield from child.samples(labels)
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self, labels: dict[str, str]) -> typing.Iterator[Sample]:
+        yield '', labels, self.value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def new_child(self) -> _Value:
+        return _Value()
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def new_child(self) -> _Value:
+        return _Value()
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # the last slot counts observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, labels: dict[str, str]) -> typing.Iterator[Sample]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            yield '_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+        yield '_sum', labels, self.sum
+        yield '_count', labels, cumulative
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: typing.Sequence[float] = DEFAULT_BUCKETS, **kw):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(*args, **kw)
+
+    def new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time from a callback yielding (label values, value)."""
+
+    type = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: typing.Sequence[str],
+        callback: Callable[[], typing.Iterable[tuple[tuple[str, ...], float]]],
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def collect(self) -> typing.Iterator[Sample]:
+        for values, value in self.callback():
+            yield '', dict(zip(self.labelnames, values)), value
+
+
+REQUEST_DURATION = Histogram(
+    'appboot_http_request_duration_seconds',
+    'HTTP request latency by route template.',
+    ['method', 'route'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'appboot_http_requests_in_progress', 'HTTP requests being served.', ['method']
+)
+RESPONSES = Counter(
+    'appboot_http_responses_total',
+    'HTTP responses by route template and status code.',
+    ['method', 'route', 'status'],
+)
+QUERY_DURATION = Histogram(
+    'appboot_db_query_duration_seconds',
+    'Database statement execution time by DATABASES alias.',
+    ['alias'],
+)
+
+
+def _pool_stats() -> typing.Iterator[tuple[tuple[str, ...], float]]:
+    for alias, engine in db.engine_manager.connected().items():
+        pool = engine.sync_engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+        checked_out = pool.checkedout()
+        yield (alias, 'checked_out'), checked_out
+        yield (alias, 'capacity'), capacity
+        yield (alias, 'saturation'), checked_out / capacity if capacity else 0
+
+
+POOL = CallbackGauge(
+    'appboot_db_pool_connections',
+    'Connection pool usage, saturation is checked_out / capacity.',
+    ['alias', 'state'],
+    _pool_stats,
+)
+
+
+def _cached_functions() -> dict[str, Any]:
+    from appboot import counters, repository, schema, serializer
+
+    return {
+        'model_columns': schema._parse_model_columns,
+        'loader_options': schema.get_loader_options,
+        'writable_fields': schema.get_writable_fields,
+        'list_adapter': schema.get_list_adapter,
+        'serializer': serializer.get_serializer,
+        'construction_plan': repository.get_construction_plan,
+        'counter_fields': counters.get_counter_fields,
+    }
+
+
+def _cache_stats() -> typing.Iterator[tuple[tuple[str, ...], float]]:
+    for name, func in _cached_functions().items():
+        info = func.cache_info()
+        total = info.hits + info.misses
+        yield (name, 'hits'), info.hits
+        yield (name, 'misses'), info.misses
+        yield (name, 'hit_ratio'), info.hits / total if total else 0
+
+
+CACHES = CallbackGauge(
+    'appboot_cache',
+    'Hits, misses and hit ratio of the appboot per class caches.',
+    ['cache', 'stat'],
+    _cache_stats,
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    starts = conn.info.get('metrics_query_start')
+    if starts:
+        alias = db.engine_manager.get_alias(conn.engine) or 'unknown'
+        QUERY_DURATION.labels(alias).observe(time.perf_counter() - starts.pop())
+
+
+@functools.lru_cache()
+def install_db_hooks() -> None:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def route_template(scope: typing.Mapping[str, Any]) -> str:
+    """
+    Path template of the matched route, it keeps the label cardinality bounded.
+    fastapi keeps included routers nested, the route of the scope lacks their
+    prefixes while the effective route context carries the full path.
+    """
+    context = scope.get('fastapi', {}).get('effective_route_context')
+    path = getattr(context, 'path', None) or getattr(scope.get('route'), 'path', None)
+    return path or '<unmatched>'
+
+
+class MetricsMiddleware:
+    """Record latency, in progress requests and status codes by route template."""
+
+    def __init__(self, app):
+        self.app = app
+        install_db_hooks()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            template = route_template(scope)
+            REQUEST_DURATION.labels(method, template).observe(
+                time.perf_counter() - start
+            )
+            RESPONSES.labels(method, template, str(status)).inc()
+
+
+async def metrics() -> Response:
+    return Response(REGISTRY.expose(), media_type=CONTENT_TYPE)
+
+
+def fastapi_register_metrics(app: FastAPI, path: str) -> None:
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route(path, metrics, methods=['GET'], include_in_schema=False)
@@ -1,20 +1,52 @@
 from __future__ import annotations
 
+import json
 import typing
 from datetime import datetime
 from enum import Enum
 from typing import Optional, TypeVar
 
 from pydantic import BaseModel
-from sqlalchemy import JSON, DateTime, Integer, String, TypeDecorator, func
+from sqlalchemy import (
+    JSON,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    TypeDecorator,
+    UniqueConstraint,
+    func,
+)
 from sqlalchemy.orm import Mapped, declared_attr, mapped_column
+from sqlalchemy.orm.attributes import set_committed_value
 from typing_extensions import Self
 
 from appboot import timezone
+from appboot._compat import PYDANTIC_V2
 from appboot.conf import settings
 from appboot.db import Base, ScopedSession
-from appboot.repository import AsyncQuerySet, QuerySetProperty, SoftDeleteAsyncQuerySet
-from appboot.utils import camel_to_snake
+from appboot.exceptions import DoesNotExist
+from appboot.expressions import F
+from appboot.repository import (
+    AsyncQuerySet,
+    QuerySetProperty,
+    SoftDeleteAsyncQuerySet,
+    get_construction_plan,
+)
+from appboot.utils import camel_to_snake, make_model_by_obj
+
+if PYDANTIC_V2:
+    from pydantic_core import to_json
+
+if typing.TYPE_CHECKING:
+    import msgpack
+else:
+    try:
+        import msgpack
+    except ImportError:  # pragma: no cover
+        msgpack = None
 
 ModelT = TypeVar('ModelT', bound='Model')
 PydanticModel = TypeVar('PydanticModel', bound=BaseModel)
@@ -42,14 +74,66 @@ class OperatorMixin:
 
 class DeletedAtMixin:
     query_set_class = SoftDeleteAsyncQuerySet
+    # columns indexed over live rows only, a name or a tuple of names per index,
+    # e.g. partial_indexes = ('email', ('tenant_id', 'name')). By default the
+    # columns of the indexes and unique constraints of the table.
+    partial_indexes: typing.ClassVar[Optional[typing.Sequence[typing.Any]]] = None
     deleted_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime(timezone=True), default=None
     )
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        table = cls.__dict__.get('__table__')
+        if table is not None:
+            partial_indexes = cls.partial_indexes
+            if partial_indexes is None:
+                partial_indexes = _get_indexed_columns(table)
+            _add_partial_indexes(table, partial_indexes)
+
     async def delete(self):
         self.deleted_at = timezone.now()
 
 
+def _get_indexed_columns(table: Table) -> list[tuple[str, ...]]:
+    """Column names of the indexes and unique constraints of a table."""
+    indexed: list[tuple[str, ...]] = []
+    for item in [*table.indexes, *table.constraints]:
+        if not isinstance(item, (Index, UniqueConstraint)):
+            continue
+        names = tuple(column.name for column in item.columns)
+        if names and 'deleted_at' not in names and names not in indexed:
+            indexed.append(names)
+    return indexed
+
+
+def _add_partial_indexes(table: Table, partial_indexes: typing.Sequence[typing.Any]):
+    """Index the given columns WHERE deleted_at IS NULL, where partial indexes exist."""
+    live = table.c.deleted_at.is_(None)
+    for names in partial_indexes:
+        if isinstance(names, str):
+            names = (names,)
+        Index(
+            f'ix_{table.name}_{"_".join(names)}_live',
+            *[table.c[name] for name in names],
+            postgresql_where=live,
+            sqlite_where=live,
+        )
+
+
+class VersionMixin:
+    """
+    Optimistic concurrency: updates of an instance match the version it was loaded
+    with and increment it, raising Conflict when the row was changed meanwhile.
+    """
+
+    version: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, typing.Any]:
+        return {'version_id_col': cls.version}
+
+
 class Model(Base):
     __abstract__ = True
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -64,6 +148,26 @@ class Model(Base):
             if hasattr(self, name) and getattr(self, name) != value:
                 setattr(self, name, value)
 
+    async def increment(self, *fields: str, amount: int = 1, **amounts: int) -> Self:
+        """
+        Atomically add to counter columns with a single UPDATE ... RETURNING and
+        refresh them on this instance, e.g. await choice.increment('votes')
+        """
+        values = {name: F(name) + amount for name in fields}
+        values.update({name: F(name) + value for name, value in amounts.items()})
+        returning = list(values)
+        version_key = get_construction_plan(self.__class__).version_key
+        if version_key is not None:
+            returning.append(version_key)
+        rows = await self.objects.filter_by(id=self.id).update(
+            values, synchronize_session=False, returning=returning
+        )
+        if not rows:
+            raise DoesNotExist(f'{self.__class__.__name__} Not Exist')
+        for name, value in rows[0]._mapping.items():
+            set_committed_value(self, name, value)
+        return self
+
     async def refresh(self, attribute_names=None, with_for_update=None):
         await self.objects.session.refresh(self, attribute_names, with_for_update)
 
@@ -80,27 +184,28 @@ class Model(Base):
 
 
 def _parse_data_to_model(model: type[Base], data: dict[str, typing.Any]):
-    _data = {}
-    for key, column in model.__mapper__.columns.items():
-        if key not in data or column.primary_key:
+    plan = get_construction_plan(model)
+    _data = {
+        key: value
+        for key, value in data.items()
+        if key in plan.columns and key not in plan.primary_keys
+    }
+    for rel in plan.relationships:
+        if rel.key not in data:
             continue
-        _data[key] = data[key]
-    for key, rel in model.__mapper__.relationships.items():
-        if key not in data:
-            continue
-        sub_model = rel.mapper.class_
         if rel.uselist:
             rel_result = [
-                _parse_data_to_model(sub_model, sub_data) for sub_data in data[key]
+                _parse_data_to_model(rel.model, sub_data) for sub_data in data[rel.key]
             ]
         else:
-            rel_result = _parse_data_to_model(sub_model, data[key])
-        _data[key] = rel_result
+            rel_result = _parse_data_to_model(rel.model, data[rel.key])
+        _data[rel.key] = rel_result
     return model(**_data)
 
 
 class PydanticType(TypeDecorator):
     impl = JSON
+    cache_ok = True
 
     def __init__(self, pydantic_type: type[PydanticModel], *args, **kwargs):
         self.pydantic_type = pydantic_type
@@ -121,6 +226,108 @@ class PydanticType(TypeDecorator):
         return self.pydantic_type
 
 
+class LazyPydanticModel:
+    """
+    Proxy holding the stored value of a LazyPydanticType column, it is validated
+    into the pydantic model on first attribute access.
+    """
+
+    __slots__ = ('_raw', '_decode', '_value')
+
+    def __init__(
+        self, raw: typing.Any, decode: typing.Callable[[typing.Any], BaseModel]
+    ):
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_decode', decode)
+        object.__setattr__(self, '_value', None)
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._value is not None
+
+    def get_value(self) -> BaseModel:
+        if self._value is None:
+            object.__setattr__(self, '_value', self._decode(self._raw))
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.get_value(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_value(), name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPydanticModel):
+            other = other.get_value()
+        return self.get_value() == other
+
+    def __hash__(self):
+        return hash(self.get_value())
+
+    def __repr__(self):
+        if self._value is None:
+            return f'{self.__class__.__name__}({self._raw!r})'
+        return repr(self._value)
+
+
+class LazyPydanticType(PydanticType):
+    """
+    PydanticType which defers validation until the value is first used.
+
+    storage='json' keeps a JSON column, storage='bytes' stores pydantic-core
+    encoded JSON bytes and storage='msgpack' msgpack bytes in a binary column;
+    the binary formats also defer parsing the stored value.
+    """
+
+    cache_ok = True
+
+    def __init__(
+        self,
+        pydantic_type: type[PydanticModel],
+        storage: typing.Literal['json', 'bytes', 'msgpack'] = 'json',
+        *args,
+        **kwargs,
+    ):
+        if storage == 'msgpack' and msgpack is None:
+            raise ImportError('msgpack is required for msgpack storage')
+        self.storage = storage
+        super().__init__(pydantic_type, *args, **kwargs)
+
+    def load_dialect_impl(self, dialect):
+        if self.storage == 'json':
+            return dialect.type_descriptor(JSON())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, LazyPydanticModel):
+            if not value.is_decoded:
+                return value._raw
+            value = value.get_value()
+        if isinstance(value, self.pydantic_type):
+            value = value.dict(exclude_unset=True)
+        if value is None or self.storage == 'json':
+            return value
+        if self.storage == 'msgpack':
+            return msgpack.packb(value, default=str)
+        if PYDANTIC_V2:
+            return to_json(value)
+        return json.dumps(value, default=str).encode()
+
+    def decode(self, raw) -> BaseModel:
+        if self.storage == 'bytes':
+            if PYDANTIC_V2:
+                return self.pydantic_type.model_validate_json(raw)
+            return self.pydantic_type.parse_raw(raw)
+        if self.storage == 'msgpack':
+            raw = msgpack.unpackb(raw)
+        return make_model_by_obj(self.pydantic_type, raw)
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return LazyPydanticModel(value, self.decode)
+        return value
+
+
 class EnumType(TypeDecorator):
     impl = String
     cache_ok = True
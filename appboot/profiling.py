@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import hashlib
+import hmac
+import inspect
+import os
+import re
+import time
+import typing
+from typing import Any, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+if typing.TYPE_CHECKING:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+else:
+    try:
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+    except ImportError:  # pragma: no cover
+        Profiler = None
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_OUTPUT_HEADER = 'x-profile-output'
+PROFILE_OUTPUTS = {'html': '.html', 'speedscope': '.speedscope.json'}
+
+
+class RequestProfile:
+    """Time spent by one request in each phase, accumulated by the hooks below."""
+
+    __slots__ = ('db', 'orm', 'validate', 'serialize', 'queries')
+
+    def __init__(self):
+        self.db = 0.0
+        self.orm = 0.0
+        self.validate = 0.0
+        self.serialize = 0.0
+        self.queries = 0
+
+    def server_timing(self, total: float) -> str:
+        # orm time includes the queries it runs, hydrate is what remains
+        hydrate = max(self.orm - self.db, 0.0)
+        app = max(total - self.db - hydrate - self.validate - self.serialize, 0.0)
+        metrics = [
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+            f'hydrate;dur={hydrate * 1000:.2f}',
+            f'validate;dur={self.validate * 1000:.2f}',
+            f'serialize;dur={self.serialize * 1000:.2f}',
+            f'app;dur={app * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        return ', '.join(metrics)
+
+
+current_profile: contextvars.ContextVar[
+    Optional[RequestProfile]
+] = contextvars.ContextVar('appboot_profile', default=None)
+
+
+def add_phase_time(phase: str, start: float) -> None:
+    profile = current_profile.get()
+    if profile is not None:
+        setattr(profile, phase, getattr(profile, phase) + time.perf_counter() - start)
+
+
+def _timed(phase: str, func):
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                add_phase_time(phase, start)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_phase_time(phase, start)
+
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if current_profile.get() is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    profile = current_profile.get()
+    starts = conn.info.get('profile_query_start')
+    if profile is not None and starts:
+        profile.db += time.perf_counter() - starts.pop()
+        profile.queries += 1
+
+
+@functools.lru_cache()
+def install_hooks() -> None:
+    """
+    Hook the phases once per process: cursor execution (db), request body and
+    response model validation of fastapi (validate) and json rendering (serialize).
+    It patches fastapi and starlette, so it only runs once profiling is enabled.
+    Query set calls are timed by the repository (orm). Recent fastapi versions
+    encode response models inside serialize_response, that time counts as validate.
+    The hooks cost one context variable lookup when no profiled request is running.
+    """
+    import fastapi.dependencies.utils
+    import fastapi.routing
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from starlette.responses import JSONResponse
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    utils = fastapi.dependencies.utils
+    utils.request_body_to_args = _timed('validate', utils.request_body_to_args)
+    routing = fastapi.routing
+    routing.serialize_response = _timed('validate', routing.serialize_response)
+    JSONResponse.render = _timed('serialize', JSONResponse.render)  # type: ignore
+
+
+def sign_profile_token(secret: str, ttl: int = 300) -> str:
+    """Value of the X-Profile header enabling profiling of a request for ttl seconds."""
+    expires = str(int(time.time()) + ttl)
+    signature = hmac.new(secret.encode(), expires.encode(), hashlib.sha256)
+    return f'{expires}.{signature.hexdigest()}'
+
+
+def verify_profile_token(secret: str, token: str) -> bool:
+    expires, _, signature = token.partition('.')
+    if not secret or not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256)
+    return hmac.compare_digest(expected.hexdigest(), signature)
+
+
+class ProfilingMiddleware:
+    """
+    Add a Server-Timing header splitting the request time into db, hydrate,
+    validate and serialize phases, for every request when enabled or else for
+    requests carrying a valid signed X-Profile header (see sign_profile_token).
+
+    Such a request may also ask with X-Profile-Output: html or speedscope for a
+    sampling cpu profile, written into output_dir and named by X-Profile-File.
+    The hooks are installed when the middleware is enabled or has a secret.
+    """
+
+    def __init__(
+        self, app, enabled: bool = False, secret: str = '', output_dir: str = ''
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.secret = secret
+        self.output_dir = output_dir or 'profiles'
+        if enabled or secret:
+            install_hooks()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        token = headers.get(PROFILE_HEADER)
+        authorized = token is not None and verify_profile_token(self.secret, token)
+        if not (self.enabled or authorized):
+            return await self.app(scope, receive, send)
+        output = headers.get(PROFILE_OUTPUT_HEADER) if authorized else None
+        profiler = filename = None
+        if output in PROFILE_OUTPUTS and Profiler is not None:
+            profiler = Profiler(async_mode='enabled')
+            filename = self.profile_filename(scope, output)
+        profile = RequestProfile()
+        context_token = current_profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response_headers = MutableHeaders(scope=message)
+                total = time.perf_counter() - start
+                response_headers.append('Server-Timing', profile.server_timing(total))
+                if profiler is not None and profiler.is_running:
+                    profiler.stop()
+                    response_headers.append('X-Profile-File', filename)
+            await send(message)
+
+        if profiler is not None:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(context_token)
+            if profiler is not None:
+                if profiler.is_running:
+                    profiler.stop()
+                self.write_profile(profiler, filename, output)
+
+    def profile_filename(self, scope: dict[str, Any], output: str) -> str:
+        path = re.sub(r'[^A-Za-z0-9]+', '_', scope['path']).strip('_') or 'root'
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return f"{stamp}-{scope['method']}-{path}{PROFILE_OUTPUTS[output]}"
+
+    def write_profile(self, profiler: typing.Any, filename: str, output: str) -> None:
+        renderer = HTMLRenderer() if output == 'html' else SpeedscopeRenderer()
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, filename), 'w') as f:
+            f.write(profiler.output(renderer))
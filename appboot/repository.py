@@ -1,23 +1,154 @@
 from __future__ import annotations
 
+import contextlib
+import time
 import typing
+import warnings
+from functools import lru_cache
+from operator import attrgetter
 from typing import Any, Generic, Optional
 
-from sqlalchemy import insert
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from sqlalchemy.orm import Query, Session
+from sqlalchemy.orm import ONETOMANY, Query, Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.util import greenlet_spawn
 from typing_extensions import Self
 
 from appboot import timezone
-from appboot.exceptions import DoesNotExist
+from appboot.db import (
+    Base,
+    ScopedSession,
+    created_hooks,
+    notify_created,
+    using_database,
+)
+from appboot.exceptions import Conflict, DoesNotExist, NotSupportedError
+from appboot.expressions import resolve_values
 from appboot.pagination import PaginationResult
+from appboot.profiling import add_phase_time, current_profile
+from appboot.singleflight import query_flights
 
 if typing.TYPE_CHECKING:
     from appboot.models import Model  # noqa
     from appboot.params import QuerySchema, PaginationQuerySchema
+    from appboot.schema import ModelSchema
 
 ModelT = typing.TypeVar('ModelT', bound='Model')
+RowMode = typing.Literal['rows', 'mappings', 'scalars']
+
+
+class RelationshipPlan(typing.NamedTuple):
+    key: str
+    model: type[Any]
+    uselist: bool
+    # children rows can be inserted in bulk once the parent key is known
+    batchable: bool
+    # (parent attribute, child attribute) pairs of the foreign key
+    foreign_keys: tuple[tuple[str, str], ...]
+
+
+class ConstructionPlan(typing.NamedTuple):
+    columns: frozenset[str]
+    primary_keys: frozenset[str]
+    relationships: tuple[RelationshipPlan, ...]
+    relationship_keys: frozenset[str]
+    # single integer primary key generated by the database
+    autoincrement_key: Optional[str]
+    # version counter of optimistic concurrency, see VersionMixin
+    version_key: Optional[str]
+
+    def split(self, record: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+        """Split a record into column values and relationship data."""
+        columns = {}
+        related = {}
+        for key, value in record.items():
+            if key in self.columns:
+                if value is None and key in self.primary_keys:
+                    continue
+                columns[key] = value
+            elif key in self.relationship_keys:
+                related[key] = value
+        return columns, related
+
+    def is_batchable(self, records: typing.Sequence[dict[str, Any]]) -> bool:
+        for rel in self.relationships:
+            for record in records:
+                value = record.get(rel.key)
+                if value is None:
+                    continue
+                items = value if rel.uselist else [value]
+                if not rel.batchable or not all(isinstance(i, dict) for i in items):
+                    return False
+        return True
+
+
+@lru_cache()
+def get_construction_plan(model: type[Any]) -> ConstructionPlan:
+    """Columns and relationships of a model, walked once per model."""
+    mapper = model.__mapper__
+    relationships = []
+    for key, rel in mapper.relationships.items():
+        foreign_keys = tuple(
+            (
+                mapper.get_property_by_column(local).key,
+                rel.mapper.get_property_by_column(remote).key,
+            )
+            for local, remote in rel.local_remote_pairs
+        )
+        batchable = rel.direction is ONETOMANY and rel.secondary is None
+        relationships.append(
+            RelationshipPlan(
+                key, rel.mapper.class_, rel.uselist, batchable, foreign_keys
+            )
+        )
+    autoincrement_key = None
+    table = getattr(model, '__table__', None)
+    if table is not None and table.autoincrement_column is not None:
+        autoincrement_key = mapper.get_property_by_column(
+            table.autoincrement_column
+        ).key
+    version_key = None
+    if mapper.version_id_col is not None:
+        version_key = mapper.get_property_by_column(mapper.version_id_col).key
+    return ConstructionPlan(
+        columns=frozenset(mapper.columns.keys()),
+        primary_keys=frozenset(
+            mapper.get_property_by_column(c).key for c in mapper.primary_key
+        ),
+        relationships=tuple(relationships),
+        relationship_keys=frozenset(rel.key for rel in relationships),
+        autoincrement_key=autoincrement_key,
+        version_key=version_key,
+    )
+
+
+def needs_unit_of_work(model: type[Any]) -> bool:
+    """
+    Whether rows of model must be inserted by the unit of work: bulk INSERT
+    statements skip a custom __init__ and the insert events of the mapper.
+    """
+    mapper = model.__mapper__
+    return (
+        mapper.class_manager.original_init is not model.registry.constructor
+        or bool(mapper.dispatch.before_insert)
+        or bool(mapper.dispatch.after_insert)
+    )
+
+
+def _has_key(records: typing.Sequence[dict[str, Any]], key: str) -> bool:
+    return any(record.get(key) is not None for record in records)
+
+
+async def run_query(fn, *args, **kwargs):
+    """Run a sync query set method, accounting its time to a profiled request."""
+    if current_profile.get() is None:
+        return await greenlet_spawn(fn, *args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return await greenlet_spawn(fn, *args, **kwargs)
+    finally:
+        add_phase_time('orm', start)
 
 
 class QuerySetProperty:
@@ -34,8 +165,44 @@ class QuerySet(Query, Generic[ModelT]):
     def __init__(self, model: type[ModelT], session: Session):
         self.model: type[ModelT] = model
         self._step: int = 1
+        self._row_mode: Optional[RowMode] = None
         super().__init__(self.model, session)
 
+    def _resolve_columns(self, columns: typing.Sequence[Any]) -> list[Any]:
+        if not columns:
+            columns = self.model.__mapper__.columns.keys()
+        return [
+            getattr(self.model, column) if isinstance(column, str) else column
+            for column in columns
+        ]
+
+    def with_row_mode(self, mode: RowMode, *columns) -> Self:
+        query = self.with_entities(*self._resolve_columns(columns))
+        query._row_mode = mode
+        return query
+
+    def _convert_result(self, result):
+        if self._row_mode == 'mappings':
+            return result.mappings()
+        if self._row_mode == 'scalars':
+            return result.scalars()
+        if self._row_mode is None and self.is_single_entity:
+            return result.scalars()
+        return result
+
+    def _iter(self):
+        result = super()._iter()
+        if self._row_mode is None:
+            return result
+        return self._convert_result(result)
+
+    def count(self) -> int:
+        if self._row_mode is None:
+            return super().count()
+        query = self._clone()
+        query._row_mode = None
+        return query.count()
+
     def filter_query(self, query: QuerySchema) -> Self:
         conditions = query.construct_condition(self.model)
         if ordering := query.construct_ordering(self.model):
@@ -63,17 +230,210 @@ class QuerySet(Query, Generic[ModelT]):
     ) -> PaginationResult[ModelT]:
         return self.filter_query(query)._paginate(query, must_count)
 
-    def create(self, **kwargs) -> ModelT:
-        instance = self.model.construct(**kwargs)
-        self.session.add(instance)
-        self.session.flush([instance])
-        self.session.refresh(instance)
+    def create(self, *, _load: typing.Sequence[str] = (), **kwargs) -> ModelT:
+        plan = get_construction_plan(self.model)
+        record = {k: v for k, v in kwargs.items() if k not in plan.primary_keys}
+        instance = self.bulk_create([record], returning=True)[0]
+        if _load:
+            self.load(instance, _load)
+        return instance
+
+    def load(self, instance: ModelT, relationships: typing.Sequence[str]) -> ModelT:
+        """Load relationships of instance with one joined query."""
+        options = [joinedload(getattr(self.model, name)) for name in relationships]
+        identity = self.model.__mapper__.primary_key_from_instance(instance)
+        self.session.get(self.model, identity, options=options, populate_existing=True)
         return instance
 
-    def bulk_create(self, records: list[dict[str, Any]]):
-        stmt = insert(self.model).values(records)
-        result = self.session.execute(stmt)
-        return result.rowcount
+    def coalesce_key(self, method: str, *args: Any) -> Optional[tuple[Any, ...]]:
+        """
+        Key of a read shared by identical concurrent calls, None when the query must
+        run on its own. The statement part is the key of the SQLAlchemy compiled
+        statement cache, it covers loader options that do not show in the SQL.
+        """
+        if self._for_update_arg is not None:
+            return None
+        if self._row_mode is None and not self.is_single_entity:
+            # rows holding instances would be shared between sessions
+            for description in self.column_descriptions:
+                if hasattr(description['type'], '__mapper__'):
+                    return None
+        cache_key = self.statement._generate_cache_key()
+        if cache_key is None:
+            return None
+        params = tuple(repr(bind.effective_value) for bind in cache_key.bindparams)
+        return method, self._row_mode, cache_key.key, params, args
+
+    def adopt(self, result: Any) -> Any:
+        """
+        Copy of a result loaded by another session: instances are merged into this
+        session without loading, rows and scalars are immutable and shared.
+        """
+        if isinstance(result, list):
+            return [self.adopt(item) for item in result]
+        if isinstance(result, PaginationResult):
+            return PaginationResult(
+                count=result.count,
+                results=self.adopt(result.results),
+                page=result.page,
+                page_size=result.page_size,
+            )
+        if isinstance(result, Base):
+            return self.session.merge(result, load=False)
+        return result
+
+    def aggregate_query(self, *expressions) -> Self:
+        query = self.with_entities(*expressions).order_by(None).limit(None).offset(None)
+        query._row_mode = None
+        return query
+
+    def aggregate(self, *expressions):
+        return self.aggregate_query(*expressions).one()
+
+    def update(
+        self,
+        values: dict[Any, Any],
+        synchronize_session='auto',
+        update_args: Optional[dict[Any, Any]] = None,
+        returning: Optional[typing.Sequence[Any]] = None,
+        expected_version: Optional[int] = None,
+    ):
+        values = resolve_values(values, self.model)
+        query = self
+        version_key = get_construction_plan(self.model).version_key
+        if version_key is not None:
+            version = getattr(self.model, version_key)
+            if version_key not in values and version not in values:
+                values[version_key] = version + 1
+            if expected_version is not None:
+                query = self.filter(version == expected_version)
+        elif expected_version is not None:
+            raise NotSupportedError(f'Model {self.model.__name__} is not versioned')
+        result = query._update(values, synchronize_session, update_args, returning)
+        if expected_version is not None and not result:
+            raise Conflict(
+                f'{self.model.__name__} version {expected_version} is out of date'
+            )
+        return result
+
+    def _update(self, values, synchronize_session, update_args, returning):
+        if not returning:
+            return super().update(values, synchronize_session, update_args)
+        columns = self._resolve_columns(returning)
+        stmt = (
+            update(self.model)
+            .values(values)
+            .execution_options(synchronize_session=synchronize_session)
+        )
+        if self.whereclause is not None:
+            stmt = stmt.where(self.whereclause)
+        if update_args:
+            stmt = stmt.with_dialect_options(**update_args)
+        if self.session.get_bind(clause=stmt).dialect.update_returning:
+            result = self.session.execute(stmt.returning(*columns))
+        else:
+            # no RETURNING support, read the values back within the transaction
+            super().update(values, synchronize_session, update_args)
+            result = self.with_entities(*columns)._iter()
+        if len(columns) == 1 and columns[0] is self.model:
+            return result.scalars().all()
+        return result.all()
+
+    def bulk_create(
+        self,
+        records: list[dict[str, Any]],
+        batch_size: Optional[int] = None,
+        returning: bool = False,
+    ):
+        if not returning:
+            stmt = insert(self.model).values(records)
+            result = self.session.execute(stmt)
+            return result.rowcount
+        plan = get_construction_plan(self.model)
+        stmt = insert(self.model)
+        dialect = self.session.get_bind(clause=stmt).dialect
+        sort_key = plan.autoincrement_key
+        if dialect.name == 'sqlite' and sort_key and not _has_key(records, sort_key):
+            # sqlalchemy can not promise the RETURNING order on sqlite and falls back
+            # to a statement per row, but rowids grow in VALUES order: sort by them
+            stmt = stmt.returning(self.model)
+        else:
+            sort_key = None
+            stmt = stmt.returning(self.model, sort_by_parameter_order=True)
+        batch_size = batch_size or len(records) or 1
+        instances: list[ModelT] = []
+        for i in range(0, len(records), batch_size):
+            batch = records[i : i + batch_size]
+            if (
+                (
+                    dialect.insert_executemany_returning
+                    or (len(batch) == 1 and dialect.insert_returning)
+                )
+                and plan.is_batchable(batch)
+                and not needs_unit_of_work(self.model)
+            ):
+                created = self._insert_returning(stmt, plan, batch, sort_key)
+                instances.extend(created)
+            else:
+                # the unit of work inserts other relationships, e.g. many to many
+                objs = [self.model.construct(**record) for record in batch]
+                self.session.add_all(objs)
+                self.session.flush(objs)
+                if not dialect.insert_returning:
+                    for obj in objs:
+                        self.session.refresh(obj)
+                instances.extend(objs)
+        return instances
+
+    def _insert_returning(
+        self,
+        stmt,
+        plan: ConstructionPlan,
+        records: list[dict[str, Any]],
+        sort_key: Optional[str] = None,
+    ) -> list[ModelT]:
+        """
+        Insert records with one INSERT ... RETURNING, then the children of every
+        one to many relationship with one bulk insert per relationship, recursively.
+        """
+        rows = [plan.split(record) for record in records]
+        instances = self.session.scalars(stmt, [columns for columns, _ in rows]).all()
+        if sort_key is not None:
+            instances = sorted(instances, key=attrgetter(sort_key))
+        for rel in plan.relationships:
+            children_records: list[dict[str, Any]] = []
+            owners = []
+            for instance, (_, related) in zip(instances, rows):
+                if rel.key not in related:
+                    if rel.batchable:
+                        # a new row has no children but the given ones
+                        empty: Any = [] if rel.uselist else None
+                        set_committed_value(instance, rel.key, empty)
+                    continue
+                items = related[rel.key]
+                if not rel.uselist:
+                    items = [] if items is None else [items]
+                foreign_keys = {
+                    child_key: getattr(instance, parent_key)
+                    for parent_key, child_key in rel.foreign_keys
+                }
+                children_records.extend({**item, **foreign_keys} for item in items)
+                owners.append((instance, len(items)))
+            if not owners:
+                continue
+            children = QuerySet(rel.model, self.session).bulk_create(
+                children_records, returning=True
+            )
+            offset = 0
+            for instance, count in owners:
+                value = children[offset : offset + count]
+                offset += count
+                if not rel.uselist:
+                    value = value[0] if value else None
+                set_committed_value(instance, rel.key, value)
+        if created_hooks:
+            notify_created(self.session, instances)
+        return list(instances)
 
 
 class AsyncQuerySet(Generic[ModelT]):
@@ -82,13 +442,82 @@ class AsyncQuerySet(Generic[ModelT]):
         self.session: AsyncSession = session
         self._query = QuerySet(self.model, session.sync_session)
         self._step = 1
+        self._coalesce = False
+        self._database: Optional[str] = None
+        self._legacy_values: Optional[tuple[Any, ...]] = None
 
     def options(self, *args):
         self._query = self._query.options(*args)
         return self
 
-    def filter(self, *criterion):
+    def for_schema(self, schema: type[ModelSchema]):
+        """Eager load relationships and restrict columns to what the schema exposes."""
+        return self.options(*schema.get_loader_options())
+
+    def using(self, alias: str):
+        """
+        Run the statements of this query set on the database alias, e.g. heavy
+        reports on a replica kept out of the round-robin reads.
+        """
+        self._database = alias
+        return self
+
+    @contextlib.contextmanager
+    def _using(self) -> typing.Iterator[None]:
+        if self._database is None:
+            yield
+            return
+        token = using_database.set(self._database)
+        try:
+            yield
+        finally:
+            using_database.reset(token)
+
+    async def _run(self, fn, *args, **kwargs):
+        with self._using():
+            return await run_query(fn, *args, **kwargs)
+
+    def coalesce(self):
+        """
+        Share the query of a read with identical reads running concurrently: one
+        of them queries in a session of its own, every caller gets the instances
+        merged into its own session. Sessions that have written in their
+        transaction, or hold pending changes, always query on their own.
+        """
+        self._coalesce = True
+        return self
+
+    def _can_coalesce(self) -> bool:
+        if not self._coalesce:
+            return False
+        session = self.session.sync_session
+        if session.info.get('writes'):
+            return False
+        return not (session.new or session.deleted or session.dirty)
+
+    async def _read(self, method: str, query: QuerySet, *args, key_args=None):
+        if self._can_coalesce():
+            key_args = (args if key_args is None else key_args) + (self._database,)
+            key = query.coalesce_key(method, *key_args)
+            if key is not None:
+                with self._using():
+                    # the flight task inherits the database of using()
+                    result = await query_flights.do(
+                        key, lambda: self._fly(method, query, args)
+                    )
+                return await run_query(self._query.adopt, result)
+        return await self._run(getattr(query, method), *args)
+
+    @staticmethod
+    async def _fly(method: str, query: QuerySet, args: tuple[Any, ...]):
+        async with ScopedSession.session_factory() as session:
+            shared = query.with_session(session.sync_session)
+            return await run_query(getattr(shared, method), *args)
+
+    def filter(self, *criterion, **kwargs):
         self._query = self._query.filter(*criterion)
+        if kwargs:
+            self._query = self._query.filter_by(**kwargs)
         return self
 
     def filter_by(self, **kwargs):
@@ -116,57 +545,182 @@ class AsyncQuerySet(Generic[ModelT]):
         return self
 
     async def paginate(
-        self, query: PaginationQuerySchema, must_count: bool = True
+        self,
+        query: PaginationQuerySchema,
+        must_count: bool = True,
+        schema: Optional[type[ModelSchema]] = None,
     ) -> PaginationResult[ModelT]:
-        return await greenlet_spawn(
-            self._query.paginate, query=query, must_count=must_count
+        if schema is not None:
+            self.for_schema(schema)
+        filtered = self._query.filter_query(query)
+        key_args = (query.page, query.page_size, must_count)
+        return await self._read(
+            '_paginate', filtered, query, must_count, key_args=key_args
         )
 
     async def all(self) -> list[ModelT]:
-        return await greenlet_spawn(self._query.all)
+        return await self._read('all', self._query)
 
     async def first(self) -> Optional[ModelT]:
-        return await greenlet_spawn(self._query.first)
+        return await self._read('first', self._query)
 
     async def count(self) -> int:
-        return await greenlet_spawn(self._query.count)
+        return await self._read('count', self._query)
+
+    async def aggregate(self, *expressions):
+        """Evaluate aggregate expressions over the filtered rows, return one row."""
+        return await self._read('one', self._query.aggregate_query(*expressions))
 
     async def get(self, **kwargs) -> ModelT:
         return await self.get_by(**kwargs)
 
     async def get_by(self, **kwargs) -> ModelT:
-        return await greenlet_spawn(self._query.get_by, **kwargs)
-
-    async def create(self, **kwargs) -> ModelT:
-        return await greenlet_spawn(self._query.create, **kwargs)
-
-    async def bulk_create(self, records: list[dict[str, Any]]):
-        return await greenlet_spawn(self._query.bulk_create, records=records)
+        return await self._read('get_by', self._query.filter_by(**kwargs))
+
+    async def create(self, *, _load: typing.Sequence[str] = (), **kwargs) -> ModelT:
+        """
+        Insert a row with a single INSERT ... RETURNING round trip where supported,
+        relationships named in _load are fetched with one follow-up joined query.
+        Models with a custom __init__ or insert events are flushed by the unit of
+        work instead.
+        """
+        return await self._run(self._query.create, _load=_load, **kwargs)
+
+    async def bulk_create(
+        self,
+        records: list[dict[str, Any]],
+        batch_size: Optional[int] = None,
+        returning: bool = False,
+    ):
+        """
+        Insert records with multi-row statements, return the rowcount, or the created
+        instances with returning=True (INSERT ... RETURNING where supported). With
+        returning=True nested one to many children of the records are inserted too,
+        one multi-row statement per relationship for the whole batch.
+        """
+        return await self._run(
+            self._query.bulk_create,
+            records=records,
+            batch_size=batch_size,
+            returning=returning,
+        )
 
     async def update(
         self,
-        values: dict[str, Any],
+        values: dict[Any, Any],
         synchronize_session='auto',
         update_args: Optional[dict[Any, Any]] = None,
-    ) -> int:
-        return await greenlet_spawn(
+        returning: Optional[typing.Sequence[Any]] = None,
+        expected_version: Optional[int] = None,
+    ):
+        """
+        Update matched rows in one statement, values may contain F expressions.
+        Return the rowcount, or the rows of the returning columns (instances when
+        returning is the model) fetched with UPDATE ... RETURNING.
+
+        Versioned models get their version incremented, with expected_version only
+        rows still at that version are updated and Conflict is raised when none is.
+        """
+        return await self._run(
             self._query.update,
             values=values,
             synchronize_session=synchronize_session,
             update_args=update_args,
+            returning=returning,
+            expected_version=expected_version,
         )
 
     async def delete(self) -> int:
-        return await greenlet_spawn(self._query.delete)
+        return await self._run(self._query.delete)
 
-    async def values(self, *columns):
-        return await greenlet_spawn(self._query.values, *columns)
+    def buffered_increment(self, pk: Any, **amounts: int) -> None:
+        """
+        Add to counter columns of a hot row without a write, the deltas are flushed
+        in batches by the write-behind counter buffer, e.g.
+        Choice.objects.buffered_increment(pk, votes=1)
+        """
+        from appboot.counters import counter_buffer
+
+        counter_buffer.add(self.model, pk, amounts)
+
+    async def buffered_values(self, pk: Any, *fields: str) -> dict[str, Any]:
+        """Values of the row fields with the deltas not yet flushed added."""
+        from appboot.counters import counter_buffer
+
+        pk_column = self.model.__mapper__.primary_key[0]
+        row = await self.filter(pk_column == pk).values(*fields).first()
+        if row is None:
+            raise DoesNotExist(f'{self.model.__name__} Not Exist')
+        values = dict(row)
+        for name, amount in counter_buffer.get(self.model, pk).items():
+            if name in values:
+                values[name] += amount
+        return values
+
+    def values(self, *columns):
+        """
+        Return dict like row mappings instead of model instances.
+
+        values() used to run the query, `await qs.values(*columns)` still returns
+        the rows as tuples but is deprecated, await values(...).all() instead.
+        """
+        self._query = self._query.with_row_mode('mappings', *columns)
+        self._legacy_values = columns
+        return self
+
+    def values_list(self, *columns, flat: bool = False):
+        """Return tuple like rows, or single values with flat=True."""
+        if flat and len(columns) != 1:
+            raise TypeError('flat=True is only valid with a single column.')
+        mode: RowMode = 'scalars' if flat else 'rows'
+        self._query = self._query.with_row_mode(mode, *columns)
+        self._legacy_values = None
+        return self
+
+    def as_rows(self):
+        """Return rows of all mapped columns with attribute access, skip ORM hydration."""
+        self._query = self._query.with_row_mode('rows')
+        self._legacy_values = None
+        return self
+
+    def __await__(self):
+        if self._legacy_values is None:
+            raise TypeError(
+                f"object {type(self).__name__} can't be used in 'await' expression"
+            )
+        warnings.warn(
+            'Awaiting values() is deprecated, use await values(...).all()',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        query = self._query.with_row_mode('rows', *self._legacy_values)
+        return self._read('all', query).__await__()
 
     async def one(self):
-        return await greenlet_spawn(self._query.one)
+        return await self._read('one', self._query)
 
     async def _iter(self):
-        return await greenlet_spawn(self._query._iter)
+        return await self._run(self._query._iter)
+
+    async def stream(
+        self, chunk_size: int = 1000, session: Optional[AsyncSession] = None
+    ) -> typing.AsyncGenerator[list[Any], None]:
+        """Yield results in chunks fetched through a server side cursor."""
+        session = session or self.session
+        statement = self._query.statement.execution_options(yield_per=chunk_size)
+        with self._using():
+            result = self._query._convert_result(await session.stream(statement))
+        try:
+            async for partition in result.partitions(chunk_size):
+                yield partition
+        finally:
+            await result.close()
+
+    def to_arrow(self, chunk_size: int = 10000) -> typing.AsyncIterator[Any]:
+        """Yield pyarrow record batches built column wise from chunks of rows."""
+        from appboot.arrow import record_batches
+
+        return record_batches(self, chunk_size)
 
     def __getitem__(self, k):
         """Retrieve an item or slice from the set of results."""
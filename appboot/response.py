@@ -1,9 +1,17 @@
-from typing import Generic, Optional, TypeVar
+import time
+import typing
+from typing import Any, Generic, Optional, TypeVar
 
 from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse
 
 from appboot.exceptions import Error
+from appboot.pagination import PaginationResult
+from appboot.profiling import add_phase_time
 from appboot.schema import Schema
+from appboot.serializer import get_serializer
 
 T = TypeVar('T')
 
@@ -20,3 +28,57 @@ class APIResponse(Schema, Generic[T]):
         if isinstance(e, Error):
             return cls(code=e.code, message=str(e))
         return cls(code=500, message=str(e))
+
+
+class SchemaJSONResponse(JSONResponse):
+    """
+    Render content through the compiled serializer of schema.
+
+    Returning a response instance makes fastapi skip response_model validation, so
+    orm instances are read and encoded in a single pass. Keep response_model on the
+    route for the openapi docs, e.g.
+    SchemaJSONResponse(page, schema=PaginationResult[QuestionSchema])
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        schema: type[BaseModel],
+        many: bool = False,
+        status_code: int = 200,
+        headers: Optional[typing.Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None,
+    ):
+        self.schema = schema
+        self.many = many
+        super().__init__(content, status_code, headers, self.media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        serializer = get_serializer(self.schema)
+        try:
+            if self.many:
+                return serializer.dump_json_many(content)
+            return serializer.dump_json(content)
+        finally:
+            add_phase_time('serialize', start)
+
+
+class PaginationResponse(SchemaJSONResponse):
+    """SchemaJSONResponse for a PaginationResult of schema."""
+
+    def __init__(
+        self,
+        content: PaginationResult,
+        schema: type[BaseModel],
+        status_code: int = 200,
+        headers: Optional[typing.Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None,
+    ):
+        super().__init__(
+            content,
+            PaginationResult[schema],  # type: ignore[valid-type]
+            status_code=status_code,
+            headers=headers,
+            background=background,
+        )
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import time
 import typing
+from functools import lru_cache
 
-from pydantic import Field
+from pydantic import ConfigDict, Field
 from sqlalchemy import inspect
-from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import Mapped, joinedload, load_only, selectinload
+from typing_extensions import Self
 
-from appboot._compat import PydanticModelMetaclass, get_schema_fields
+from appboot._compat import PYDANTIC_V2, PydanticModelMetaclass, get_schema_fields
 from appboot.base import Schema
+from appboot.exceptions import Conflict
 from appboot.models import Model
+from appboot.repository import get_construction_plan
 
 ModelSchemaT = typing.TypeVar('ModelSchemaT', bound='ModelSchema')
 IncEx = typing.Union[
@@ -32,6 +37,35 @@ def _parse_bases_fields(bases):
     return base_fields
 
 
+class _ColumnInfo(typing.NamedTuple):
+    name: str
+    python_type: typing.Any
+    annotation: typing.Any
+    primary_key: bool
+    nullable: bool
+    has_default: bool
+    title: str
+
+
+@lru_cache()
+def _parse_model_columns(model) -> tuple[_ColumnInfo, ...]:
+    """Column walk of a model, shared by every schema declared on it."""
+    mapper = inspect(model)
+    column_annotations = _parse_mapped_annotations(model.__annotations__)
+    return tuple(
+        _ColumnInfo(
+            name=column_property.name,
+            python_type=column_property.type.python_type,
+            annotation=column_annotations.get(column_property.name),
+            primary_key=column_property.primary_key,
+            nullable=bool(column_property.nullable),
+            has_default=bool(column_property.default),
+            title=column_property.doc or column_property.name,
+        )
+        for column_property in mapper.columns
+    )
+
+
 def _parse_field_from_sqlalchemy_model(
     model, include=None, exclude=None, read_only_fields=None
 ):
@@ -39,43 +73,106 @@ def _parse_field_from_sqlalchemy_model(
     __annotations__ = {}
     _exclude = set() if exclude is None else set(exclude)
     _read_only_fields = set() if read_only_fields is None else set(read_only_fields)
-    mapper = inspect(model)
-    column_annotations = _parse_mapped_annotations(model.__annotations__)
-    for column_property in mapper.columns:
+    for column in _parse_model_columns(model):
         extra = {}
-        if include and column_property.name not in include:
+        if include and column.name not in include:
             continue
-        if column_property.name in _exclude:
+        if column.name in _exclude:
             continue
-        if column_property.primary_key or column_property.name in _read_only_fields:
+        if column.primary_key or column.name in _read_only_fields:
             extra['read_only'] = True
         else:
             extra['read_only'] = False
-        if (
-            column_property.primary_key
-            or column_property.nullable
-            or column_property.name in _read_only_fields
-        ):
-            python_type = typing.Optional[column_property.type.python_type]
+        if column.primary_key or column.nullable or column.name in _read_only_fields:
+            python_type = typing.Optional[column.python_type]
             default = None
         else:
-            if column_property.default:
-                python_type = typing.Optional[column_property.type.python_type]
+            if column.has_default:
+                python_type = typing.Optional[column.python_type]
                 default = None
             else:
-                python_type = column_property.type.python_type
+                python_type = column.python_type
                 default = ...
-        __annotations__[column_property.name] = (
-            column_annotations.get(column_property.name) or python_type
-        )
-        __dict__[column_property.name] = Field(
-            default,
-            title=column_property.doc or column_property.name,
-            **extra,
-        )
+        __annotations__[column.name] = column.annotation or python_type
+        __dict__[column.name] = Field(default, title=column.title, **extra)
     return __dict__, __annotations__
 
 
+def _get_nested_model_schema(annotation) -> typing.Optional[type[ModelSchema]]:
+    if typing.get_origin(annotation) is None:
+        if isinstance(annotation, type) and issubclass(annotation, ModelSchema):
+            return annotation
+        return None
+    for arg in typing.get_args(annotation):
+        nested_schema = _get_nested_model_schema(arg)
+        if nested_schema is not None:
+            return nested_schema
+    return None
+
+
+def _parse_loader_options(
+    schema: type[ModelSchema], required_columns=(), parents=frozenset()
+) -> list[typing.Any]:
+    model = schema.Meta.model
+    mapper = inspect(model)
+    fields = get_schema_fields(schema)
+    # nested schemas are usually forward references, resolve them here
+    type_hints = typing.get_type_hints(schema)
+    columns = {key for key in mapper.columns.keys() if key in fields}
+    columns.update(required_columns)
+    options = []
+    for key, rel in mapper.relationships.items():
+        if key not in fields:
+            continue
+        nested_schema = _get_nested_model_schema(type_hints.get(key))
+        if nested_schema is None or nested_schema in parents | {schema}:
+            continue
+        # keys on both sides of the join are needed to match loaded rows
+        columns.update(mapper.get_property_by_column(c).key for c in rel.local_columns)
+        remote_columns = {
+            rel.mapper.get_property_by_column(c).key for c in rel.remote_side
+        }
+        loader = selectinload if rel.uselist else joinedload
+        nested_options = _parse_loader_options(
+            nested_schema, remote_columns, parents | {schema}
+        )
+        options.append(loader(getattr(model, key)).options(*nested_options))
+    if columns:
+        options.insert(0, load_only(*[getattr(model, key) for key in columns]))
+    return options
+
+
+@lru_cache()
+def get_loader_options(schema: type[ModelSchema]) -> tuple[typing.Any, ...]:
+    """
+    Loader options which eagerly load every relationship serialized by the schema,
+    recursing into nested model schemas, and restrict columns to the exposed ones.
+    """
+    return tuple(_parse_loader_options(schema))
+
+
+# seconds spent creating each model schema class, see `manage.py startuptime`
+schema_build_times: dict[str, float] = {}
+
+
+@lru_cache()
+def get_writable_fields(schema: type[ModelSchema]) -> frozenset[str]:
+    include = set()
+    for name, field in get_schema_fields(schema).items():
+        json_schema_extra = field.field_info.json_schema_extra
+        if isinstance(json_schema_extra, dict) and json_schema_extra.get('read_only'):
+            continue
+        include.add(name)
+    return frozenset(include)
+
+
+@lru_cache()
+def get_list_adapter(schema: type[ModelSchema]):
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(list[schema])  # type: ignore[valid-type]
+
+
 class ModelSchemaMetaclass(PydanticModelMetaclass):
     def __new__(
         mcs,
@@ -83,6 +180,20 @@ class ModelSchemaMetaclass(PydanticModelMetaclass):
         bases: tuple[type[typing.Any], ...],
         namespace: dict[str, typing.Any],
         **kwargs: typing.Any,
+    ) -> type:
+        start = time.perf_counter()
+        new_cls = mcs._new_model_schema(cls_name, bases, namespace, **kwargs)
+        name = f'{new_cls.__module__}.{new_cls.__qualname__}'
+        schema_build_times[name] = time.perf_counter() - start
+        return new_cls
+
+    @classmethod
+    def _new_model_schema(
+        mcs,
+        cls_name: str,
+        bases: tuple[type[typing.Any], ...],
+        namespace: dict[str, typing.Any],
+        **kwargs: typing.Any,
     ) -> type:
         meta = namespace.get('Meta')
         if meta is None or cls_name == 'ModelSchema':
@@ -112,31 +223,65 @@ class BaseMeta:
 
 
 class ModelSchema(Schema, metaclass=ModelSchemaMetaclass):
+    if PYDANTIC_V2:
+        # validators are built on first validation or openapi generation
+        model_config = ConfigDict(defer_build=True)
+
     Meta: typing.ClassVar[type[BaseMeta]]
 
+    @classmethod
+    def get_loader_options(cls) -> tuple[typing.Any, ...]:
+        return get_loader_options(cls)
+
     @classmethod
     def construct_schema(cls, **kwargs):
         fields = get_schema_fields(cls)
         return cls.parse_obj({k: v for k, v in kwargs if k in fields})
 
+    @classmethod
+    def get_writable_fields(cls) -> frozenset[str]:
+        return get_writable_fields(cls)
+
+    @classmethod
+    def validate_many(cls, items: typing.Sequence[typing.Any]) -> list[Self]:
+        if PYDANTIC_V2:
+            return get_list_adapter(cls).validate_python(items)
+        return [cls.parse_obj(item) for item in items]
+
     @property
     def validated_data(self):
-        fields = get_schema_fields(self.__class__)
-        include = set()
-        for name, field in fields.items():
-            json_schema_extra = field.field_info.json_schema_extra
-            if json_schema_extra and json_schema_extra.get('read_only'):
-                continue
-            include.add(name)
-        return self.dict(include=include, exclude_unset=True)
-
-    async def create(self, **kwargs):
+        return self.dict(
+            include=get_writable_fields(self.__class__), exclude_unset=True
+        )
+
+    @classmethod
+    async def bulk_create(
+        cls,
+        items: typing.Sequence[typing.Any],
+        batch_size: int = 1000,
+        as_schema: bool = False,
+    ):
+        """Validate items in one pass and insert them with batched multi-row inserts."""
+        records = [schema.validated_data for schema in cls.validate_many(items)]
+        instances = await cls.Meta.model.objects.bulk_create(
+            records, batch_size=batch_size, returning=True
+        )
+        if as_schema:
+            return cls.from_orm_many(instances)
+        return instances
+
+    async def create(self, *, _load: typing.Sequence[str] = (), **kwargs):
         kwargs.update(self.validated_data)
-        instance = await self.Meta.model.objects.create(**kwargs)
+        instance = await self.Meta.model.objects.create(_load=_load, **kwargs)
         return instance
 
     async def update(self, instance: Model, **values):
         values.update(self.validated_data)
+        version_key = get_construction_plan(instance.__class__).version_key
+        if version_key is not None and version_key in values:
+            # the client edited a copy of an older version
+            if values.pop(version_key) != getattr(instance, version_key):
+                raise Conflict(f'{instance.__class__.__name__} was modified meanwhile')
         for name, value in values.items():
             if name in instance.__mapper__.columns and getattr(instance, name) != value:
                 setattr(instance, name, value)
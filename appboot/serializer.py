@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import functools
+import json
+import typing
+from collections.abc import Mapping
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from appboot._compat import PYDANTIC_V2, PydanticUndefined
+
+if PYDANTIC_V2:
+    from pydantic import TypeAdapter
+    from pydantic_core import to_json
+else:
+    from pydantic.json import pydantic_encoder
+
+Converter = Optional[Callable[[Any], Any]]
+FieldPlan = tuple[str, str, Any, Converter]
+# default of the fields with a default_factory, called for every object
+_FACTORY = object()
+
+
+def _unwrap_annotation(annotation) -> tuple[Optional[type[BaseModel]], bool]:
+    """Return the nested model of Optional[Model] / list[Model] and if it is a list."""
+    origin = typing.get_origin(annotation)
+    if origin is None:
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return annotation, False
+        return None, False
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    if origin is typing.Union:
+        if len(args) == 1:
+            return _unwrap_annotation(args[0])
+        return None, False
+    if origin in (list, tuple, set, frozenset, typing.Sequence) and args:
+        nested, many = _unwrap_annotation(args[0])
+        if nested is not None and not many:
+            return nested, True
+    return None, False
+
+
+def _is_plain_annotation(annotation) -> bool:
+    """Whether values of this annotation can be encoded without conversion."""
+    for arg in typing.get_args(annotation) or (annotation,):
+        if isinstance(arg, type) and issubclass(arg, BaseModel):
+            return False
+        if typing.get_args(arg) and not _is_plain_annotation(arg):
+            return False
+    return True
+
+
+def _field_converter(annotation) -> Converter:
+    nested, many = _unwrap_annotation(annotation)
+    if nested is not None:
+        nested_to_python = get_serializer(nested).to_python
+        if many:
+            return lambda value: (
+                None if value is None else [nested_to_python(v) for v in value]
+            )
+        return lambda value: None if value is None else nested_to_python(value)
+    if _is_plain_annotation(annotation):
+        return None
+    adapter = TypeAdapter(annotation)
+    return lambda value: adapter.dump_python(
+        adapter.validate_python(value, from_attributes=True), mode='json'
+    )
+
+
+class SchemaSerializer:
+    """
+    Serialize orm instances, rows or mappings to json through a schema in one pass.
+
+    The field plan is compiled once per schema class: every field is read straight
+    from the source object and the resulting dicts are encoded by pydantic-core,
+    so no intermediate schema instance is validated. Field validators of the
+    schema are therefore not run, the data is trusted to match the schema.
+    """
+
+    def __init__(self, schema: type[BaseModel]):
+        self.schema = schema
+        self._plan: Optional[list[FieldPlan]] = None
+
+    @property
+    def plan(self) -> list[FieldPlan]:
+        if self._plan is None:
+            self._plan = self.compile()
+        return self._plan
+
+    def compile(self) -> list[FieldPlan]:
+        # resolve forward references of nested schemas first
+        self.schema.model_rebuild()
+        plan = []
+        for name, field in self.schema.model_fields.items():
+            if field.default_factory is not None:
+                default = _FACTORY
+            elif field.default is PydanticUndefined:
+                default = None
+            else:
+                default = field.default
+            converter = _field_converter(field.annotation)
+            plan.append((field.alias or name, name, default, converter))
+        return plan
+
+    def to_python(self, obj: Any) -> Any:
+        if isinstance(obj, self.schema):
+            return obj
+        if isinstance(obj, Mapping):
+            get = obj.get
+        else:
+            get = functools.partial(getattr, obj)
+        data: dict[str, Any] = {}
+        for key, name, default, converter in self.plan:
+            value = get(name, default)
+            if value is _FACTORY:
+                value = self._get_default(name, data)
+            data[key] = value if converter is None else converter(value)
+        return data
+
+    def _get_default(self, name: str, data: dict[str, Any]) -> Any:
+        # like validation, a factory taking data sees the fields before it by name
+        validated = {n: data[key] for key, n, _, _ in self.plan if key in data}
+        field = self.schema.model_fields[name]
+        return field.get_default(call_default_factory=True, validated_data=validated)
+
+    def dump_json(self, obj: Any) -> bytes:
+        return to_json(self.to_python(obj))
+
+    def dump_json_many(self, objs: typing.Iterable[Any]) -> bytes:
+        return to_json([self.to_python(obj) for obj in objs])
+
+
+class ValidatingSchemaSerializer(SchemaSerializer):
+    """Fallback for pydantic v1, validate through the schema then encode."""
+
+    def to_python(self, obj: Any) -> Any:
+        if not isinstance(obj, self.schema):
+            obj = self.schema.from_orm(obj)
+        return obj.dict(by_alias=True)
+
+    def dump_json(self, obj: Any) -> bytes:
+        return json.dumps(self.to_python(obj), default=pydantic_encoder).encode()
+
+    def dump_json_many(self, objs: typing.Iterable[Any]) -> bytes:
+        data = [self.to_python(obj) for obj in objs]
+        return json.dumps(data, default=pydantic_encoder).encode()
+
+
+@functools.lru_cache()
+def get_serializer(schema: type[BaseModel]) -> SchemaSerializer:
+    if PYDANTIC_V2:
+        return SchemaSerializer(schema)
+    return ValidatingSchemaSerializer(schema)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import gc
+import importlib.util
+import logging
+import os
+import random
+import signal
+import time
+import typing
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+logger = logging.getLogger('uvicorn.error')
+
+
+def select_loop() -> str:
+    return 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+
+
+def select_http() -> str:
+    return 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+
+class PreforkServer:
+    """
+    Serve an asgi application with forked uvicorn workers.
+
+    The application is imported once in the parent and shared copy-on-write by
+    the workers, which accept connections on the socket bound by the parent.
+    Workers leaving after max_requests are replaced, SIGTERM or SIGINT drains
+    every worker for at most graceful_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        app: str,
+        host: str = '127.0.0.1',
+        port: int = 8000,
+        workers: typing.Optional[int] = None,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: int = 30,
+        **config: typing.Any,
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.config = config
+        self.children: dict[int, int] = {}
+        self.should_exit = False
+
+    def get_options(self) -> dict[str, typing.Any]:
+        """Options of the uvicorn config of a worker."""
+        limit_max_requests = None
+        if self.max_requests:
+            # spread recycling so workers do not restart at the same moment
+            jitter = random.randint(0, self.max_requests_jitter)
+            limit_max_requests = self.max_requests + jitter
+        return dict(
+            self.config,
+            host=self.host,
+            port=self.port,
+            limit_max_requests=limit_max_requests,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+
+    def make_config(self, app: typing.Any) -> uvicorn.Config:
+        return uvicorn.Config(app, **self.get_options())
+
+    def run(self):
+        if not hasattr(os, 'fork'):
+            logger.warning('fork is not available, falling back to uvicorn workers')
+            return uvicorn.run(self.app, workers=self.workers, **self.get_options())
+        app = import_from_string(self.app)
+        sock = self.make_config(app).bind_socket()
+        # keep the preloaded objects out of gc generations, a collection in a
+        # worker would otherwise touch and copy their pages
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self.handle_exit)
+        signal.signal(signal.SIGINT, self.handle_exit)
+        logger.info('Starting %d workers, pid %d', self.workers, os.getpid())
+        try:
+            for _ in range(self.workers):
+                self.spawn(app, sock)
+            while not self.should_exit:
+                self.reap(app, sock)
+                time.sleep(0.5)
+        finally:
+            self.stop()
+            sock.close()
+
+    def spawn(self, app: typing.Any, sock) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = int(time.monotonic())
+            return
+        # worker, engines inherited from the parent are reset by the at fork hook
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            uvicorn.Server(self.make_config(app)).run(sockets=[sock])
+        except BaseException:
+            logger.exception('Worker %d failed', os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def reap(self, app: typing.Any, sock) -> None:
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            started = self.children.pop(pid, None)
+            if started is None or self.should_exit:
+                continue
+            logger.info('Worker %d exited with %d, replacing it', pid, status)
+            if time.monotonic() - started < 1:
+                # crash loop guard
+                time.sleep(1)
+            self.spawn(app, sock)
+
+    def handle_exit(self, sig, frame):
+        self.should_exit = True
+
+    def stop(self):
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.clear()
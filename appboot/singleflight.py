@@ -0,0 +1,106 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+The first caller of a key starts the work in a task of its own, callers arriving
+while it runs await the same task instead of starting it again. The task is
+shielded, a caller going away does not cancel the work of the others.
+
+AsyncQuerySet.coalesce() shares queries this way, CoalescingMiddleware shares
+whole GET responses of the paths it is given.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import typing
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import FastAPI
+from starlette.datastructures import Headers
+
+T = typing.TypeVar('T')
+
+
+class SingleFlight:
+    def __init__(self):
+        self.flights: dict[Hashable, asyncio.Future[Any]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self.flights.get(key)
+        if flight is None or flight.get_loop() is not asyncio.get_running_loop():
+            flight = asyncio.ensure_future(fn())
+            self.flights[key] = flight
+            flight.add_done_callback(lambda f: self._land(key, f))
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future[Any]) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.cancelled():
+            # retrieved, even when every caller went away
+            flight.exception()
+
+
+query_flights = SingleFlight()
+
+VARY_HEADERS = ('authorization', 'cookie', 'accept', 'accept-encoding')
+
+
+class CoalescingMiddleware:
+    """
+    Serve concurrent identical GET requests of the paths prefixed by paths with one
+    run of the application, replaying its response to every caller. Requests differ
+    by path, query string and the vary headers, so callers with other credentials
+    never share a response. Responses are buffered, streams must not be coalesced.
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: typing.Sequence[str] = (),
+        vary: typing.Sequence[str] = VARY_HEADERS,
+    ):
+        self.app = app
+        self.paths = tuple(paths)
+        self.vary = tuple(vary)
+        self.flights = SingleFlight()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or scope['method'] not in ('GET', 'HEAD')
+            or not scope['path'].startswith(self.paths)
+        ):
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        key = (
+            scope['method'],
+            scope['path'],
+            scope['query_string'],
+            tuple(headers.get(name) for name in self.vary),
+        )
+        messages = await self.flights.do(key, lambda: self.record(dict(scope)))
+        for message in messages:
+            await send(message)
+
+    async def record(self, scope) -> list[dict[str, Any]]:
+        messages: list[dict[str, Any]] = []
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # nobody disconnects from a shared run
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        await self.app(scope, receive, send)
+        return messages
+
+
+def fastapi_register_coalescing(app: FastAPI, paths: typing.Sequence[str]) -> None:
+    app.add_middleware(CoalescingMiddleware, paths=paths)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import typing
+from typing import Any, Optional
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+from appboot._compat import PYDANTIC_V2, get_schema_fields
+from appboot.db import transaction
+from appboot.repository import AsyncQuerySet
+from appboot.schema import ModelSchema, Schema
+
+ExportFormat = typing.Literal['ndjson', 'csv']
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _dump_json(obj: Schema) -> str:
+    if PYDANTIC_V2:
+        return obj.model_dump_json()
+    return obj.json()
+
+
+def _dump_csv_row(obj: Schema) -> dict[str, Any]:
+    if PYDANTIC_V2:
+        data = obj.model_dump(mode='json')
+    else:
+        data = json.loads(obj.json())
+    return {
+        k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in data.items()
+    }
+
+
+def _validate(schema: type[Schema], obj: Any) -> Schema:
+    # Schema enables from_attributes for pydantic v2 only, which the plugin misses
+    return schema.from_orm(obj)  # type: ignore[pydantic-orm]
+
+
+class QuerySetStreamer:
+    def __init__(
+        self,
+        queryset: AsyncQuerySet,
+        schema: type[Schema],
+        format: ExportFormat = 'ndjson',
+        chunk_size: int = 1000,
+    ):
+        if format not in MEDIA_TYPES:
+            raise ValueError(f'Unsupported export format {format!r}')
+        if issubclass(schema, ModelSchema) and queryset._query._row_mode is None:
+            # lazy loads can not happen while serializing outside of the greenlet
+            queryset = queryset.for_schema(schema)
+        self.queryset = queryset
+        self.schema = schema
+        self.format = format
+        self.chunk_size = chunk_size
+
+    def serialize_ndjson(self, chunk: list[Any]) -> str:
+        return ''.join(f'{_dump_json(_validate(self.schema, obj))}\n' for obj in chunk)
+
+    def serialize_csv(self, chunk: list[Any], header: bool = False) -> str:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(get_schema_fields(self.schema)))
+        if header:
+            writer.writeheader()
+        writer.writerows(_dump_csv_row(_validate(self.schema, obj)) for obj in chunk)
+        return buffer.getvalue()
+
+    async def __aiter__(self) -> typing.AsyncGenerator[str, None]:
+        if self.format == 'csv':
+            yield self.serialize_csv([], header=True)
+        # runs after the endpoint returned, so it needs a session of its own
+        async with transaction() as session:
+            chunks = self.queryset.stream(self.chunk_size, session=session)
+            try:
+                async for chunk in chunks:
+                    if self.format == 'csv':
+                        yield self.serialize_csv(chunk)
+                    else:
+                        yield self.serialize_ndjson(chunk)
+            finally:
+                await chunks.aclose()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """Close the body iterator, and the cursor behind it, when streaming stops."""
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, 'aclose', None)
+            if aclose is not None:
+                with anyio.CancelScope(shield=True):
+                    await aclose()
+
+
+class StreamingQueryResponse(ClosingStreamingResponse):
+    """
+    Stream a queryset serialized through schema as ndjson or csv.
+
+    Rows are pulled in chunks through a server side cursor and the next chunk is
+    only fetched once the previous one was sent, so memory stays constant. The
+    cursor is closed when the client disconnects.
+    """
+
+    def __init__(
+        self,
+        queryset: AsyncQuerySet,
+        schema: type[Schema],
+        format: ExportFormat = 'ndjson',
+        chunk_size: int = 1000,
+        filename: Optional[str] = None,
+        status_code: int = 200,
+        headers: Optional[typing.Mapping[str, str]] = None,
+    ):
+        headers = dict(headers or {})
+        if filename:
+            headers['content-disposition'] = f'attachment; filename="{filename}"'
+        self.streamer = QuerySetStreamer(queryset, schema, format, chunk_size)
+        super().__init__(
+            self.streamer.__aiter__(),
+            status_code=status_code,
+            headers=headers,
+            media_type=MEDIA_TYPES[format],
+        )
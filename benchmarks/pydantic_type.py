@@ -0,0 +1,80 @@
+"""
+Load throughput of PydanticType and LazyPydanticType json columns.
+
+Usage: python benchmarks/pydantic_type.py [rows]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column  # noqa: E402
+
+from appboot.models import LazyPydanticType, PydanticType  # noqa: E402
+from appboot.schema import Schema  # noqa: E402
+
+
+class Payload(Schema):
+    create_by: int
+    update_by: int
+    tags: list[str]
+    note: str
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class PayloadRow(Base):
+    __abstract__ = True
+    id: Mapped[int] = mapped_column(primary_key=True)
+    payload: Mapped[Payload]
+
+
+class EagerRow(PayloadRow):
+    __tablename__ = 'eager_row'
+    payload: Mapped[Payload] = mapped_column(PydanticType(Payload))
+
+
+class LazyRow(PayloadRow):
+    __tablename__ = 'lazy_row'
+    payload: Mapped[Payload] = mapped_column(LazyPydanticType(Payload))
+
+
+class LazyBytesRow(PayloadRow):
+    __tablename__ = 'lazy_bytes_row'
+    payload: Mapped[Payload] = mapped_column(LazyPydanticType(Payload, 'bytes'))
+
+
+MODELS: tuple[type[PayloadRow], ...] = (EagerRow, LazyRow, LazyBytesRow)
+
+
+def main(rows: int = 100_000):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    payload = Payload(
+        create_by=1, update_by=2, tags=[f'tag{i}' for i in range(50)], note='x' * 64
+    )
+    with Session(engine) as session:
+        for model in MODELS:
+            session.execute(insert(model), [{'payload': payload}] * rows)
+        session.commit()
+    print(f'{rows} rows')
+    for model in MODELS:
+        with Session(engine) as session:
+            start = time.perf_counter()
+            objs = session.scalars(select(model)).all()
+            loaded = time.perf_counter() - start
+            sum(obj.payload.create_by for obj in objs)
+            accessed = time.perf_counter() - start
+        print(
+            f'{model.__name__:>14}: load {rows / loaded:>9.0f} rows/s, '
+            f'load + access {rows / accessed:>9.0f} rows/s'
+        )
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
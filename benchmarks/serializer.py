@@ -0,0 +1,69 @@
+"""
+Compare the default response path with the compiled schema serializer.
+
+Usage: python benchmarks/serializer.py [rows] [rounds]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'examples', 'mysite'))
+os.environ.setdefault('APP_BOOT_SETTINGS_MODULE', 'mysite.settings')
+
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+from polls.models import Choice, Extra, Question  # noqa: E402
+from polls.schema import QuestionSchema  # noqa: E402
+
+from appboot import PaginationResult  # noqa: E402
+from appboot.response import PaginationResponse  # noqa: E402
+
+
+def make_page(rows: int) -> PaginationResult:
+    results = [
+        Question(
+            id=i,
+            question_text=f'question {i}',
+            pub_date=datetime.now(),
+            extra=Extra(create_by=1, update_by=1),
+            choices=[
+                Choice(id=i * 10 + j, question_id=i, choice_text=f'choice {j}', votes=j)
+                for j in range(3)
+            ],
+        )
+        for i in range(rows)
+    ]
+    return PaginationResult(page=1, page_size=rows, count=rows, results=results)
+
+
+def main(rows: int = 100, rounds: int = 500):
+    page = make_page(rows)
+    field = create_model_field(
+        name='response', type_=PaginationResult[QuestionSchema], mode='serialization'
+    )
+    loop = asyncio.new_event_loop()
+
+    def default_path():
+        # response_model validation, serialization, then json encoding
+        content = loop.run_until_complete(
+            serialize_response(field=field, response_content=page, is_coroutine=True)
+        )
+        return json.dumps(content, separators=(',', ':')).encode()
+
+    def compiled_path():
+        return PaginationResponse(page, schema=QuestionSchema).body
+
+    assert json.loads(default_path()) == json.loads(compiled_path())
+    for name, func in (('default', default_path), ('compiled', compiled_path)):
+        seconds = min(timeit.repeat(func, number=rounds, repeat=3)) / rounds
+        print(f'{name:>10}: {seconds * 1000:.3f} ms per {rows} rows page')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,15 +1,18 @@
 # Create your api here.
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, WebSocket
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import joinedload
 from starlette import status
 
 from appboot import PaginationResult, QueryDepends, QuerySchema
+from appboot.channels import broadcast, event_stream_response, websocket_subscribe
 from appboot.db import create_tables
 from chat.schema import Message, MessageSchema, User, UserLogin, UserSchema
 
 router = APIRouter(dependencies=[Depends(create_tables)])
 
+# new messages are pushed to subscribers once committed, no need to poll
+broadcast(Message, 'messages', schema=MessageSchema)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
 
@@ -43,14 +46,19 @@ async def query_users(query: QuerySchema = QueryDepends()):
 
 @router.post('/messages/', response_model=MessageSchema)
 async def create_message(data: MessageSchema, user_id: int = Depends(get_current_user)):
-    msg = await data.create(user_id=user_id)
-    return await msg.refresh(['user'])
+    return await data.create(user_id=user_id, _load=['user'])
 
 
 @router.get('/messages/', response_model=PaginationResult[MessageSchema])
 async def query_messages(query: QuerySchema = QueryDepends()):
-    return (
-        await Message.objects.options(joinedload(Message.user))
-        .filter_query(query)
-        .all()
-    )
+    return await Message.objects.for_schema(MessageSchema).filter_query(query).all()
+
+
+@router.websocket('/ws/messages')
+async def subscribe_messages(websocket: WebSocket):
+    await websocket_subscribe(websocket, 'messages')
+
+
+@router.get('/messages/stream')
+async def stream_messages():
+    return event_stream_response('messages')
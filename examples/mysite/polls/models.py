@@ -22,7 +22,7 @@ class Question(
     choices: Mapped[list['Choice']] = relationship()
 
 
-class Choice(models.TableNameMixin, models.Model):
+class Choice(models.TimestampMixin, models.TableNameMixin, models.Model):
     question_id: Mapped[int] = mapped_column(Integer, ForeignKey('question.id'))
     choice_text: Mapped[str]
     votes: Mapped[int] = mapped_column(default=0)
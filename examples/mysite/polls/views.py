@@ -1,9 +1,12 @@
 # Create your api here.
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import joinedload
+from fastapi import APIRouter, Depends, Request, Response
 
 from appboot import PaginationResult, QueryDepends
+from appboot.conditional import conditional_get
 from appboot.db import create_tables
+from appboot.exceptions import DoesNotExist
+from appboot.expressions import F
+from appboot.response import PaginationResponse
 from polls.models import Choice, Question
 from polls.schema import ChoiceSchema, QuestionQuerySchema, QuestionSchema
 
@@ -12,30 +15,40 @@ router = APIRouter(dependencies=[Depends(create_tables)])
 
 @router.post('/questions/', response_model=QuestionSchema)
 async def create_question(question: QuestionSchema):
-    instance = await question.create()
-    await instance.refresh(['choices'])
-    return instance
+    return await question.create(_load=['choices'])
 
 
 @router.get('/questions/', response_model=PaginationResult[QuestionSchema])
-async def query_questions(query: QuestionQuerySchema = QueryDepends()):
-    return await Question.objects.options(joinedload(Question.choices)).paginate(query)
+async def query_questions(
+    request: Request, response: Response, query: QuestionQuerySchema = QueryDepends()
+):
+    # identical concurrent list requests share their queries
+    fingerprint = await conditional_get(
+        request,
+        response,
+        Question.objects.filter_query(query).coalesce(),
+        related=['choices'],
+    )
+    page = await Question.objects.coalesce().paginate(query, schema=QuestionSchema)
+    return PaginationResponse(page, schema=QuestionSchema, headers=fingerprint.headers)
 
 
 @router.get('/questions/{pk}', response_model=QuestionSchema)
-async def get_question(pk: int):
-    return await Question.objects.options(joinedload(Question.choices)).get(id=pk)
+async def get_question(pk: int, request: Request, response: Response):
+    questions = Question.objects.filter_by(id=pk)
+    await conditional_get(request, response, questions, related=['choices'])
+    return await Question.objects.for_schema(QuestionSchema).get(id=pk)
 
 
 @router.put('/questions/{pk}', response_model=QuestionSchema)
 async def update_question(pk: int, question: QuestionSchema):
-    instance = await Question.objects.options(joinedload(Question.choices)).get(id=pk)
+    instance = await Question.objects.for_schema(QuestionSchema).get(id=pk)
     return await question.update(instance)
 
 
 @router.delete('/questions/{pk}', response_model=QuestionSchema)
 async def delete_question(pk: int):
-    instance = await Question.objects.options(joinedload(Question.choices)).get(id=pk)
+    instance = await Question.objects.for_schema(QuestionSchema).get(id=pk)
     await instance.delete()
     return instance
 
@@ -47,7 +60,9 @@ async def create_choice(choice: ChoiceSchema):
 
 @router.put('/choices/{pk}/vote', response_model=ChoiceSchema)
 async def update_choice(pk: int):
-    instance = await Choice.objects.get(id=pk)
-    instance.votes += 1
-    await instance.save()
-    return instance
+    choices = await Choice.objects.filter(id=pk).update(
+        {'votes': F('votes') + 1}, returning=[Choice]
+    )
+    if not choices:
+        raise DoesNotExist('Choice Not Exist')
+    return choices[0]
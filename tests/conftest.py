@@ -0,0 +1,48 @@
+import contextlib
+import os
+
+os.environ.setdefault('APP_BOOT_SETTINGS_MODULE', 'tests.settings')
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from appboot.db import Base, create_tables, engine_manager  # noqa: E402
+from tests import models  # noqa: E402, F401
+
+
+@pytest.fixture(autouse=True)
+async def database():
+    await create_tables()
+    yield
+    async with engine_manager.master.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine_manager.dispose()
+
+
+@pytest.fixture
+def make_client():
+    def make_client(app):
+        transport = httpx.ASGITransport(app=app)
+        return httpx.AsyncClient(transport=transport, base_url='http://testserver')
+
+    return make_client
+
+
+@pytest.fixture
+def capture_statements():
+    @contextlib.contextmanager
+    def capture_statements():
+        statements: list[str] = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = engine_manager.master.sync_engine
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+    return capture_statements
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from appboot import models
+from appboot.db import Base, ScopedSession
+from appboot.repository import QuerySetProperty
+
+
+class Question(
+    models.DeletedAtMixin, models.TimestampMixin, models.TableNameMixin, models.Model
+):
+    question_text: Mapped[str] = mapped_column(index=True)
+    pub_date: Mapped[datetime] = mapped_column(default=datetime.now)
+    choices: Mapped[list['Choice']] = relationship()
+
+
+class Choice(models.TimestampMixin, models.TableNameMixin, models.Model):
+    question_id: Mapped[int] = mapped_column(ForeignKey('question.id'))
+    choice_text: Mapped[str]
+    votes: Mapped[int] = mapped_column(default=0)
+
+
+class Poll(models.VersionMixin, models.TableNameMixin, models.Model):
+    title: Mapped[str]
+    votes: Mapped[int] = mapped_column(default=0)
+
+
+class Counter(models.TableNameMixin, Base):
+    """A hot row keyed by name instead of id."""
+
+    objects = QuerySetProperty(ScopedSession)
+    name: Mapped[str] = mapped_column(primary_key=True)
+    hits: Mapped[int] = mapped_column(default=0)
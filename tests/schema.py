@@ -0,0 +1,18 @@
+from typing import Optional
+
+from appboot import ModelSchema
+from tests.models import Choice, Question
+
+
+class ChoiceSchema(ModelSchema):
+    class Meta:
+        model = Choice
+        fields = ('id', 'question_id', 'choice_text', 'votes')
+
+
+class QuestionSchema(ModelSchema):
+    choices: Optional[list[ChoiceSchema]] = None
+
+    class Meta:
+        model = Question
+        fields = ('id', 'question_text', 'pub_date')
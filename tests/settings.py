@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+from appboot.conf import DataBases
+
+PROJECT_NAME: str = 'tests'
+DATABASES: DataBases = DataBases(
+    default=dict(
+        url='sqlite+aiosqlite:///'
+        + os.path.join(tempfile.gettempdir(), f'appboot-tests-{os.getpid()}.sqlite3')
+    )
+)
+ROOT_URLCONF: str = 'tests.urls'
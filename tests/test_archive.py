@@ -0,0 +1,78 @@
+import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from appboot import models
+from appboot.archive import archive_deleted, archive_metadata, get_archive_table
+from appboot.db import Base, create_tables, engine_manager, transaction
+from tests.models import Choice, Question
+
+LONG_AGO = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+async def test_archive_skips_referenced_rows():
+    async with transaction():
+        referenced = await Question.objects.create(question_text='referenced')
+        await Question.objects.create(question_text='orphan')
+        await Question.objects.create(question_text='live')
+        await Choice.objects.create(question_id=referenced.id, choice_text='c')
+        await Question.objects.filter(Question.question_text != 'live').update(
+            {'deleted_at': LONG_AGO}
+        )
+    try:
+        moved = [count async for count in archive_deleted(Question, batch_size=1)]
+        archive = get_archive_table(Question)
+        async with engine_manager.master.connect() as conn:
+            texts = (await conn.execute(select(archive.c.question_text))).scalars()
+            assert list(texts) == ['orphan']
+            remaining = select(func.count()).select_from(Question.__table__)
+            assert (await conn.execute(remaining)).scalar() == 2
+        assert moved == [1]
+    finally:
+        async with engine_manager.master.begin() as conn:
+            await conn.run_sync(archive_metadata.drop_all)
+
+
+def test_partial_indexes():
+    class TestBase(DeclarativeBase):
+        pass
+
+    class Plain(models.DeletedAtMixin, TestBase):
+        __tablename__ = 'plain'
+        id: Mapped[int] = mapped_column(primary_key=True)
+
+    class Derived(models.DeletedAtMixin, TestBase):
+        __tablename__ = 'derived'
+        id: Mapped[int] = mapped_column(primary_key=True)
+        email: Mapped[str] = mapped_column(unique=True)
+        name: Mapped[str] = mapped_column(index=True)
+
+    class Declared(models.DeletedAtMixin, TestBase):
+        __tablename__ = 'declared'
+        partial_indexes = (('tenant', 'name'),)
+        id: Mapped[int] = mapped_column(primary_key=True)
+        tenant: Mapped[int] = mapped_column(index=True)
+        name: Mapped[str]
+
+    assert not Plain.__table__.indexes
+    assert {index.name for index in Derived.__table__.indexes} == {
+        'ix_derived_name',
+        'ix_derived_name_live',
+        'ix_derived_email_live',
+    }
+    assert {index.name for index in Declared.__table__.indexes} == {
+        'ix_declared_tenant',
+        'ix_declared_tenant_name_live',
+    }
+
+
+async def test_create_tables_partial_index(capture_statements):
+    async with engine_manager.master.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    with capture_statements() as statements:
+        await create_tables()
+    assert (
+        'CREATE INDEX ix_question_question_text_live ON question (question_text) '
+        'WHERE deleted_at IS NULL'
+    ) in [' '.join(statement.split()) for statement in statements]
@@ -0,0 +1,44 @@
+import pytest
+from fastapi import FastAPI
+
+from appboot.arrow import ARROW_STREAM_MEDIA_TYPE, ArrowStreamResponse, write_parquet
+from appboot.db import transaction
+from tests.models import Question
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture(autouse=True)
+async def questions():
+    async with transaction():
+        await Question.objects.bulk_create(
+            [{'question_text': f'q{i}'} for i in range(5)]
+        )
+
+
+async def test_write_parquet(tmp_path):
+    path = str(tmp_path / 'questions.parquet')
+    async with transaction():
+        count = await write_parquet(
+            Question.objects.values('id', 'question_text'), path, chunk_size=2
+        )
+    table = pq.read_table(path)
+    assert count == 5
+    assert table.column_names == ['id', 'question_text']
+    assert table.column('question_text').to_pylist() == [f'q{i}' for i in range(5)]
+
+
+async def test_arrow_stream_response(make_client):
+    app = FastAPI()
+
+    @app.get('/questions.arrow')
+    async def export():
+        return ArrowStreamResponse(Question.objects.filter_by(deleted_at=None))
+
+    async with make_client(app) as client:
+        response = await client.get('/questions.arrow')
+    assert response.headers['content-type'] == ARROW_STREAM_MEDIA_TYPE
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 5
+    assert table.schema.field('created_at').type.tz == 'UTC'
@@ -0,0 +1,82 @@
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import event
+
+from appboot.asgi import fastapi_register_exception, get_session
+from appboot.batch import fastapi_register_batch
+from appboot.conf import settings
+from appboot.db import engine_manager, transaction
+from tests.models import Question
+from tests.urls import root_router
+
+
+@pytest.fixture
+def app():
+    app = FastAPI(dependencies=[Depends(get_session)])
+    app.include_router(root_router)
+    fastapi_register_batch(app, '/batch')
+    fastapi_register_exception(app)
+    return app
+
+
+@pytest.fixture
+async def questions():
+    async with transaction():
+        return await Question.objects.bulk_create(
+            [{'question_text': f'q{i}'} for i in range(3)], returning=True
+        )
+
+
+async def test_reads_share_one_connection(app, make_client, questions):
+    checkouts = []
+    engine = engine_manager.master.sync_engine
+    listener = lambda *args: checkouts.append(args)  # noqa: E731
+    event.listen(engine, 'checkout', listener)
+    try:
+        async with make_client(app) as client:
+            response = await client.post(
+                '/batch',
+                json={
+                    'requests': [
+                        {'path': f'/questions/{question.id}'} for question in questions
+                    ]
+                },
+            )
+    finally:
+        event.remove(engine, 'checkout', listener)
+    assert response.status_code == 200
+    bodies = [sub['body']['question_text'] for sub in response.json()['responses']]
+    assert bodies == ['q0', 'q1', 'q2']
+    assert len(checkouts) == 1
+
+
+async def test_concurrent_reads_and_ordered_writes(
+    app, make_client, questions, monkeypatch
+):
+    monkeypatch.setattr(settings, 'BATCH_MAX_CONCURRENCY', 4)
+    async with make_client(app) as client:
+        response = await client.post(
+            '/batch',
+            json={
+                'requests': [
+                    {'path': f'/questions/{questions[0].id}'},
+                    {'path': '/fail'},
+                    {
+                        'method': 'POST',
+                        'path': '/questions/',
+                        'body': {'question_text': 'new'},
+                    },
+                    {'path': f'/questions/{questions[-1].id + 1}'},
+                ]
+            },
+        )
+    statuses = [sub['status'] for sub in response.json()['responses']]
+    assert statuses == [200, 400, 200, 200]
+    assert response.json()['responses'][3]['body']['question_text'] == 'new'
+
+
+async def test_limits_batch_size(app, make_client):
+    requests = [{'path': '/fail'}] * (settings.BATCH_MAX_REQUESTS + 1)
+    async with make_client(app) as client:
+        response = await client.post('/batch', json={'requests': requests})
+    assert response.status_code == 400
@@ -0,0 +1,16 @@
+from appboot import bench
+from appboot.db import Base
+
+
+def test_bench_tables_are_kept_apart():
+    assert 'appboot_bench_question' in bench.BenchModel.metadata.tables
+    assert not [name for name in Base.metadata.tables if name.startswith('appboot')]
+
+
+async def test_bench_runner():
+    runner = bench.BenchRunner(requests=5, warmup=1, rows=5, alloc_requests=1)
+    results = await runner.run('memory')
+    assert results
+    for name, result in results.items():
+        assert result['errors'] == 0, name
+        assert result['queries'] > 0, name
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from appboot import ModelSchema
+from appboot.db import transaction
+from tests.models import Choice, Question
+
+
+class ChoiceCreateSchema(ModelSchema):
+    class Meta:
+        model = Choice
+        fields = ('choice_text',)
+
+
+class QuestionSchema(ModelSchema):
+    choices: Optional[list[ChoiceCreateSchema]] = None
+
+    class Meta:
+        model = Question
+        fields = ('id', 'question_text', 'pub_date')
+
+
+def test_writable_fields():
+    assert QuestionSchema.get_writable_fields() == {
+        'question_text',
+        'pub_date',
+        'choices',
+    }
+
+
+async def test_schema_bulk_create():
+    items = [
+        {'id': 100 + i, 'question_text': f'q{i}', 'choices': [{'choice_text': 'a'}]}
+        for i in range(5)
+    ]
+    async with transaction():
+        questions = await QuestionSchema.bulk_create(items, batch_size=2)
+    assert [q.question_text for q in questions] == [f'q{i}' for i in range(5)]
+    # the read only pk is ignored
+    assert all(q.id < 100 for q in questions)
+    async with transaction():
+        assert await Question.objects.count() == 5
+        choices = await Choice.objects.all()
+    assert sorted(c.question_id for c in choices) == sorted(q.id for q in questions)
+
+    async with transaction():
+        schemas = await QuestionSchema.bulk_create(
+            [{'question_text': 'more'}], as_schema=True
+        )
+    assert isinstance(schemas[0], QuestionSchema)
+    assert schemas[0].question_text == 'more'
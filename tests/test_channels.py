@@ -0,0 +1,127 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from appboot import channels
+from appboot.channels import ChannelLayer, MemoryBackend, broadcast, channel_layer
+from appboot.db import created_hooks, retry_on_conflict, transaction
+from appboot.exceptions import Conflict
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+NO_LISTENERS = """
+from sqlalchemy import event
+from appboot import channels
+from appboot.asgi import get_fastapi_application
+from appboot.db import RoutingSession, created_hooks
+get_fastapi_application()
+assert not event.contains(RoutingSession, 'after_commit', channels._publish_broadcast)
+assert not created_hooks
+"""
+
+
+def test_listeners_wait_for_a_broadcast():
+    env = dict(os.environ, APP_BOOT_SETTINGS_MODULE='tests.settings')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', NO_LISTENERS], check=True, env=env, cwd=root)
+
+
+async def test_publish_subscribe():
+    layer = ChannelLayer(MemoryBackend())
+    async with layer.subscribe('a') as first, layer.subscribe('a') as second:
+        async with layer.subscribe('b') as other:
+            await layer.publish('a', {'n': 1})
+            assert await first.__anext__() == {'n': 1}
+            assert await second.__anext__() == {'n': 1}
+            assert other.queue.empty()
+    assert not layer.backend.subscriptions
+
+
+@pytest.mark.parametrize(
+    'overflow, received', [('drop_oldest', [2, 3]), ('drop_newest', [1, 2])]
+)
+async def test_overflow(overflow, received):
+    layer = ChannelLayer(MemoryBackend())
+    async with layer.subscribe('a', maxsize=2, overflow=overflow) as subscription:
+        for n in (1, 2, 3):
+            await layer.publish('a', n)
+        assert [await subscription.__anext__() for _ in range(2)] == received
+        assert subscription.dropped == 1
+
+
+async def test_overflow_disconnect():
+    layer = ChannelLayer(MemoryBackend())
+    async with layer.subscribe('a', maxsize=2, overflow='disconnect') as subscription:
+        for n in (1, 2, 3):
+            await layer.publish('a', n)
+        assert subscription.closed
+        # the slow consumer stops without the messages it had not read
+        assert [message async for message in subscription] == []
+
+
+async def test_broadcast_after_commit():
+    broadcast(Question, 'questions', schema=QuestionSchema)
+    try:
+        async with channel_layer.subscribe('questions') as subscription:
+            with pytest.raises(RuntimeError):
+                async with transaction():
+                    await Question.objects.create(question_text='rolled back')
+                    raise RuntimeError
+            async with transaction():
+                await Question.objects.create(question_text='q')
+                assert subscription.queue.empty()
+            message = await asyncio.wait_for(subscription.__anext__(), 1)
+            assert message['question_text'] == 'q'
+            assert subscription.queue.empty()
+    finally:
+        channels._broadcasts.pop(Question)
+
+
+async def test_broadcast_skips_rolled_back_savepoints():
+    broadcast(Question, 'questions')
+    attempts = []
+
+    async def create():
+        attempts.append(await Question.objects.create(question_text='retried'))
+        if len(attempts) == 1:
+            raise Conflict('stale')
+
+    try:
+        async with channel_layer.subscribe('questions') as subscription:
+            async with transaction() as session:
+                with pytest.raises(RuntimeError):
+                    async with session.begin_nested():
+                        async with session.begin_nested():
+                            await Question.objects.create(question_text='inner')
+                        raise RuntimeError
+                async with session.begin_nested():
+                    await Question.objects.create(question_text='kept')
+                await retry_on_conflict(create)
+            texts = [
+                (await asyncio.wait_for(subscription.__anext__(), 1))['question_text']
+                for _ in range(2)
+            ]
+            assert texts == ['kept', 'retried']
+            await asyncio.sleep(0.01)
+            assert subscription.queue.empty()
+    finally:
+        channels._broadcasts.pop(Question)
+
+
+async def test_partial_flush_notifies_flushed_instances():
+    created = []
+    created_hooks.append(lambda session, instances: created.extend(instances))
+    try:
+        async with transaction() as session:
+            first = Question(question_text='first')
+            second = Question(question_text='second')
+            session.add_all([first, second])
+            await session.flush([first])
+            assert created == [first]
+            await session.flush()
+            assert created == [first, second]
+    finally:
+        created_hooks.pop()
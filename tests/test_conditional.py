@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+from fastapi import FastAPI, Request, Response
+
+from appboot.conditional import conditional_get, get_fingerprint
+from appboot.db import transaction
+from appboot.exceptions import NotSupportedError
+from tests.models import Choice, Question
+from tests.schema import QuestionSchema
+
+LONG_AGO = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+async def create_question() -> Choice:
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+        choice = await Choice.objects.create(question_id=question.id, choice_text='c')
+    async with transaction():
+        # updated_at has a resolution of a second on sqlite
+        await Question.objects.update({'updated_at': LONG_AGO})
+        await Choice.objects.update({'updated_at': LONG_AGO})
+    return choice
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/questions/{pk}', response_model=QuestionSchema)
+    async def get_question(pk: int, request: Request, response: Response):
+        questions = Question.objects.filter_by(id=pk)
+        await conditional_get(request, response, questions, related=['choices'])
+        return await Question.objects.for_schema(QuestionSchema).get(id=pk)
+
+    return app
+
+
+async def test_conditional_get(make_client):
+    choice = await create_question()
+    async with make_client(create_app()) as client:
+        response = await client.get('/questions/1')
+        etag = response.headers['etag']
+        assert response.status_code == 200
+        assert response.headers['last-modified'] == 'Wed, 01 Jan 2020 00:00:00 GMT'
+
+        response = await client.get('/questions/1', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        response = await client.get(
+            '/questions/1',
+            headers={'If-Modified-Since': 'Thu, 02 Jan 2020 00:00:00 GMT'},
+        )
+        assert response.status_code == 304
+
+        # a vote changes the nested choices only
+        async with transaction():
+            await choice.increment('votes')
+        response = await client.get('/questions/1', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json()['choices'][0]['votes'] == 1
+        assert response.headers['etag'] != etag
+
+
+async def test_fingerprint_related_rows():
+    choice = await create_question()
+    async with transaction():
+        questions = Question.objects.filter_by(id=choice.question_id)
+        plain = await get_fingerprint(questions)
+        before = await get_fingerprint(questions, related=['choices'])
+        assert plain.row_count == before.row_count == 1
+        await Choice.objects.create(question_id=choice.question_id, choice_text='d')
+        after = await get_fingerprint(questions, related=['choices'])
+        assert after.etag != before.etag
+        assert (await get_fingerprint(questions)).etag == plain.etag
+
+
+async def test_fingerprint_unknown_relationship():
+    async with transaction():
+        with pytest.raises(NotSupportedError):
+            await get_fingerprint(Question.objects, related=['missing'])
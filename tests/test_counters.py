@@ -0,0 +1,106 @@
+import logging
+
+import pytest
+from sqlalchemy import text, update
+
+from appboot.counters import CounterBuffer, get_counter_fields
+from appboot.db import transaction
+from tests.models import Choice, Counter, Poll, Question
+
+
+@pytest.fixture
+async def buffer():
+    buffer = CounterBuffer(flush_interval=3600)
+    yield buffer
+    for task in (buffer._task, buffer._flush_task):
+        if task is not None:
+            task.cancel()
+
+
+async def create_rows() -> tuple[Choice, Poll]:
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+        choice = await Choice.objects.create(question_id=question.id, choice_text='c')
+        poll = await Poll.objects.create(title='p')
+    return choice, poll
+
+
+def test_counter_fields():
+    assert get_counter_fields(Choice) == {'votes'}
+    # the version column is maintained by the flush
+    assert get_counter_fields(Poll) == {'votes'}
+
+
+@pytest.mark.parametrize('name', ['id', 'question_id', 'choice_text', 'missing'])
+def test_add_rejects_non_counters(name):
+    with pytest.raises(ValueError, match=name):
+        CounterBuffer().add(Choice, 1, {name: 1})
+
+
+async def test_flush(buffer):
+    choice, poll = await create_rows()
+    buffer.add(Choice, choice.id, {'votes': 2})
+    buffer.add(Choice, choice.id, {'votes': 3})
+    buffer.add(Poll, poll.id, {'votes': 1})
+    assert buffer.get(Choice, choice.id) == {'votes': 5}
+    assert await buffer.flush() == 2
+    assert buffer.get(Choice, choice.id) == {}
+    async with transaction():
+        assert (await Choice.objects.get(id=choice.id)).votes == 5
+        poll = await Poll.objects.get(id=poll.id)
+    assert (poll.votes, poll.version) == (1, 2)
+
+
+async def test_failed_flush_keeps_deltas(buffer, monkeypatch):
+    choice, _ = await create_rows()
+    buffer.add(Choice, choice.id, {'votes': 1})
+    get_statements = buffer.get_statements
+    # sqlite reports a missing table as an operational error, worth a retry
+    monkeypatch.setattr(
+        buffer, 'get_statements', lambda *args: [text('UPDATE missing SET x = 1')]
+    )
+    with pytest.raises(Exception, match='no such table'):
+        await buffer.flush()
+    assert buffer.get(Choice, choice.id) == {'votes': 1}
+    monkeypatch.setattr(buffer, 'get_statements', get_statements)
+    assert await buffer.flush() == 1
+
+
+async def test_flush_drops_deltas_which_can_never_apply(buffer, monkeypatch, caplog):
+    choice, poll = await create_rows()
+    buffer.add(Poll, poll.id, {'votes': 1})
+    buffer.add(Choice, choice.id, {'votes': 1})
+    get_statements = buffer.get_statements
+
+    def failing_statements(model, deltas):
+        if model is Choice:
+            # the primary key of the other choice is taken
+            return [update(Choice).values(id=choice.id + 1)]
+        return get_statements(model, deltas)
+
+    async with transaction():
+        await Choice.objects.create(question_id=choice.question_id, choice_text='d')
+    monkeypatch.setattr(buffer, 'get_statements', failing_statements)
+    with caplog.at_level(logging.ERROR, logger='appboot'):
+        with pytest.raises(Exception, match='UNIQUE'):
+            await buffer.flush()
+    assert 'Dropped buffered counters of 1 Choice rows' in caplog.text
+    # the poll delta was rolled back with the transaction and is kept
+    assert buffer.get(Choice, choice.id) == {}
+    assert buffer.get(Poll, poll.id) == {'votes': 1}
+    assert await buffer.flush() == 1
+
+
+async def test_buffered_values_by_primary_key(monkeypatch):
+    buffer = CounterBuffer(flush_interval=3600)
+    monkeypatch.setattr('appboot.counters.counter_buffer', buffer)
+    async with transaction():
+        await Counter.objects.bulk_create([{'name': 'home', 'hits': 2}])
+    Counter.objects.buffered_increment('home', hits=3)
+    assert buffer._task is not None
+    buffer._task.cancel()
+    async with transaction():
+        assert await Counter.objects.buffered_values('home', 'hits') == {'hits': 5}
+    assert await buffer.flush() == 1
+    async with transaction():
+        assert await Counter.objects.buffered_values('home', 'hits') == {'hits': 5}
@@ -0,0 +1,50 @@
+from sqlalchemy import event
+
+from appboot.db import transaction
+from appboot.repository import needs_unit_of_work
+from tests.models import Question
+
+
+async def test_create_is_one_insert_returning(capture_statements):
+    async with transaction():
+        with capture_statements() as statements:
+            question = await Question.objects.create(question_text='q')
+        # server generated columns come back with the insert
+        assert question.id is not None
+        assert question.created_at is not None
+        assert question.updated_at is not None
+    assert len(statements) == 1
+    assert statements[0].startswith('INSERT')
+    assert 'RETURNING' in statements[0]
+
+
+async def test_create_loads_relationships(capture_statements):
+    async with transaction():
+        with capture_statements() as statements:
+            question = await Question.objects.create(
+                question_text='q', _load=['choices']
+            )
+        assert question.choices == []
+    assert len(statements) == 2
+
+
+async def test_create_runs_insert_events():
+    inserted = []
+
+    def before_insert(mapper, connection, target):
+        target.question_text = target.question_text.strip()
+
+    def after_insert(mapper, connection, target):
+        inserted.append(target.id)
+
+    event.listen(Question, 'before_insert', before_insert)
+    event.listen(Question, 'after_insert', after_insert)
+    try:
+        async with transaction():
+            question = await Question.objects.create(question_text=' q ')
+            assert question.question_text == 'q'
+    finally:
+        event.remove(Question, 'before_insert', before_insert)
+        event.remove(Question, 'after_insert', after_insert)
+    assert inserted == [question.id]
+    assert not needs_unit_of_work(Question)
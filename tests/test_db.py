@@ -0,0 +1,26 @@
+import pytest
+
+from appboot.db import ScopedSession, transaction
+from tests.models import Question
+
+
+async def test_nested_transaction_joins_outer():
+    async with transaction() as outer:
+        async with transaction() as inner:
+            assert inner is outer
+            await Question(question_text='q').save()
+        # the inner block did not commit or remove the session
+        assert ScopedSession() is outer
+        assert await Question.objects.count() == 1
+    async with transaction():
+        assert await Question.objects.count() == 1
+
+
+async def test_outer_rollback_discards_nested_work():
+    with pytest.raises(RuntimeError):
+        async with transaction():
+            async with transaction():
+                await Question(question_text='q').save(flush=True)
+            raise RuntimeError
+    async with transaction():
+        assert await Question.objects.count() == 0
@@ -0,0 +1,27 @@
+from sqlalchemy import event
+
+from appboot.db import engine_manager, transaction
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+
+async def test_nested_schema_loads_in_two_queries():
+    async with transaction():
+        for i in range(3):
+            await Question.objects.bulk_create(
+                [{'question_text': f'q{i}', 'choices': [{'choice_text': 'a'}]}],
+                returning=True,
+            )
+    statements = []
+    engine = engine_manager.master.sync_engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        async with transaction():
+            questions = await Question.objects.for_schema(QuestionSchema).all()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    # serialized after the session is gone, nothing is left to lazy load
+    data = [QuestionSchema.model_validate(question) for question in questions]
+    assert [len(question.choices) for question in data] == [1, 1, 1]
+    assert len(statements) == 2
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from appboot.db import transaction
+from appboot.exceptions import DoesNotExist, FilterError
+from appboot.expressions import F
+from tests.models import Choice, Question
+
+
+async def create_choice() -> Choice:
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+        return await Choice.objects.create(question_id=question.id, choice_text='c')
+
+
+async def test_update_returning():
+    choice = await create_choice()
+    async with transaction():
+        rows = await Choice.objects.filter(id=choice.id).update(
+            {'votes': F('votes') * 2 + 3}, returning=('votes',)
+        )
+    assert [row.votes for row in rows] == [3]
+    async with transaction():
+        [updated] = await Choice.objects.filter(id=choice.id).update(
+            {'votes': 10 - F('votes')}, returning=(Choice,)
+        )
+    assert updated.votes == 7
+
+
+async def test_increment():
+    choice = await create_choice()
+
+    async def vote():
+        async with transaction():
+            await choice.increment('votes')
+
+    await asyncio.gather(*[vote() for _ in range(10)])
+    assert choice.votes == 10
+    async with transaction():
+        await choice.increment(votes=5)
+        assert choice.votes == 15
+        assert (await Choice.objects.get(id=choice.id)).votes == 15
+
+
+async def test_increment_missing_row():
+    choice = await create_choice()
+    async with transaction():
+        await Choice.objects.filter(id=choice.id).delete()
+    with pytest.raises(DoesNotExist):
+        async with transaction():
+            await choice.increment('votes')
+
+
+def test_unknown_column():
+    with pytest.raises(FilterError):
+        (F('missing') + 1).resolve(Choice)
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+from sqlalchemy import delete, select
+
+from appboot.db import engine_manager, transaction
+from appboot.fixtures import dump_data, load_data, open_fixture, sort_models
+from tests.models import Choice, Question
+
+MODELS = [Choice, Question]
+
+
+async def get_rows():
+    async with engine_manager.master.connect() as conn:
+        return [
+            (await conn.execute(select(model.__table__).order_by('id'))).all()
+            for model in sort_models(MODELS)
+        ]
+
+
+async def clear():
+    async with engine_manager.master.begin() as conn:
+        for model in reversed(sort_models(MODELS)):
+            await conn.execute(delete(model.__table__))
+
+
+async def test_round_trip(tmp_path):
+    async with transaction():
+        for i in range(3):
+            question = await Question.objects.create(question_text=f'q{i}')
+            for j in range(2):
+                await Choice.objects.create(
+                    question_id=question.id, choice_text=f'c{j}', votes=j
+                )
+        # soft deleted, still referenced by its choices
+        await Question.objects.filter(question_text='q1').delete()
+    rows = await get_rows()
+    assert rows[0][1].deleted_at is not None
+    path = str(tmp_path / 'fixture.ndjson.gz')
+    with open_fixture(path, 'w') as output:
+        assert await dump_data(MODELS, output, chunk_size=2) == 9
+    await clear()
+    with open_fixture(path) as lines:
+        assert await load_data(lines, MODELS, chunk_size=2) == 9
+    assert await get_rows() == rows
+
+
+async def test_unknown_model():
+    lines = io.StringIO('{"model": "tests.Poll", "fields": {"id": 1}}\n')
+    with pytest.raises(ValueError, match="Model 'tests.Poll' doesn't exist."):
+        await load_data(lines, MODELS)
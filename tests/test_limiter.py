@@ -0,0 +1,40 @@
+import asyncio
+
+from appboot.bench import run_overload
+from appboot.limiter import AdaptiveLimit, ConcurrencyLimiter
+
+
+async def test_adaptive_limit_queues_and_sheds():
+    limit = AdaptiveLimit(1, max_limit=1, max_queue=1, queue_timeout=0.05)
+    assert await limit.acquire()
+    queued = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    assert limit.queued == 1
+    # the queue is full
+    assert not await limit.acquire()
+    limit.release(0.01)
+    assert await queued
+    # nobody releases within queue_timeout
+    assert not await limit.acquire()
+    assert limit.rejected == 2
+    assert limit.retry_after() >= 1
+
+
+async def test_adaptive_limit_backs_off_when_congested():
+    limit = AdaptiveLimit(10)
+    assert await limit.acquire()
+    limit.release(0.01, congested=True)
+    assert limit.limit == 9
+
+
+async def test_overload_sheds_with_bounded_latency():
+    """
+    Twice the requests the pool serves: without the limiter the p99 grows to about
+    the duration of the overload, with it requests wait at most queue_timeout.
+    """
+    limiter = ConcurrencyLimiter(limit=8, max_queue=50, queue_timeout=0.5)
+    result = await run_overload(limiter, duration=1)
+    assert result['shed'] > 0
+    assert result['errors'] == 0
+    assert result['served_rps'] > 0
+    assert result['p99_ms'] < 1000
@@ -0,0 +1,25 @@
+from fastapi import Depends, FastAPI
+
+from appboot.asgi import get_session
+from appboot.db import transaction
+from appboot.metrics import fastapi_register_metrics
+from tests.models import Question
+from tests.urls import root_router
+
+
+async def test_metrics(make_client):
+    app = FastAPI(dependencies=[Depends(get_session)])
+    app.include_router(root_router)
+    fastapi_register_metrics(app, '/metrics')
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+    async with make_client(app) as client:
+        assert (await client.get(f'/questions/{question.id}')).status_code == 200
+        text = (await client.get('/metrics')).text
+    assert (
+        'appboot_http_responses_total{method="GET",route="/questions/{pk}",'
+        'status="200"}' in text
+    )
+    assert 'appboot_db_query_duration_seconds_count{alias="default"}' in text
+    assert 'appboot_db_pool_connections{alias="default",state="capacity"} 15' in text
+    assert 'appboot_cache{cache="serializer",stat="hits"}' in text
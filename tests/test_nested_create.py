@@ -0,0 +1,45 @@
+from appboot.db import transaction
+from tests.models import Choice, Question
+
+
+async def test_bulk_create_batches_children(capture_statements):
+    records = [
+        {
+            'question_text': f'q{i}',
+            'choices': [{'choice_text': f'c{i}-{j}'} for j in range(5)],
+        }
+        for i in range(100)
+    ]
+    async with transaction():
+        with capture_statements() as statements:
+            questions = await Question.objects.bulk_create(records, returning=True)
+    # one insert of the questions, one of all their choices
+    assert len(statements) == 2
+    assert [q.question_text for q in questions] == [f'q{i}' for i in range(100)]
+    for i, question in enumerate(questions):
+        assert [c.choice_text for c in question.choices] == [
+            f'c{i}-{j}' for j in range(5)
+        ]
+        assert {c.question_id for c in question.choices} == {question.id}
+    async with transaction():
+        assert await Choice.objects.count() == 500
+
+
+async def test_create_with_children(capture_statements):
+    async with transaction():
+        with capture_statements() as statements:
+            question = await Question.objects.create(
+                question_text='q', choices=[{'choice_text': 'a'}, {'choice_text': 'b'}]
+            )
+        assert [c.choice_text for c in question.choices] == ['a', 'b']
+    assert len(statements) == 2
+
+
+def test_construct_nested():
+    question = Question.construct(
+        id=1, question_text='q', choices=[{'id': 2, 'choice_text': 'a'}]
+    )
+    # primary keys are left to the database
+    assert question.id is None
+    assert question.choices[0].choice_text == 'a'
+    assert question.choices[0].id is None
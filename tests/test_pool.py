@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from appboot.db import EngineManager
+from tests.settings import DATABASES
+
+
+@pytest.fixture
+async def manager():
+    config = dict(DATABASES['default'], pool_size=1, max_overflow=0)
+    manager = EngineManager({'default': config})
+    yield manager
+    await manager.dispose()
+
+
+async def test_pool_waiters(manager):
+    engine = manager.default_engine
+    assert manager.pool_waiters() == 0
+    async with engine.connect():
+        waiter = asyncio.create_task(engine.connect().start())
+        await asyncio.sleep(0.01)
+        assert manager.pool_waiters() == 1
+    await (await waiter).close()
+    assert manager.pool_waiters() == 0
+
+
+async def test_pool_waiters_fallback(manager, monkeypatch):
+    class Queue:
+        """A pool queue without the asyncio internals."""
+
+        maxsize = 1
+
+        def qsize(self):
+            return 0
+
+    engine = manager.default_engine
+    async with engine.connect():
+        with monkeypatch.context() as patch:
+            patch.setattr(engine.sync_engine.pool, '_pool', Queue())
+            # no idle connection and no overflow left
+            assert manager.pool_waiters() == 1
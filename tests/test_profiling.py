@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+from fastapi import Depends, FastAPI
+
+from appboot.asgi import fastapi_register_exception, get_session
+from appboot.db import transaction
+from appboot.profiling import ProfilingMiddleware, sign_profile_token
+from tests.models import Question
+from tests.urls import root_router
+
+UNPATCHED = """
+import fastapi.routing
+from starlette.responses import JSONResponse
+render, serialize_response = JSONResponse.render, fastapi.routing.serialize_response
+from appboot.asgi import get_fastapi_application
+get_fastapi_application().build_middleware_stack()
+assert JSONResponse.render is render
+assert fastapi.routing.serialize_response is serialize_response
+"""
+
+
+def test_hooks_are_not_installed_without_profiling():
+    env = dict(os.environ, APP_BOOT_SETTINGS_MODULE='tests.settings')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', UNPATCHED], check=True, env=env, cwd=root)
+
+
+def create_app(**options) -> FastAPI:
+    app = FastAPI(dependencies=[Depends(get_session)])
+    app.include_router(root_router)
+    app.add_middleware(ProfilingMiddleware, **options)
+    fastapi_register_exception(app)
+    return app
+
+
+async def test_server_timing(make_client):
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+    async with make_client(create_app(enabled=True)) as client:
+        response = await client.get(f'/questions/{question.id}')
+    assert response.status_code == 200
+    timing = response.headers['server-timing']
+    for phase in ('db', 'hydrate', 'validate', 'serialize', 'app', 'total'):
+        assert f'{phase};dur=' in timing
+    # the question and its choices
+    assert 'desc="2 queries"' in timing
+
+
+async def test_signed_requests(make_client):
+    app = create_app(secret='secret')
+    async with make_client(app) as client:
+        response = await client.get('/fail')
+        assert 'server-timing' not in response.headers
+        headers = {'X-Profile': sign_profile_token('other')}
+        response = await client.get('/fail', headers=headers)
+        assert 'server-timing' not in response.headers
+        headers = {'X-Profile': sign_profile_token('secret')}
+        response = await client.get('/fail', headers=headers)
+        assert 'server-timing' in response.headers
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from appboot import models
+from appboot.models import LazyPydanticModel, LazyPydanticType, PydanticType
+from appboot.schema import Schema
+
+
+class Payload(Schema):
+    tags: list[str]
+    note: str = ''
+
+
+def load_payloads(column_type):
+    class Base(DeclarativeBase):
+        pass
+
+    class Row(Base):
+        __tablename__ = 'row'
+        id: Mapped[int] = mapped_column(primary_key=True)
+        payload: Mapped[Payload] = mapped_column(column_type)
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Row(payload=Payload(tags=['a', 'b'])))
+        session.commit()
+    with Session(engine) as session:
+        return session.scalars(select(Row.payload)).all()
+
+
+def test_pydantic_type():
+    assert load_payloads(PydanticType(Payload)) == [Payload(tags=['a', 'b'])]
+
+
+@pytest.mark.parametrize('storage', ['json', 'bytes', 'msgpack'])
+def test_lazy_pydantic_type(storage):
+    if storage == 'msgpack':
+        pytest.importorskip('msgpack')
+    [payload] = load_payloads(LazyPydanticType(Payload, storage))
+    assert isinstance(payload, LazyPydanticModel)
+    assert not payload.is_decoded
+    assert payload.tags == ['a', 'b']
+    assert payload.is_decoded
+    assert payload == Payload(tags=['a', 'b'])
+
+
+def test_msgpack_storage_requires_msgpack(monkeypatch):
+    monkeypatch.setattr(models, 'msgpack', None)
+    with pytest.raises(ImportError, match='msgpack'):
+        LazyPydanticType(Payload, 'msgpack')
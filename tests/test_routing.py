@@ -0,0 +1,147 @@
+import datetime
+import itertools
+
+import pytest
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from appboot.archive import archive_deleted, get_archive_table
+from appboot.db import (
+    Base,
+    ConnectionRouter,
+    RoutingSession,
+    engine_manager,
+    transaction,
+)
+from tests.models import Choice, Question
+
+LONG_AGO = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+async def hot(monkeypatch, tmp_path):
+    # a second database with the tables, Choice is routed to it by its Meta
+    url = f'sqlite+aiosqlite:///{tmp_path / "hot.sqlite3"}'
+    settings = dict(engine_manager.settings, hot={'url': url, 'replica': False})
+    monkeypatch.setattr(engine_manager, 'settings', settings)
+    hot = engine_manager['hot']
+    async with hot.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all, tables=[Question.__table__, Choice.__table__]
+        )
+    monkeypatch.setattr(Choice, 'Meta', type('Meta', (), {'database': 'hot'}), False)
+    return hot
+
+
+async def count_rows(engine, model) -> int:
+    async with engine.connect() as conn:
+        return len((await conn.execute(select(model.__table__))).all())
+
+
+@pytest.fixture
+async def replica(monkeypatch):
+    # a database without tables, statements routed to it fail
+    replica = create_async_engine('sqlite+aiosqlite://')
+    settings = dict(engine_manager.settings, replica={'url': 'sqlite+aiosqlite://'})
+    monkeypatch.setattr(engine_manager, 'settings', settings)
+    monkeypatch.setattr(engine_manager, 'slave_router', itertools.repeat(replica))
+    engine_manager['replica'] = replica
+    yield replica
+    await replica.dispose()
+
+
+async def test_get_bind(replica):
+    master = engine_manager.master.sync_engine
+    session = RoutingSession()
+    assert session.get_bind(clause=select(Question)) is replica.sync_engine
+    for statement in (insert(Question), update(Question), delete(Question)):
+        assert session.get_bind(clause=statement) is master
+    # reads of the transaction now see its writes
+    assert session.get_bind(clause=select(Question)) is master
+
+
+async def test_dml_on_master(replica):
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+    async with transaction():
+        # executed without a flush, still a write
+        await Question.objects.filter(id=question.id).update({'question_text': 'a'})
+        assert (await Question.objects.get(id=question.id)).question_text == 'a'
+    async with transaction():
+        await Question.objects.bulk_create([{'question_text': 'b'}])
+    async with transaction():
+        assert await Question.objects.filter(question_text='b').delete() == 1
+    async with transaction():
+        with pytest.raises(OperationalError, match='no such table'):
+            await Question.objects.count()
+
+
+async def test_using(replica):
+    async with transaction():
+        with pytest.raises(OperationalError, match='no such table'):
+            await Question.objects.using('replica').update({'question_text': 'a'})
+
+
+async def test_router(replica, monkeypatch):
+    class Router:
+        def db_for_write(self, model, **hints):
+            return 'replica' if model is Choice else None
+
+    monkeypatch.setattr('appboot.db.router', ConnectionRouter([Router()]))
+    session = RoutingSession()
+    assert session.get_bind(Choice.__mapper__, update(Choice)) is replica.sync_engine
+    assert session.get_bind(Question.__mapper__, update(Question)) is (
+        engine_manager.master.sync_engine
+    )
+
+
+async def test_meta_database(hot):
+    master = engine_manager.master.sync_engine
+    session = RoutingSession()
+    assert session.get_bind(Choice.__mapper__, select(Choice)) is hot.sync_engine
+    assert session.get_bind(Choice.__mapper__, update(Choice)) is hot.sync_engine
+    assert session.get_bind(Question.__mapper__, update(Question)) is master
+
+
+async def test_router_for_reads(hot, monkeypatch):
+    class Router:
+        def db_for_read(self, model, **hints):
+            return 'hot' if model is Question else None
+
+    monkeypatch.setattr('appboot.db.router', ConnectionRouter([Router()]))
+    session = RoutingSession()
+    assert session.get_bind(Question.__mapper__, select(Question)) is hot.sync_engine
+    # writes of the model keep the default routing
+    assert session.get_bind(Question.__mapper__, update(Question)) is (
+        engine_manager.master.sync_engine
+    )
+
+
+async def test_transaction_over_two_databases(hot):
+    async with transaction():
+        question = await Question.objects.create(question_text='q')
+        await Choice.objects.create(question_id=question.id, choice_text='c')
+        await Choice.objects.filter(question_id=question.id).update({'votes': 1})
+        assert (await Choice.objects.get(question_id=question.id)).votes == 1
+    with pytest.raises(RuntimeError):
+        async with transaction():
+            await Question.objects.create(question_text='rolled back')
+            await Choice.objects.create(question_id=question.id, choice_text='r')
+            raise RuntimeError
+    assert await count_rows(engine_manager.master, Question) == 1
+    assert await count_rows(engine_manager.master, Choice) == 0
+    assert await count_rows(hot, Question) == 0
+    assert await count_rows(hot, Choice) == 1
+
+
+async def test_archive_on_the_model_database(hot, monkeypatch):
+    monkeypatch.setattr(Question, 'Meta', type('Meta', (), {'database': 'hot'}), False)
+    async with transaction():
+        await Question.objects.create(question_text='q', deleted_at=LONG_AGO)
+    assert await count_rows(hot, Question) == 1
+    assert [count async for count in archive_deleted(Question)] == [1]
+    assert await count_rows(hot, Question) == 0
+    async with hot.connect() as conn:
+        archived = select(get_archive_table(Question).c.question_text)
+        assert (await conn.execute(archived)).scalars().all() == ['q']
@@ -0,0 +1,54 @@
+import pytest
+
+from appboot.db import transaction
+from appboot.params import PaginationQuerySchema
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+
+@pytest.fixture(autouse=True)
+async def questions():
+    async with transaction():
+        await Question.objects.bulk_create(
+            [{'question_text': f'q{i}'} for i in range(3)]
+        )
+
+
+async def test_values_returns_mappings():
+    async with transaction():
+        rows = (
+            await Question.objects.filter_by(id=1).values('id', 'question_text').all()
+        )
+    assert [dict(row) for row in rows] == [{'id': 1, 'question_text': 'q0'}]
+
+
+async def test_values_list_and_as_rows():
+    async with transaction():
+        texts = await Question.objects.values_list('question_text', flat=True).all()
+        rows = await Question.objects.values_list('id', 'question_text').all()
+        row = await Question.objects.filter_by(id=2).as_rows().first()
+    assert texts == ['q0', 'q1', 'q2']
+    assert [tuple(row) for row in rows] == [(1, 'q0'), (2, 'q1'), (3, 'q2')]
+    assert (row.id, row.question_text) == (2, 'q1')
+
+
+async def test_rows_paginate_and_validate():
+    query = PaginationQuerySchema(page=1, page_size=2)
+    async with transaction():
+        page = await Question.objects.as_rows().paginate(query)
+    assert page.count == 3
+    schemas = [QuestionSchema.model_validate(row) for row in page.results]
+    assert [schema.question_text for schema in schemas] == ['q0', 'q1']
+
+
+async def test_awaiting_values_is_deprecated():
+    async with transaction():
+        with pytest.warns(DeprecationWarning):
+            rows = await Question.objects.values('id')
+    assert [tuple(row) for row in rows] == [(1,), (2,), (3,)]
+
+
+async def test_awaiting_query_set_fails():
+    with pytest.raises(TypeError):
+        async with transaction():
+            await Question.objects.filter_by(id=1)
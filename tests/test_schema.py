@@ -0,0 +1,32 @@
+from sqlalchemy import ForeignKey, inspect
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+
+from appboot.schema import ModelSchema
+
+
+def test_schema_class_creation_is_cheap():
+    class Base(DeclarativeBase):
+        pass
+
+    class Parent(Base):
+        __tablename__ = 'parent'
+        id: Mapped[int] = mapped_column(primary_key=True)
+        name: Mapped[str]
+        children = relationship('Child')
+
+    class Child(Base):
+        __tablename__ = 'child'
+        id: Mapped[int] = mapped_column(primary_key=True)
+        parent_id: Mapped[int] = mapped_column(ForeignKey('parent.id'))
+
+    class ParentSchema(ModelSchema):
+        class Meta:
+            model = Parent
+
+    # fields come from the table columns, mappers are not configured yet
+    assert list(ParentSchema.model_fields) == ['id', 'name']
+    assert not inspect(Parent).configured
+    # validators are built on first use
+    assert not ParentSchema.__pydantic_complete__
+    assert ParentSchema(name='p').name == 'p'
+    assert ParentSchema.__pydantic_complete__
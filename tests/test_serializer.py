@@ -0,0 +1,84 @@
+import json
+
+from fastapi import FastAPI
+from pydantic import Field
+
+from appboot import ModelSchema
+from appboot.db import transaction
+from appboot.pagination import PaginationResult
+from appboot.params import PaginationQuerySchema
+from appboot.response import PaginationResponse, SchemaJSONResponse
+from appboot.serializer import get_serializer
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+
+async def create_questions():
+    async with transaction():
+        return await Question.objects.bulk_create(
+            [
+                {'question_text': f'q{i}', 'choices': [{'choice_text': f'c{i}'}]}
+                for i in range(3)
+            ],
+            returning=True,
+        )
+
+
+async def test_serializer_matches_schema_dump():
+    questions = await create_questions()
+    serializer = get_serializer(QuestionSchema)
+    for question in questions:
+        expected = QuestionSchema.model_validate(question).model_dump_json()
+        assert json.loads(serializer.dump_json(question)) == json.loads(expected)
+    row = {'id': 7, 'question_text': 'row', 'pub_date': questions[0].pub_date}
+    assert json.loads(serializer.dump_json(row))['choices'] is None
+
+
+class TaggedQuestionSchema(ModelSchema):
+    tags: list[str] = Field(default_factory=lambda: ['new'])
+    title: str = Field(default_factory=lambda data: data['question_text'].title())
+
+    class Meta:
+        model = Question
+        fields = ('id', 'question_text')
+
+
+async def test_serializer_default_factory():
+    questions = await create_questions()
+    serializer = get_serializer(TaggedQuestionSchema)
+    expected = TaggedQuestionSchema.model_validate(questions[0]).model_dump(mode='json')
+    assert expected['tags'] == ['new'] and expected['title'] == 'Q0'
+    assert json.loads(serializer.dump_json(questions[0])) == expected
+    first, second = (
+        serializer.to_python(questions[0]),
+        serializer.to_python(questions[1]),
+    )
+    assert first['tags'] is not second['tags']
+
+
+async def test_schema_responses(make_client):
+    await create_questions()
+    app = FastAPI()
+
+    @app.get('/questions/')
+    async def questions():
+        query = PaginationQuerySchema(page=1, page_size=2)
+        page = await Question.objects.paginate(query, schema=QuestionSchema)
+        return PaginationResponse(page, schema=QuestionSchema)
+
+    @app.get('/questions/{pk}', response_model=QuestionSchema)
+    async def question(pk: int):
+        instance = await Question.objects.for_schema(QuestionSchema).get(id=pk)
+        return SchemaJSONResponse(instance, schema=QuestionSchema)
+
+    async with make_client(app) as client:
+        async with transaction():
+            page = (await client.get('/questions/')).json()
+            detail = (await client.get('/questions/2')).json()
+    assert page['count'] == 3
+    assert [item['choices'][0]['choice_text'] for item in page['results']] == [
+        'c0',
+        'c1',
+    ]
+    assert detail['question_text'] == 'q1'
+    assert PaginationResult[QuestionSchema].model_validate(page).count == 3
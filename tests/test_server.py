@@ -0,0 +1,27 @@
+from appboot.server import PreforkServer
+
+
+def test_make_config():
+    server = PreforkServer(
+        'tests.urls:root_router',
+        workers=2,
+        max_requests=100,
+        max_requests_jitter=10,
+        graceful_timeout=5,
+    )
+    config = server.make_config(object())
+    assert config.timeout_graceful_shutdown == 5
+    assert 100 <= config.limit_max_requests <= 110
+    assert PreforkServer('app').make_config(object()).limit_max_requests is None
+
+
+def test_run_without_fork(monkeypatch):
+    calls = []
+    monkeypatch.delattr('os.fork')
+    monkeypatch.setattr('uvicorn.run', lambda app, **options: calls.append(options))
+    PreforkServer('app', host='0.0.0.0', port=9000, workers=2, max_requests=100).run()
+    [options] = calls
+    assert options['host'] == '0.0.0.0' and options['port'] == 9000
+    assert options['workers'] == 2
+    assert options['limit_max_requests'] == 100
+    assert options['timeout_graceful_shutdown'] == 30
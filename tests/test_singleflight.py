@@ -0,0 +1,66 @@
+import asyncio
+
+from fastapi import FastAPI
+
+from appboot.db import transaction
+from appboot.singleflight import SingleFlight, fastapi_register_coalescing
+from tests.models import Question
+
+
+async def test_single_flight():
+    flights = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    callers = [asyncio.ensure_future(flights.do('key', work)) for _ in range(5)]
+    await asyncio.sleep(0)
+    # a caller going away does not cancel the shared work
+    callers.pop().cancel()
+    assert await asyncio.gather(*callers) == [1, 1, 1, 1]
+    assert not flights.flights
+    assert await flights.do('key', work) == 2
+
+
+async def test_coalesced_queries(capture_statements):
+    async with transaction():
+        await Question.objects.create(question_text='q')
+
+    async def read():
+        async with transaction():
+            questions = await Question.objects.coalesce().all()
+            return questions[0]
+
+    with capture_statements() as statements:
+        questions = await asyncio.gather(*[read() for _ in range(5)])
+    assert len(statements) == 1
+    # merged into the session of every caller
+    assert len({id(question) for question in questions}) == 5
+    assert {question.question_text for question in questions} == {'q'}
+
+
+async def test_coalescing_middleware(make_client):
+    app = FastAPI()
+    runs = 0
+
+    @app.get('/slow')
+    async def slow():
+        nonlocal runs
+        runs += 1
+        run = runs
+        await asyncio.sleep(0.05)
+        return {'run': run}
+
+    fastapi_register_coalescing(app, ['/slow'])
+    async with make_client(app) as client:
+        responses = await asyncio.gather(
+            *[client.get('/slow') for _ in range(5)],
+            client.get('/slow', headers={'Authorization': 'other'}),
+        )
+    assert runs == 2
+    assert len({response.json()['run'] for response in responses[:5]}) == 1
+    assert responses[5].json() != responses[0].json()
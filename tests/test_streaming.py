@@ -0,0 +1,46 @@
+import json
+
+from fastapi import FastAPI
+
+from appboot.db import transaction
+from appboot.streaming import ExportFormat, StreamingQueryResponse
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+
+def get_app():
+    app = FastAPI()
+
+    @app.get('/export')
+    async def export(format: ExportFormat = 'ndjson'):
+        return StreamingQueryResponse(
+            Question.objects.filter(Question.id > 1),
+            QuestionSchema,
+            format=format,
+            chunk_size=2,
+            filename=f'questions.{format}',
+        )
+
+    return app
+
+
+async def test_stream_ndjson_and_csv(make_client):
+    async with transaction():
+        await Question.objects.bulk_create(
+            [
+                {'question_text': f'q{i}', 'choices': [{'choice_text': 'a'}]}
+                for i in range(5)
+            ],
+            returning=True,
+        )
+    async with make_client(get_app()) as client:
+        ndjson = await client.get('/export')
+        csv = await client.get('/export', params={'format': 'csv'})
+    assert ndjson.headers['content-type'] == 'application/x-ndjson'
+    assert 'questions.ndjson' in ndjson.headers['content-disposition']
+    rows = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [row['question_text'] for row in rows] == ['q1', 'q2', 'q3', 'q4']
+    assert rows[0]['choices'][0]['choice_text'] == 'a'
+    lines = csv.text.splitlines()
+    assert lines[0] == 'question_text,pub_date,id,choices'
+    assert len(lines) == 5
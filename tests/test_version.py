@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from appboot import ModelSchema
+from appboot.db import retry_on_conflict, transaction
+from appboot.exceptions import Conflict
+from appboot.expressions import F
+from tests.models import Poll
+
+
+class PollSchema(ModelSchema):
+    class Meta:
+        model = Poll
+        fields = ('id', 'title', 'version')
+
+
+async def create_poll() -> Poll:
+    async with transaction():
+        return await Poll.objects.create(title='poll')
+
+
+async def bump(pk: int):
+    """Change the poll in a transaction of another task."""
+
+    async def run():
+        async with transaction():
+            await Poll.objects.filter(id=pk).update({'votes': F('votes') + 1})
+
+    await asyncio.create_task(run())
+
+
+async def test_save_increments_version():
+    poll = await create_poll()
+    assert poll.version == 1
+    async with transaction():
+        poll = await Poll.objects.get(id=poll.id)
+        poll.title = 'renamed'
+        await poll.save(flush=True)
+        assert poll.version == 2
+
+
+async def test_stale_save_conflicts():
+    pk = (await create_poll()).id
+    with pytest.raises(Conflict):
+        async with transaction():
+            poll = await Poll.objects.get(id=pk)
+            await bump(pk)
+            poll.title = 'lost update'
+            await poll.save()
+    async with transaction():
+        poll = await Poll.objects.get(id=pk)
+    assert (poll.title, poll.votes, poll.version) == ('poll', 1, 2)
+
+
+async def test_queryset_update_expected_version():
+    poll = await create_poll()
+    async with transaction():
+        await Poll.objects.filter(id=poll.id).update({'title': 'a'}, expected_version=1)
+        with pytest.raises(Conflict):
+            await Poll.objects.filter(id=poll.id).update(
+                {'title': 'b'}, expected_version=1
+            )
+        assert (await Poll.objects.get(id=poll.id)).version == 2
+
+
+async def test_schema_update_rejects_stale_version():
+    poll = await create_poll()
+    async with transaction():
+        instance = await Poll.objects.get(id=poll.id)
+        await PollSchema(title='a', version=1).update(instance)
+        await instance.save(flush=True)
+        with pytest.raises(Conflict):
+            await PollSchema(title='b', version=1).update(instance)
+
+
+async def test_retry_on_conflict():
+    poll = await create_poll()
+    attempts = 0
+
+    async def rename():
+        nonlocal attempts
+        attempts += 1
+        instance = await Poll.objects.get(id=poll.id)
+        if attempts == 1:
+            # a writer the session does not know of, sqlite would lock another one
+            await Poll.objects.filter(id=poll.id).update(
+                {'votes': F('votes') + 1}, synchronize_session=False
+            )
+        instance.title = f'attempt {attempts}'
+        await instance.save()
+        return instance
+
+    async with transaction():
+        renamed = await retry_on_conflict(rename)
+    assert attempts == 2
+    # the savepoint of the failed attempt was rolled back
+    assert (renamed.title, renamed.votes, renamed.version) == ('attempt 2', 0, 2)
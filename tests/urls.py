@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+
+from appboot.exceptions import DoesNotExist
+from tests.models import Question
+from tests.schema import QuestionSchema
+
+root_router = APIRouter()
+
+
+@root_router.get('/questions/{pk}', response_model=QuestionSchema)
+async def get_question(pk: int):
+    return await Question.objects.for_schema(QuestionSchema).get(id=pk)
+
+
+@root_router.post('/questions/', response_model=QuestionSchema)
+async def create_question(question: QuestionSchema):
+    return await question.create(_load=['choices'])
+
+
+@root_router.get('/fail')
+async def fail():
+    raise DoesNotExist('Nothing here')